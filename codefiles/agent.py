@@ -0,0 +1,153 @@
+import os
+
+import tracing
+from streaming import stream_to_stdout
+from token_budget import count_request, trim_to_budget
+from tool_executor import ToolExecutor
+from tool_results import tool_message
+
+MAX_ROUNDS = int(os.getenv('AGENT_MAX_ROUNDS', 5))
+CONTEXT_BUDGET = int(os.getenv('AGENT_CONTEXT_BUDGET', 4000))
+KEEP_TOOL_RESULTS = int(os.getenv('AGENT_KEEP_TOOL_RESULTS', 2))
+SUMMARY_CHARS = int(os.getenv('AGENT_SUMMARY_CHARS', 160))
+
+
+def as_dict(message):
+    """Plain-dict copy of an assistant message, keeping only the fields the API reads back."""
+    if isinstance(message, dict):
+        message = dict(message)
+    else:
+        message = message.model_dump(include={'role', 'content', 'tool_calls'}, exclude_none=True)
+        message.setdefault('content', None)
+    if message.get('tool_calls'):
+        message['tool_calls'] = [{'id': call['id'], 'type': 'function',
+                                  'function': {'name': call['function']['name'],
+                                               'arguments': call['function']['arguments']}}
+                                 for call in message['tool_calls']]
+    else:
+        message.pop('tool_calls', None)
+    return message
+
+
+def dedupe_system(messages):
+    """Drop system messages whose content already appeared earlier in the conversation."""
+    seen = set()
+    result = []
+    for message in messages:
+        if message.get('role') == 'system':
+            if message.get('content') in seen:
+                continue
+            seen.add(message.get('content'))
+        result.append(message)
+    return result
+
+
+def summarize_tool_results(messages, keep=KEEP_TOOL_RESULTS, max_chars=SUMMARY_CHARS):
+    """Shorten every tool result except the newest `keep` ones to a `max_chars` excerpt.
+
+    Tool messages are shortened rather than removed because the API rejects an assistant tool call without
+    an answer for each of its ids.
+    """
+    tool_indexes = [i for i, message in enumerate(messages) if message.get('role') == 'tool']
+    old = set(tool_indexes[:-keep] if keep else tool_indexes)
+    result = []
+    for i, message in enumerate(messages):
+        content = message.get('content') or ''
+        if i in old and len(content) > max_chars:
+            message = dict(message, content=f'{content[:max_chars]}... [{len(content) - max_chars} chars omitted]')
+        result.append(message)
+    return result
+
+
+def compact_history(model, messages, tools=None, budget=CONTEXT_BUDGET, keep_tool_results=KEEP_TOOL_RESULTS,
+                    summary_chars=SUMMARY_CHARS):
+    """Return a copy of `messages` whose prompt (messages plus tools) fits in `budget` tokens.
+
+    Repeated system prompts are removed and old tool outputs shortened first; if the prompt is still too large,
+    the oldest turns are dropped with token_budget.trim_to_budget. The latest user message is never dropped, and
+    when the exchange it starts does not fit on its own, its newest tool outputs are shortened too.
+    """
+    messages = summarize_tool_results(dedupe_system(messages), keep_tool_results, summary_chars)
+    if count_request(model, messages, tools) <= budget:
+        return messages
+
+    latest = max((i for i, message in enumerate(messages) if message.get('role') == 'user'), default=None)
+    if latest is None:
+        return trim_to_budget(model, messages, tools, max_completion_tokens=0, context_window=budget)
+    current = [message for i, message in enumerate(messages) if i >= latest or message.get('role') == 'system']
+    if count_request(model, current, tools) > budget:
+        # Dropping older history cannot make room here, so shorten the tool outputs this answer depends on
+        messages = summarize_tool_results(messages, 0, summary_chars)
+    return trim_to_budget(model, messages, tools, max_completion_tokens=0, context_window=budget, keep=(latest,))
+
+
+class Agent:
+    """A multi-turn tool-calling loop over a ToolRegistry.
+
+    Each ask() appends the user message and runs up to `max_rounds` rounds of completion -> tool calls. All tool
+    calls of a round run concurrently. History is compacted before every request so prompt size stays under
+    `budget` no matter how long the session runs. When the round cap is reached the model is asked to answer
+    with tool_choice='none'.
+    """
+
+    def __init__(self, client, model, tools, system_prompt=None, max_rounds=MAX_ROUNDS, budget=CONTEXT_BUDGET,
+                 keep_tool_results=KEEP_TOOL_RESULTS, stream=False, message_builder=tool_message):
+        self.client = client
+        self.model = model
+        self.tools = tools
+        self.max_rounds = max_rounds
+        self.budget = budget
+        self.keep_tool_results = keep_tool_results
+        self.stream = stream
+        self.message_builder = message_builder
+        self.messages = [{'role': 'system', 'content': system_prompt}] if system_prompt else []
+        self.prompt_tokens = []
+
+    def _compact(self):
+        self.messages = compact_history(self.model, self.messages, self.tools.definitions(), self.budget,
+                                        self.keep_tool_results)
+        self.prompt_tokens.append(count_request(self.model, self.messages, self.tools.definitions()))
+        tracing.annotate(prompt_tokens_estimate=self.prompt_tokens[-1])
+
+    def _complete(self, **kwargs):
+        self._compact()
+        if self.stream:
+            # Content is printed as it arrives; tool-call rounds stream nothing but arguments
+            stream = stream_to_stdout(self.client, model=self.model, messages=self.messages,
+                                      tools=self.tools.definitions(), **kwargs)
+            return as_dict(stream.message())
+        response = self.client.chat.completions.create(model=self.model, messages=self.messages,
+                                                       tools=self.tools.definitions(), **kwargs)
+        return as_dict(response.choices[0].message)
+
+    def ask(self, user_query, first_message=None):
+        """Answer `user_query` in the running session and return the final answer text.
+
+        `first_message` replaces the first completion, e.g. a tool call replayed from a semantic cache.
+        """
+        from openai.types.chat import ChatCompletionMessageToolCall
+
+        self.messages.append({'role': 'user', 'content': user_query})
+        with ToolExecutor(self.tools, message_builder=self.message_builder) as executor:
+            for round_number in range(self.max_rounds):
+                with tracing.span('agent_round', round=round_number):
+                    if round_number == 0 and first_message is not None:
+                        assistant = as_dict(first_message)
+                    else:
+                        assistant = self._complete()
+                    self.messages.append(assistant)
+                    if not assistant.get('tool_calls'):
+                        return assistant.get('content')
+
+                    tool_calls = [ChatCompletionMessageToolCall.model_validate(call)
+                                  for call in assistant['tool_calls']]
+                    tool_messages, results = executor.run_messages(tool_calls)
+                    for result in results:
+                        print('Tool:', result.name, result.arguments, f'{result.wall_time:.3f}s', result.error or '')
+                    self.messages.extend(tool_messages)
+
+        with tracing.span('agent_round', round=self.max_rounds, final=True):
+            print(f'Reached {self.max_rounds} tool rounds; asking for a final answer.')
+            assistant = self._complete(tool_choice='none')
+            self.messages.append(assistant)
+            return assistant.get('content')
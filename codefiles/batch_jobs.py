@@ -0,0 +1,306 @@
+"""Run bulk chat completions through the Batch API instead of synchronous requests.
+
+Batch jobs cost less and do not use the deployment's RPM/TPM quota, at the price of answers arriving within
+the completion window instead of seconds. Use this for offline workloads such as question sets or bulk test-case
+conversion (steps_batch.py --batch-api).
+
+Usage:
+    python batch_jobs.py questions.txt -o answers.jsonl --system 'You are java expert.'
+    python batch_jobs.py questions.jsonl -o answers.jsonl --resume     # after an interruption
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+BATCH_ENDPOINT = os.getenv('BATCH_ENDPOINT', '/chat/completions')
+# Azure accepts up to 100,000 requests and 200 MB per batch input file
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 100000))
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', 190 * 1024 * 1024))
+BATCH_POLL_SECONDS = float(os.getenv('BATCH_POLL_SECONDS', 30))
+BATCH_COMPLETION_WINDOW = os.getenv('BATCH_COMPLETION_WINDOW', '24h')
+TERMINAL_STATUSES = frozenset(['completed', 'failed', 'expired', 'cancelled'])
+
+
+class BatchRequestError(RuntimeError):
+    """One request of a batch job came back with an error response."""
+
+    def __init__(self, custom_id, status_code, message):
+        super().__init__(f'{custom_id}: {status_code} {message}')
+        self.custom_id = custom_id
+        self.status_code = status_code
+
+
+class BatchJobError(RuntimeError):
+    """The batch job holding a request ended (failed, expired, cancelled) without an answer for it."""
+
+
+def request_line(custom_id, body, endpoint=BATCH_ENDPOINT):
+    """One encoded line of a batch input file."""
+    line = {'custom_id': custom_id, 'method': 'POST', 'url': endpoint, 'body': body}
+    return json.dumps(line, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def chunk_lines(lines, max_requests=BATCH_MAX_REQUESTS, max_bytes=BATCH_MAX_BYTES):
+    """Group (custom_id, encoded line) pairs into lists that each fit in one batch input file."""
+    chunk, size = [], 0
+    for custom_id, line in lines:
+        if len(line) > max_bytes:
+            raise ValueError(f'Request {custom_id} alone is larger than the {max_bytes}-byte batch file limit')
+        if chunk and (len(chunk) >= max_requests or size + len(line) > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append((custom_id, line))
+        size += len(line)
+    if chunk:
+        yield chunk
+
+
+def parse_result(line):
+    """(custom_id, ChatCompletion or BatchRequestError) for one line of a batch output or error file."""
+    from openai.types.chat import ChatCompletion
+
+    record = json.loads(line)
+    custom_id = record['custom_id']
+    response = record.get('response') or {}
+    if record.get('error') or response.get('status_code') != 200:
+        error = record.get('error') or (response.get('body') or {}).get('error') or {}
+        message = error.get('message', error) if isinstance(error, dict) else error
+        return custom_id, BatchRequestError(custom_id, response.get('status_code'), message)
+    return custom_id, ChatCompletion.model_validate(response['body'])
+
+
+class BatchRunner:
+    """Queue chat completion requests and run them as Batch API jobs.
+
+    submit() queues a request and returns a Future. flush() writes the queue into JSONL input files of at most
+    `max_requests` lines and `max_bytes` bytes, uploads them and creates one batch job per file. results()
+    polls the jobs and streams each finished job's output file back, resolving Futures by custom_id as the
+    lines arrive.
+
+    With `state_path` the jobs (uploaded file, batch id, the custom_ids they hold, whether their results were
+    collected) are saved after every step. A run interrupted at any point resumes without uploading or paying
+    for a request twice: submitting a custom_id that an unfinished saved job already holds only attaches a
+    Future to it.
+    """
+
+    def __init__(self, client, model, state_path=None, max_requests=BATCH_MAX_REQUESTS, max_bytes=BATCH_MAX_BYTES,
+                 poll_interval=BATCH_POLL_SECONDS, completion_window=BATCH_COMPLETION_WINDOW,
+                 endpoint=BATCH_ENDPOINT):
+        self.client = client
+        self.model = model
+        self.state_path = state_path
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.endpoint = endpoint
+        self.stats = {'submitted': 0, 'resumed': 0, 'jobs': 0, 'completed': 0, 'failed': 0}
+        self._queue = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.state = self._load_state()
+        self._saved = {custom_id for job in self.state['jobs'] if not job['collected']
+                       for custom_id in job['custom_ids']}
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {'jobs': []}
+        with open(self.state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        # A chunk that was never uploaded holds nothing on the server; its requests are simply queued again
+        state['jobs'] = [job for job in state['jobs'] if job.get('input_file_id')]
+        return state
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        # Written to a temporary file first so an interruption never leaves a half-written state file
+        temporary = self.state_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(temporary, self.state_path)
+
+    def submit(self, messages, custom_id=None, **params):
+        """Queue one chat completion (same arguments as chat.completions.create) and return a Future."""
+        with self._lock:
+            custom_id = custom_id or f'request-{len(self._futures) + 1}'
+            if custom_id in self._futures:
+                raise ValueError(f'Duplicate custom_id {custom_id!r}')
+            future = self._futures[custom_id] = Future()
+            if custom_id in self._saved:
+                self.stats['resumed'] += 1
+            else:
+                self._queue[custom_id] = dict(params, model=self.model, messages=messages)
+                self.stats['submitted'] += 1
+        return future
+
+    def _create(self, job):
+        batch = self.client.batches.create(input_file_id=job['input_file_id'], endpoint=self.endpoint,
+                                           completion_window=self.completion_window)
+        job.update(batch_id=batch.id, status=batch.status)
+        self._save_state()
+        self.stats['jobs'] += 1
+
+    def flush(self):
+        """Upload everything queued so far as batch jobs and return the ids of all unfinished jobs."""
+        with self._lock:
+            queued, self._queue = self._queue, {}
+        for job in self.state['jobs']:
+            # Uploaded by an interrupted run that stopped before creating the job
+            if not job.get('batch_id'):
+                self._create(job)
+
+        lines = ((custom_id, request_line(custom_id, body, self.endpoint)) for custom_id, body in queued.items())
+        for chunk in chunk_lines(lines, self.max_requests, self.max_bytes):
+            data = b''.join(line for _, line in chunk)
+            upload = self.client.files.create(file=(f"batch-{len(self.state['jobs']) + 1}.jsonl", data),
+                                              purpose='batch')
+            job = {'custom_ids': [custom_id for custom_id, _ in chunk], 'bytes': len(data),
+                   'input_file_id': upload.id, 'collected': False}
+            self.state['jobs'].append(job)
+            self._save_state()
+            self._create(job)
+        return [job['batch_id'] for job in self.state['jobs'] if not job['collected']]
+
+    def _deliver(self, custom_id, result):
+        future = self._futures.get(custom_id)
+        if future is None or future.done():
+            return False
+        if isinstance(result, Exception):
+            self.stats['failed'] += 1
+            future.set_exception(result)
+        else:
+            self.stats['completed'] += 1
+            future.set_result(result)
+        return True
+
+    def _collect(self, job, batch):
+        seen = set()
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            # Streamed line by line, so a large results file is never held in memory at once
+            with self.client.files.with_streaming_response.content(file_id) as response:
+                for line in response.iter_lines():
+                    if not line.strip():
+                        continue
+                    custom_id, result = parse_result(line)
+                    seen.add(custom_id)
+                    if self._deliver(custom_id, result):
+                        yield custom_id, result
+
+        missing = [custom_id for custom_id in job['custom_ids'] if custom_id not in seen]
+        if missing:
+            errors = '; '.join(error.message for error in (batch.errors.data or [])) if batch.errors else ''
+            error = BatchJobError(f'Batch {batch.id} ended {batch.status} without an answer'
+                                  + (f': {errors}' if errors else ''))
+            for custom_id in missing:
+                if self._deliver(custom_id, error):
+                    yield custom_id, error
+        job['collected'] = True
+        self._save_state()
+
+    def results(self, timeout=None):
+        """Flush, then yield (custom_id, ChatCompletion or exception) for this run's requests as jobs finish.
+
+        Results of saved jobs are only yielded for custom_ids submitted in this process. Raises TimeoutError if
+        jobs are still running after `timeout` seconds; they keep running and can be picked up with the state.
+        """
+        self.flush()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            open_jobs = [job for job in self.state['jobs'] if not job['collected']]
+            if not open_jobs:
+                return
+            finished = False
+            for job in open_jobs:
+                batch = self.client.batches.retrieve(job['batch_id'])
+                job['status'] = batch.status
+                if batch.status in TERMINAL_STATUSES:
+                    finished = True
+                    yield from self._collect(job, batch)
+            if finished:
+                continue
+            if deadline is not None and time.monotonic() + self.poll_interval > deadline:
+                raise TimeoutError(f'{len(open_jobs)} batch jobs still running after {timeout}s')
+            time.sleep(self.poll_interval)
+
+    def wait(self, timeout=None):
+        """Run results() to the end, for callers that only use the Futures."""
+        for _ in self.results(timeout):
+            pass
+
+    def report(self):
+        return (f"Batch jobs: {self.stats['jobs']} created, {self.stats['submitted']} requests submitted, "
+                f"{self.stats['resumed']} resumed, {self.stats['completed']} answered, "
+                f"{self.stats['failed']} failed")
+
+
+def read_requests(path):
+    """Yield (custom_id, messages or question) from a text file of questions or a JSONL file.
+
+    JSONL lines hold "messages" or "question" and an optional "id"; plain text holds one question per line.
+    """
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            if line.lstrip().startswith('{'):
+                record = json.loads(line)
+                yield str(record.get('id', number)), record.get('messages') or record['question']
+            else:
+                yield str(number), line.strip()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main(argv=None):
+    import clients
+    from steps_batch import completed_ids
+    from structuring_openai_api_call import system_message, user_message
+
+    parser = argparse.ArgumentParser(description='Answer a file of questions through the Batch API.')
+    parser.add_argument('input', help='Questions, one per line, or JSONL with "question"/"messages" and "id"')
+    parser.add_argument('-o', '--output', required=True, help='JSONL output file')
+    parser.add_argument('--system', help='System prompt sent with every question')
+    parser.add_argument('--state', help='Job state file (default: <output>.batch.json)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Pick up the jobs in the state file and skip ids already in the output')
+    parser.add_argument('--poll', type=float, default=BATCH_POLL_SECONDS, help='Seconds between status checks')
+    args = parser.parse_args(argv)
+
+    model, = clients.require('MODEL')
+    state_path = args.state or args.output + '.batch.json'
+    if not args.resume and os.path.exists(state_path):
+        print(f'{state_path} holds jobs from an earlier run; pass --resume to continue them or delete it.')
+        return 1
+    skip = completed_ids(args.output) if args.resume else set()
+    runner = BatchRunner(clients.get_client(), model, state_path=state_path, poll_interval=args.poll)
+    for custom_id, request in read_requests(args.input):
+        if custom_id in skip:
+            continue
+        messages = request if isinstance(request, list) else \
+            ([system_message(args.system)] if args.system else []) + [user_message(request)]
+        runner.submit(messages, custom_id=custom_id)
+
+    with open(args.output, 'a' if args.resume else 'w', encoding='utf-8') as sink:
+        for custom_id, result in runner.results():
+            if isinstance(result, Exception):
+                record = {'id': custom_id, 'error': str(result)}
+            else:
+                record = {'id': custom_id, 'answer': result.choices[0].message.content}
+            sink.write(json.dumps(record) + '\n')
+            sink.flush()
+    print(runner.report(), file=sys.stderr)
+    os.remove(state_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Micro-benchmark: per-call latency of bare requests.get versus the pooled http_session against a local stub.
+
+Usage: python bench_http_pooling.py [--calls 200] [--delay-ms 0]
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import http_session
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0.0
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+        body = json.dumps({'results': [{'id': 1, 'title': 'Pasta'}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(delay=0.0):
+    StubHandler.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(fetch, url, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fetch(url).json()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f'{name:<12} mean {statistics.mean(timings):7.3f} ms   p50 {statistics.median(timings):7.3f} ms   '
+          f'p95 {p95:7.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--delay-ms', type=float, default=0.0, help='Server-side delay added to every response')
+    args = parser.parse_args()
+
+    server = start_stub_server(args.delay_ms / 1000)
+    url = f'http://127.0.0.1:{server.server_address[1]}/recipes/complexSearch?query=pasta&number=1'
+    try:
+        session = http_session.new_session(retries=0)
+        # Warm up both paths so the first connection is not counted
+        requests.get(url)
+        session.get(url)
+        report('unpooled', measure(requests.get, url, args.calls))
+        report('pooled', measure(session.get, url, args.calls))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Cold-start benchmark: import time, first-request and second-request latency in fresh interpreters.
+
+Each run spawns a new Python process against the local mock server, so nothing is warm: not the module cache,
+not the OpenAI client, not its connection pool. The first request pays for client construction and the TCP
+connect; the second shows the steady state.
+
+Usage:
+    python bench_startup.py --runs 10
+    python bench_startup.py --modules v2,learn_openaI_tools --json-out startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from mock_server import MockConfig, start_mock_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEPLOYMENT = 'mock-gpt-4o'
+
+IMPORT_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'import_ms': (time.perf_counter() - start) * 1000,
+                  'openai_loaded': 'openai' in sys.modules, 'numpy_loaded': 'numpy' in sys.modules}}))
+'''
+
+REQUEST_PROBE = '''
+import contextlib, json, os, time
+start = time.perf_counter()
+import clients, v2
+imported = time.perf_counter()
+
+import spoonacular_cache
+spoonacular_cache._default_cache = spoonacular_cache.TwoTierCache(path=None, max_entries=0)
+timings = {'import_ms': (imported - start) * 1000}
+with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    for name, query in (('first_request_ms', 'Nutrition of Mutton curry'),
+                        ('second_request_ms', 'recipe for white sauce pasta')):
+        began = time.perf_counter()
+        v2.answer_query(clients.get_client(), query)
+        timings[name] = (time.perf_counter() - began) * 1000
+print(json.dumps(timings))
+'''
+
+
+def run_probe(code, env):
+    """Run `code` in a fresh interpreter and return its JSON result plus the process wall time."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f'Probe failed: {completed.stderr.strip()}')
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_ms'] = wall_ms
+    return result
+
+
+def summarize(samples):
+    """Median of every numeric field across runs."""
+    summary = {}
+    for key, value in samples[0].items():
+        if isinstance(value, bool):
+            summary[key] = any(sample[key] for sample in samples)
+        else:
+            summary[key] = round(statistics.median(sample[key] for sample in samples), 1)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes per measurement')
+    parser.add_argument('--modules', default='v2,v2_batch,multiple_function_calling,learn_openaI_tools',
+                        help='Comma-separated modules whose import time is measured')
+    parser.add_argument('--llm-latency', default='fixed:0')
+    parser.add_argument('--spoonacular-latency', default='fixed:0')
+    parser.add_argument('--json-out')
+    args = parser.parse_args(argv)
+
+    server, url = start_mock_server(MockConfig(args.llm_latency, 'fixed:0', args.spoonacular_latency))
+    env = dict(os.environ, ENDPOINT=url, OPENAI_KEY='mock', MODEL=DEPLOYMENT, SPOONACULAR_API_KEY='mock',
+               SPOONACULAR_BASE_URL=url, STREAM_RESPONSES='false', TRACING='false')
+    env.pop('EMBEDDING_MODEL', None)
+
+    results = {}
+    print(f"{'probe':<34}{'import ms':>11}{'1st req ms':>12}{'2nd req ms':>12}{'process ms':>12}  openai/numpy")
+    for module in args.modules.split(','):
+        summary = summarize([run_probe(IMPORT_PROBE.format(module=module), env) for _ in range(args.runs)])
+        results[f'import:{module}'] = summary
+        print(f"{'import ' + module:<34}{summary['import_ms']:11.1f}{'-':>12}{'-':>12}{summary['process_ms']:12.1f}"
+              f"  {summary['openai_loaded']}/{summary['numpy_loaded']}")
+    summary = summarize([run_probe(REQUEST_PROBE, env) for _ in range(args.runs)])
+    results['v2:requests'] = summary
+    print(f"{'v2 first/second request':<34}{summary['import_ms']:11.1f}{summary['first_request_ms']:12.1f}"
+          f"{summary['second_request_ms']:12.1f}{summary['process_ms']:12.1f}")
+    server.shutdown()
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""End-to-end benchmark of the scripts' flows against the local mock server (no network needed).
+
+Usage:
+    python benchmark.py --flows v2,learn --concurrency 1,8,32 --requests 200
+    python benchmark.py --json-out bench.json
+    python benchmark.py --baseline bench.json --max-regression 0.2   # exit 1 if p95 regresses by >20%
+    python benchmark.py --flows v2,learn --record sessions.jsonl      # capture a cassette for replay.py
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cassette
+from mock_server import MockConfig, start_mock_server
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEPLOYMENT = 'mock-gpt-4o'
+RECIPE_QUERIES = ['Nutrition of Mutton curry', 'recipe for white sauce pasta', 'how to cook paneer butter masala',
+                  'nutrition of garlic naan', 'calories in chicken biryani', 'find me a pancake recipe',
+                  'nutrition of veg pulao', 'mushroom risotto recipe']
+CITY_QUESTIONS = ['What is the temperature in New York and Mumbai?', 'What is the favourite food in Paris?',
+                  'What is the weather in Tokyo? What is the favourite food in Tokyo?']
+JAVA_QUESTIONS = ['What is the difference between a JDK and a JRE?',
+                  'What is the difference between an interface and an abstract class?',
+                  'What is the difference between a checked and an unchecked exception?']
+TEST_CASE = '''
+Step 1 : Enter Username as Admin123
+Step 2 : Enter Password as secret and Click on Sign in Button
+Step 3 : Click on My Profile image after login
+'''
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def load_script(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def session_flow(name, queries, run):
+    """Flow that picks a query and runs it as one cassette session, so recordings can be replayed."""
+    def flow(rng):
+        query = rng.choice(queries)
+        with cassette.session(name, query):
+            return run(query)
+    return flow
+
+
+def build_flows(client):
+    """Map flow name -> callable(rng) exercising that script's hot path once."""
+    import v2
+    import learn_openaI_tools
+    import multiple_function_calling
+    import structuring_openai_api_call
+    from completion_cache import CachedClient
+    from micro_batcher import MicroBatcher
+    from rate_limiter import RateLimiter
+
+    xpath = load_script('structured_output_xpath', 'structured_otput_using function_caling.py')
+    # Unlimited quota so the benchmark measures the pipeline, not the client-side throttle
+    limiter = RateLimiter(rpm=10 ** 9, tpm=10 ** 12)
+    # Wrapped like structuring_openai_api_call's __main__, so the benchmark covers the client the script ships with
+    batcher = MicroBatcher(CachedClient(client), DEPLOYMENT, 'You are java expert.', limiter=limiter)
+
+    return {
+        'v2': session_flow('v2', RECIPE_QUERIES, lambda query: v2.answer_query(client, query)),
+        'v2-stream': session_flow('v2-stream', RECIPE_QUERIES,
+                                  lambda query: v2.answer_query(client, query, stream=True)),
+        'learn': session_flow('learn', CITY_QUESTIONS, lambda query: learn_openaI_tools.ask(client, query)),
+        'learn-stream': session_flow('learn-stream', CITY_QUESTIONS,
+                                     lambda query: learn_openaI_tools.ask(client, query, stream=True)),
+        'recipes': session_flow('recipes', RECIPE_QUERIES,
+                                lambda query: multiple_function_calling.run_query(client, DEPLOYMENT, query,
+                                                                                  'mock-key')),
+        'structuring': lambda rng: structuring_openai_api_call.get_response(
+            client, DEPLOYMENT,
+            [structuring_openai_api_call.system_message('You are java expert.')] +
+            [structuring_openai_api_call.user_message(q) for q in JAVA_QUESTIONS],
+            limiter=limiter),
+        'structuring-batched': lambda rng: batcher.ask(rng.choice(JAVA_QUESTIONS)),
+        'xpath': lambda rng: xpath.get_response(
+            client, DEPLOYMENT,
+            [xpath.system_message('Convert test steps into click/enter function calls.'),
+             xpath.user_message(TEST_CASE)]),
+    }
+
+
+def run_flow(flow, requests, concurrency, seed=0):
+    latencies = []
+    errors = 0
+    rngs = [random.Random(seed + i) for i in range(requests)]
+
+    def one(rng):
+        start = time.perf_counter()
+        try:
+            flow(rng)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, error in pool.map(one, rngs):
+            if error is None:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+    wall = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'p50_ms': 1000 * percentile(latencies, 50) if latencies else None,
+        'p95_ms': 1000 * percentile(latencies, 95) if latencies else None,
+        'p99_ms': 1000 * percentile(latencies, 99) if latencies else None,
+        'throughput_rps': len(latencies) / wall if wall else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Return a list of human-readable regressions of p95 latency or throughput against a baseline run."""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous or current['p95_ms'] is None or previous.get('p95_ms') is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{key}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 - max_regression):
+            regressions.append(f"{key}: throughput {previous['throughput_rps']:.1f} -> "
+                               f"{current['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the OpenAI/Spoonacular flows against a local mock.')
+    parser.add_argument('--flows', default='v2,learn,recipes,structuring,xpath')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--llm-latency', default='lognormal:50:0.5')
+    parser.add_argument('--token-latency', default='fixed:1')
+    parser.add_argument('--spoonacular-latency', default='lognormal:20:0.3')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warm-caches', action='store_true', help='Keep the Spoonacular caches enabled')
+    parser.add_argument('--resilient', action='store_true',
+                        help='Wrap the client in resilience.ResilientClient (hedging + circuit breaker)')
+    parser.add_argument('--deployments', type=int, default=0,
+                        help='Route through client_pool.ClientPool over this many mock deployments')
+    parser.add_argument('--rpm', type=int, default=600, help='Per-deployment RPM quota with --deployments')
+    parser.add_argument('--record', help='Append every session to this cassette for replay.py')
+    parser.add_argument('--json-out')
+    parser.add_argument('--baseline')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    config = MockConfig(args.llm_latency, args.token_latency, args.spoonacular_latency, args.error_rate,
+                        seed=args.seed)
+    server, url = start_mock_server(config)
+
+    # The scripts read their configuration from the environment at import time
+    os.environ.update({'ENDPOINT': url, 'OPENAI_KEY': 'mock', 'MODEL': DEPLOYMENT, 'SPOONACULAR_API_KEY': 'mock',
+                       'SPOONACULAR_BASE_URL': url, 'STREAM_RESPONSES': 'false'})
+    os.environ.pop('EMBEDDING_MODEL', None)
+
+    import clients
+    import spoonacular_cache
+
+    if not args.warm_caches:
+        spoonacular_cache._default_cache = spoonacular_cache.TwoTierCache(path=None, max_entries=0)
+    if args.record:
+        cassette.start_recording(args.record)
+    client = clients.new_client(url, 'mock', max_retries=0)
+    if args.deployments:
+        from client_pool import ClientPool, Deployment
+        client = ClientPool([Deployment(f'mock-{i}', url, 'mock', f'{DEPLOYMENT}-{i}', args.rpm, 10 ** 9)
+                             for i in range(args.deployments)])
+    if args.resilient:
+        from resilience import ResilientClient
+        client = ResilientClient(client)
+    flows = build_flows(client)
+
+    results = {}
+    print(f"{'flow':<14}{'conc':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}{'rss MB':>9}")
+    for name in args.flows.split(','):
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result = run_flow(flows[name], args.requests, concurrency, args.seed)
+            results[f'{name}@{concurrency}'] = result
+            fmt = lambda value: f'{value:10.1f}' if value is not None else f'{"-":>10}'
+            print(f"{name:<14}{concurrency:>5}{fmt(result['p50_ms'])}{fmt(result['p95_ms'])}{fmt(result['p99_ms'])}"
+                  f"{fmt(result['throughput_rps'])}{result['errors']:>8}{fmt(result['peak_rss_mb'])[1:]}")
+    print('mock server requests:', json.dumps(server.stats, sort_keys=True))
+    server.shutdown()
+    if args.record:
+        cassette.stop()
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print('REGRESSION', line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,425 @@
+"""Record and replay the HTTP traffic and tool calls of the pipeline, for offline load tests.
+
+Recording: with CASSETTE=path set (or after start_recording()), every exchange made through clients.new_client()
+and http_session, and every ToolRegistry call, is appended to a JSON-lines cassette together with its timing.
+Exchanges are tagged with the session they belong to; a session is one user query opened with session().
+A path ending in .gz is written gzip-compressed. API keys are never written: headers are dropped and apiKey
+query parameters are stripped.
+
+Replaying: after start_replay(), the same hooks answer requests from the cassette instead of the network, after
+the recorded server time divided by the replay speed. replay.py drives this from the command line.
+"""
+import atexit
+import contextlib
+import contextvars
+import gzip
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+CASSETTE = os.getenv('CASSETTE')
+SECRET_PARAMS = frozenset(['apiKey', 'api_key', 'api-key'])
+# Response headers kept in the cassette; everything else (including auth) is dropped
+KEPT_HEADERS = ('content-type', 'retry-after', 'retry-after-ms')
+
+_session = contextvars.ContextVar('cassette_session', default=None)
+_mode = None
+_mode_lock = threading.Lock()
+
+
+class ReplayMissError(ConnectionError):
+    """Raised by the replay transports when the cassette holds no response for a request."""
+
+
+def request_path(url):
+    """Path and query of `url` without the host and without API keys, so cassettes match any endpoint."""
+    parts = urlsplit(str(url))
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS])
+    return f'{parts.path}?{query}' if query else parts.path
+
+
+def route(path):
+    """The endpoint a request went to, ignoring its query string and the Azure deployment name."""
+    return re.sub(r'/deployments/[^/]+/', '/deployments/*/', path.split('?', 1)[0])
+
+
+def is_llm(path):
+    return '/openai/' in path
+
+
+def decode_body(content, content_type=''):
+    """Request or response body as stored in the cassette: parsed JSON where possible, text otherwise."""
+    if not content:
+        return None
+    text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
+    if 'json' in (content_type or '') or text[:1] in '{[':
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return text
+
+
+def encode_body(body):
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return json.dumps(body, separators=(',', ':')).encode('utf-8')
+
+
+def body_key(body):
+    return body if isinstance(body, str) or body is None else json.dumps(body, sort_keys=True, separators=(',', ':'))
+
+
+class Recorder:
+    """Append-only cassette writer shared by all threads of the process."""
+
+    def __init__(self, path):
+        self.path = path
+        self.compressed = path.endswith('.gz')
+        # gzip appends a new member per process, which readers handle transparently
+        self._file = (gzip.open(path, 'at', encoding='utf-8') if self.compressed
+                      else open(path, 'a', encoding='utf-8'))
+        self._lock = threading.Lock()
+        self.stats = {'sessions': 0, 'exchanges': 0, 'tools': 0}
+        atexit.register(self.close)
+
+    def write(self, event, flush=False):
+        line = json.dumps(event, separators=(',', ':'), default=str)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + '\n')
+            # Flushing a gzip stream per line would ruin its compression, so it is flushed per session
+            if flush or not self.compressed:
+                self._file.flush()
+
+    @contextlib.contextmanager
+    def session(self, flow, query, **fields):
+        state = {'id': uuid.uuid4().hex[:12], 'start': time.perf_counter()}
+        self.write({'type': 'session', 'id': state['id'], 'flow': flow, 'input': query, 'ts': time.time(),
+                    'model': os.getenv('MODEL'), **fields})
+        self._count('sessions')
+        token = _session.set(state)
+        error = None
+        try:
+            yield state['id']
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            _session.reset(token)
+            self.write({'type': 'end', 'session': state['id'], 'error': error,
+                        'elapsed': round(time.perf_counter() - state['start'], 4)}, flush=True)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _tag(self, event):
+        state = _session.get()
+        if isinstance(state, dict):
+            event['session'] = state['id']
+            event['t'] = round(time.perf_counter() - state['start'], 4)
+        return event
+
+    def exchange(self, method, url, request_body, request_type, status, headers, content, elapsed):
+        headers = {k.lower(): v for k, v in headers.items()}
+        self.write(self._tag({'type': 'http', 'method': method, 'path': request_path(url),
+                              'request': decode_body(request_body, request_type), 'status': status,
+                              'headers': {k: headers[k] for k in KEPT_HEADERS if k in headers},
+                              'response': decode_body(content, headers.get('content-type')),
+                              'elapsed': round(elapsed, 4)}))
+        self._count('exchanges')
+
+    def tool(self, name, arguments, output, error, elapsed):
+        self.write(self._tag({'type': 'tool', 'name': name, 'arguments': arguments, 'output': output,
+                              'error': error, 'elapsed': round(elapsed, 4)}))
+        self._count('tools')
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def load(path):
+    """Read a cassette into a list of sessions, each {'flow', 'input', ..., 'exchanges', 'tools'}.
+
+    A last line cut short by a crash is ignored, as are exchanges recorded outside of any session.
+    """
+    sessions = {}
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event['type'] == 'session':
+                sessions[event['id']] = dict(event, exchanges=[], tools=[])
+            elif event.get('session') in sessions:
+                session = sessions[event['session']]
+                if event['type'] == 'http':
+                    session['exchanges'].append(event)
+                elif event['type'] == 'tool':
+                    session['tools'].append(event)
+                elif event['type'] == 'end':
+                    session.update(error=event['error'], elapsed=event['elapsed'])
+    return list(sessions.values())
+
+
+class ReplaySession:
+    """The recorded exchanges of one session, consumed as the replayed code asks for them."""
+
+    def __init__(self, session):
+        self.session = session
+        self.remaining = list(session['exchanges'])
+        self.stats = {'exact': 0, 'shared': 0, 'by_route': 0, 'missed': 0, 'tools': 0}
+        self._lock = threading.Lock()
+
+    def take(self, method, path, body_text):
+        """Pop the first unused recorded exchange for exactly this request, or None."""
+        with self._lock:
+            for i, exchange in enumerate(self.remaining):
+                if exchange['method'] == method and exchange['path'] == path and \
+                        body_key(exchange['request']) == body_text:
+                    return self.remaining.pop(i)
+        return None
+
+    def take_route(self, method, path):
+        with self._lock:
+            for i, exchange in enumerate(self.remaining):
+                if exchange['method'] == method and route(exchange['path']) == route(path):
+                    return self.remaining.pop(i)
+        return None
+
+
+class Player:
+    """Answers requests from a loaded cassette.
+
+    A request is served, in order of preference, by an unused exchange of the current session with the same
+    method, path and body; by the same request recorded in any session (for lookups a cache answered in that
+    session); and, for LLM calls only, by the next unused exchange of the session on the same endpoint, so a
+    changed prompt still gets a realistic reply. Anything else raises ReplayMissError.
+    """
+
+    def __init__(self, sessions, speed=1.0):
+        self.speed = speed
+        self.shared = {}
+        for session in sessions:
+            for exchange in session['exchanges']:
+                key = (exchange['method'], exchange['path'], body_key(exchange['request']))
+                self.shared.setdefault(key, exchange)
+
+    @contextlib.contextmanager
+    def session(self, recorded):
+        replay = ReplaySession(recorded)
+        token = _session.set(replay)
+        try:
+            yield replay
+        finally:
+            _session.reset(token)
+
+    def lookup(self, method, url, content):
+        """Return (exchange, delay seconds) for a request, raising ReplayMissError if nothing matches."""
+        path = request_path(url)
+        body_text = body_key(decode_body(content))
+        replay = _session.get()
+        exchange, kind = None, 'missed'
+        if isinstance(replay, ReplaySession):
+            exchange, kind = replay.take(method, path, body_text), 'exact'
+        if exchange is None:
+            exchange, kind = self.shared.get((method, path, body_text)), 'shared'
+        if exchange is None and is_llm(path) and isinstance(replay, ReplaySession):
+            exchange, kind = replay.take_route(method, path), 'by_route'
+        if exchange is None:
+            kind = 'missed'
+        if isinstance(replay, ReplaySession):
+            with replay._lock:
+                replay.stats[kind] += 1
+        if exchange is None:
+            raise ReplayMissError(f'No recorded response for {method} {path}')
+        return exchange, exchange['elapsed'] / self.speed if self.speed else 0.0
+
+    def tool(self, name, arguments, output, error, elapsed):
+        replay = _session.get()
+        if isinstance(replay, ReplaySession):
+            with replay._lock:
+                replay.stats['tools'] += 1
+
+
+def mode():
+    """The active Recorder or Player, starting a recording if CASSETTE is set and nothing is active yet."""
+    global _mode
+    if _mode is None and CASSETTE:
+        with _mode_lock:
+            if _mode is None:
+                _mode = Recorder(CASSETTE)
+    return _mode
+
+
+def start_recording(path):
+    global _mode
+    with _mode_lock:
+        _mode = Recorder(path)
+    return _mode
+
+
+def start_replay(sessions, speed=1.0):
+    global _mode
+    with _mode_lock:
+        _mode = Player(sessions, speed)
+    return _mode
+
+
+def stop():
+    global _mode
+    with _mode_lock:
+        if isinstance(_mode, Recorder):
+            _mode.close()
+        _mode = None
+
+
+def session(flow, query, **fields):
+    """Context manager marking one user query as a session while recording; a no-op otherwise."""
+    active = mode()
+    if isinstance(active, Recorder):
+        return active.session(flow, query, **fields)
+    return contextlib.nullcontext()
+
+
+def record_tool(name, arguments, output=None, error=None, elapsed=0.0):
+    active = mode()
+    if active is not None:
+        active.tool(name, arguments, output, error, elapsed)
+
+
+def _kept_headers(exchange):
+    headers = dict(exchange.get('headers') or {})
+    headers.setdefault('content-type', 'application/json' if not isinstance(exchange['response'], str)
+                       else 'text/plain')
+    return headers
+
+
+class _Transport:
+    """httpx transport that records exchanges through `inner`, or serves them from the cassette when replaying."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def handle_request(self, request):
+        import httpx
+        active = mode()
+        if isinstance(active, Player):
+            try:
+                exchange, delay = active.lookup(request.method, request.url, request.read())
+            except ReplayMissError as e:
+                raise httpx.ConnectError(str(e), request=request)
+            time.sleep(delay)
+            return httpx.Response(exchange['status'], headers=_kept_headers(exchange),
+                                  content=encode_body(exchange['response']), request=request)
+
+        start = time.perf_counter()
+        response = self.inner.handle_request(request)
+        content = response.read()
+        return self._recorded(active, request, response, content, time.perf_counter() - start)
+
+    async def handle_async_request(self, request):
+        import asyncio
+        import httpx
+        active = mode()
+        if isinstance(active, Player):
+            try:
+                exchange, delay = active.lookup(request.method, request.url, await request.aread())
+            except ReplayMissError as e:
+                raise httpx.ConnectError(str(e), request=request)
+            await asyncio.sleep(delay)
+            return httpx.Response(exchange['status'], headers=_kept_headers(exchange),
+                                  content=encode_body(exchange['response']), request=request)
+
+        start = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        content = await response.aread()
+        return self._recorded(active, request, response, content, time.perf_counter() - start)
+
+    def _recorded(self, active, request, response, content, elapsed):
+        import httpx
+        if isinstance(active, Recorder):
+            active.exchange(request.method, request.url, request.content, request.headers.get('content-type'),
+                            response.status_code, response.headers, content, elapsed)
+        # The body is already decoded, so the encoding headers must not be passed on
+        headers = [(k, v) for k, v in response.headers.items()
+                   if k.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')]
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request,
+                              extensions=response.extensions)
+
+    def close(self):
+        self.inner.close()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+class _Adapter:
+    """requests adapter counterpart of _Transport, for http_session."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def send(self, request, **kwargs):
+        active = mode()
+        if isinstance(active, Player):
+            import requests
+            from requests.structures import CaseInsensitiveDict
+            try:
+                exchange, delay = active.lookup(request.method, request.url, request.body)
+            except ReplayMissError as e:
+                raise requests.ConnectionError(str(e), request=request)
+            time.sleep(delay)
+            response = requests.Response()
+            response.status_code = exchange['status']
+            response.headers = CaseInsensitiveDict(_kept_headers(exchange))
+            response._content = encode_body(exchange['response'])
+            response.encoding = 'utf-8'
+            response.url = request.url
+            response.request = request
+            return response
+
+        start = time.perf_counter()
+        response = self.inner.send(request, **kwargs)
+        content = response.content
+        if isinstance(active, Recorder):
+            active.exchange(request.method, request.url, request.body, request.headers.get('content-type'),
+                            response.status_code, response.headers, content, time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+def wrap_transport(transport):
+    """Wrap an httpx (sync or async) transport when recording or replaying; return it unchanged otherwise."""
+    return _Transport(transport) if mode() is not None else transport
+
+
+def wrap_adapter(adapter):
+    """Wrap a requests adapter when recording or replaying; return it unchanged otherwise."""
+    return _Adapter(adapter) if mode() is not None else adapter
@@ -0,0 +1,91 @@
+"""Check BatchRunner end to end against the local mock's Batch API stand-in (no network needed).
+
+Two runs share one state file. The first queues --requests questions split into jobs of --max-requests lines,
+uploads them and stops without collecting, like an interrupted process. The second resubmits the same ids plus
+--extra new ones from the state file and collects everything. The check fails unless every id is answered
+exactly once and only the new ids are uploaded and paid for again.
+
+Usage:
+    python check_batch_jobs.py
+    python check_batch_jobs.py --requests 50 --max-requests 8 --batch-latency fixed:500
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+
+from batch_jobs import BatchRunner
+from mock_server import MockConfig, start_mock_server
+
+DEPLOYMENT = 'mock-gpt-4o'
+
+
+def questions(count, start=0):
+    return [(f'q-{number}', [{'role': 'user', 'content': f'What is Java feature number {number}?'}])
+            for number in range(start, start + count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=10, help='Requests submitted before the interruption')
+    parser.add_argument('--extra', type=int, default=2, help='New requests added by the resumed run')
+    parser.add_argument('--max-requests', type=int, default=4, help='Lines per batch input file')
+    parser.add_argument('--batch-latency', default='fixed:200')
+    parser.add_argument('--poll', type=float, default=0.05, help='Seconds between status checks')
+    args = parser.parse_args(argv)
+
+    import clients
+
+    server, url = start_mock_server(MockConfig('fixed:0', 'fixed:0', batch_latency=args.batch_latency))
+    client = clients.new_client(url, 'mock', max_retries=0)
+    first = questions(args.requests)
+    second = first + questions(args.extra, args.requests)
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        state_path = os.path.join(directory, 'answers.batch.json')
+
+        interrupted = BatchRunner(client, DEPLOYMENT, state_path=state_path, max_requests=args.max_requests,
+                                  poll_interval=args.poll)
+        for custom_id, messages in first:
+            interrupted.submit(messages, custom_id=custom_id)
+        interrupted.flush()
+        uploaded = server.stats.get('openai.files.create', 0)
+
+        resumed = BatchRunner(client, DEPLOYMENT, state_path=state_path, max_requests=args.max_requests,
+                              poll_interval=args.poll)
+        futures = {custom_id: resumed.submit(messages, custom_id=custom_id) for custom_id, messages in second}
+        answered = {}
+        for custom_id, result in resumed.results(timeout=60):
+            if custom_id in answered:
+                failures.append(f'{custom_id} answered twice')
+            answered[custom_id] = result
+        print(resumed.report())
+
+    expected_jobs = math.ceil(args.requests / args.max_requests) + math.ceil(args.extra / args.max_requests)
+    checks = {
+        'first run uploads': (uploaded, math.ceil(args.requests / args.max_requests)),
+        'jobs created': (server.stats.get('openai.batches.create', 0), expected_jobs),
+        'files uploaded': (server.stats.get('openai.files.create', 0), expected_jobs),
+        'requests answered by the server': (server.stats.get('openai.batch.requests', 0), len(second)),
+        'resumed': (resumed.stats['resumed'], args.requests),
+        'submitted again': (resumed.stats['submitted'], args.extra),
+        'answered': (len(answered), len(second)),
+    }
+    for name, (actual, expected) in checks.items():
+        print(f'{name:<34}{actual:>6}{expected:>10}  {"ok" if actual == expected else "FAIL"}')
+        if actual != expected:
+            failures.append(f'{name}: {actual} != {expected}')
+    for custom_id, future in futures.items():
+        if not future.done() or future.exception() is not None:
+            failures.append(f'{custom_id} has no answer')
+    server.shutdown()
+
+    for failure in failures:
+        print('FAIL', failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+
+import clients
+import tracing
+from client_wrappers import Namespace
+from rate_limiter import DEFAULT_RPM, DEFAULT_TPM, RateLimiter, estimate_tokens, retry_after_seconds
+from resilience import CircuitBreaker, CircuitOpenError, is_outage
+
+EWMA_ALPHA = float(os.getenv('POOL_EWMA_ALPHA', 0.2))
+# Each request already in flight on a deployment adds this fraction of its EWMA to its score, which spreads
+# concurrent bursts instead of sending all of them to the currently fastest deployment
+INFLIGHT_PENALTY = float(os.getenv('POOL_INFLIGHT_PENALTY', 0.1))
+# Latency charged for a failed or throttled call so the deployment drops down the ranking right away
+FAILURE_PENALTY = float(os.getenv('POOL_FAILURE_PENALTY', 5.0))
+
+
+class Deployment:
+    """One endpoint/deployment/key set with its own warm client, quota limiter, breaker and latency EWMA."""
+
+    def __init__(self, name, endpoint, key, model, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, api_version=clients.API_VERSION,
+                 client=None):
+        self.name = name
+        self.model = model
+        # SDK retries are off: a failed or throttled request is re-routed by the pool instead
+        self.client = client or clients.new_client(endpoint, key, api_version, max_retries=0)
+        self.limiter = RateLimiter(rpm, tpm)
+        self.breaker = CircuitBreaker(name)
+        self.ewma = None
+        self.inflight = 0
+        self.stats = {'requests': 0, 'failures': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.ewma = seconds if self.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma
+
+    def score(self, tokens):
+        """Expected seconds until a request sent here completes. Unmeasured deployments score 0 to get probed."""
+        if self.ewma is None:
+            return 0.0
+        return self.ewma * (1 + INFLIGHT_PENALTY * self.inflight) + self.limiter.estimated_wait(tokens)
+
+    def __repr__(self):
+        ewma = f'{self.ewma * 1000:.0f}ms' if self.ewma is not None else '-'
+        return f'Deployment({self.name!r}, ewma={ewma}, breaker={self.breaker.state}, stats={self.stats})'
+
+
+def load_deployments():
+    """Deployments from AZURE_DEPLOYMENTS, a JSON list of {"name", "endpoint", "key", "model", "rpm", "tpm"}
+    objects, falling back to the single ENDPOINT / OPENAI_KEY / MODEL set used by the scripts."""
+    raw = clients.setting('AZURE_DEPLOYMENTS')
+    if raw:
+        configs = json.loads(raw)
+    else:
+        endpoint, key, model = clients.require('ENDPOINT', 'OPENAI_KEY', 'MODEL')
+        configs = [{'endpoint': endpoint, 'key': key, 'model': model}]
+    return [Deployment(config.get('name') or f"{config['endpoint']}#{config['model']}", config['endpoint'],
+                       config['key'], config['model'], config.get('rpm', DEFAULT_RPM), config.get('tpm', DEFAULT_TPM))
+            for config in configs]
+
+
+class _PooledCompletions:
+    def __init__(self, pool, path):
+        self._pool = pool
+        self._path = path
+
+    def create(self, **kwargs):
+        return self._pool.call(self._path + ('create',), kwargs)
+
+    def parse(self, **kwargs):
+        return self._pool.call(self._path + ('parse',), kwargs)
+
+
+class ClientPool:
+    """Route chat completions across several Azure deployments by latency, quota and health.
+
+    Each request goes to the deployment with the lowest score: its latency EWMA (inflated by requests in
+    flight) plus how long its RPM/TPM limiter would queue the request. Deployments with an open circuit are
+    skipped. A 429, connection error or 5xx fails over to the next deployment; other errors are raised. The
+    caller's `model` is replaced by the chosen deployment's, so code written for one client works unchanged.
+    Every other attribute (embeddings, ...) is forwarded to the first deployment's client.
+    """
+
+    # Each Deployment has its own circuit breaker, so ResilientClient adds none of its own around the pool
+    routes_deployments = True
+
+    def __init__(self, deployments):
+        if not deployments:
+            raise ValueError('ClientPool needs at least one deployment')
+        self.deployments = list(deployments)
+        self.chat = Namespace(self.deployments[0].client.chat,
+                              completions=_PooledCompletions(self, ('chat', 'completions')))
+        self.beta = Namespace(self.deployments[0].client.beta,
+                              chat=Namespace(self.deployments[0].client.beta.chat,
+                                             completions=_PooledCompletions(self, ('beta', 'chat',
+                                                                                   'completions'))))
+
+    @classmethod
+    def from_env(cls):
+        return cls(load_deployments())
+
+    def ranked(self, tokens):
+        return sorted(self.deployments, key=lambda deployment: deployment.score(tokens))
+
+    def _method(self, deployment, path):
+        target = deployment.client
+        for name in path:
+            target = getattr(target, name)
+        return target
+
+    def call(self, path, kwargs):
+        import openai
+        estimated = estimate_tokens(kwargs.get('model') or self.deployments[0].model, kwargs.get('messages', []),
+                                    kwargs.get('max_tokens'), kwargs.get('tools'))
+        last_error = None
+        for deployment in self.ranked(estimated):
+            try:
+                deployment.breaker.allow()
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+
+            deployment.limiter.acquire(estimated)
+            with deployment._lock:
+                deployment.inflight += 1
+                deployment.stats['requests'] += 1
+            start = time.perf_counter()
+            try:
+                response = self._method(deployment, path)(**dict(kwargs, model=deployment.model))
+            except openai.RateLimitError as e:
+                deployment.limiter.reconcile(estimated, 0)
+                deployment.limiter.pause(retry_after_seconds(e.response))
+                deployment.breaker.record_failure(e)
+                deployment.stats['throttled'] += 1
+                deployment.observe(FAILURE_PENALTY)
+                last_error = e
+                tracing.incr('failovers')
+                continue
+            except Exception as e:
+                deployment.breaker.record_failure(e)
+                if not is_outage(e):
+                    raise
+                deployment.stats['failures'] += 1
+                deployment.observe(FAILURE_PENALTY)
+                last_error = e
+                tracing.incr('failovers')
+                continue
+            finally:
+                with deployment._lock:
+                    deployment.inflight -= 1
+
+            deployment.observe(time.perf_counter() - start)
+            deployment.breaker.record_success()
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                deployment.limiter.reconcile(estimated, usage.total_tokens)
+            tracing.annotate(deployment=deployment.name)
+            return response
+        raise last_error
+
+    def __getattr__(self, name):
+        return getattr(self.deployments[0].client, name)
@@ -0,0 +1,14 @@
+class Namespace:
+    """Stand-in for an SDK resource such as client.chat: the given children replace attributes of `target`,
+    everything else is forwarded to it.
+
+    Client wrappers (CachedClient, ResilientClient, ClientPool) use it to override chat.completions and
+    beta.chat.completions while leaving the rest of the client untouched.
+    """
+
+    def __init__(self, target, **children):
+        self._target = target
+        self.__dict__.update(children)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
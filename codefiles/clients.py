@@ -0,0 +1,102 @@
+"""Process-wide OpenAI clients and settings, created on first use.
+
+Nothing heavy is imported at module load: python-dotenv, httpx and openai are imported by the functions that
+need them, so `import clients` (and any script that only imports it) starts in milliseconds.
+"""
+import os
+import threading
+
+API_VERSION = os.getenv('AZURE_API_VERSION', '2024-08-01-preview')
+MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 100))
+MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', 20))
+KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 60))
+CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+REQUEST_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 60))
+
+_lock = threading.Lock()
+_env_loaded = False
+_client = None
+_async_client = None
+
+
+def load_env():
+    """Run load_dotenv() once per process."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def setting(name, default=None):
+    load_env()
+    return os.getenv(name, default)
+
+
+def require(*names):
+    """Return the values of `names`, raising EnvironmentError if any of them is missing."""
+    load_env()
+    values = [os.getenv(name) for name in names]
+    if not all(values):
+        raise EnvironmentError(f"Missing one or more required environment variables ({', '.join(names)}).")
+    return values
+
+
+def http_limits(max_connections=MAX_CONNECTIONS, max_keepalive=MAX_KEEPALIVE):
+    import httpx
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                        keepalive_expiry=KEEPALIVE_EXPIRY)
+
+
+def http_timeout():
+    import httpx
+    return httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def new_client(endpoint=None, key=None, api_version=API_VERSION, max_retries=2, max_connections=MAX_CONNECTIONS):
+    """Build an AzureOpenAI client on an httpx pool sized for concurrent use, with keep-alive connections."""
+    import httpx
+    from openai import AzureOpenAI
+
+    import cassette
+    if endpoint is None or key is None:
+        endpoint, key = require('ENDPOINT', 'OPENAI_KEY')
+    transport = httpx.HTTPTransport(limits=http_limits(max_connections, min(MAX_KEEPALIVE, max_connections)))
+    http_client = httpx.Client(transport=cassette.wrap_transport(transport), timeout=http_timeout())
+    return AzureOpenAI(azure_endpoint=endpoint, api_key=key, api_version=api_version, max_retries=max_retries,
+                       http_client=http_client)
+
+
+def new_async_client(endpoint=None, key=None, api_version=API_VERSION, max_retries=2,
+                     max_connections=MAX_CONNECTIONS):
+    """Async counterpart of new_client() for the asyncio batch scripts."""
+    import httpx
+    from openai import AsyncAzureOpenAI
+
+    import cassette
+    if endpoint is None or key is None:
+        endpoint, key = require('ENDPOINT', 'OPENAI_KEY')
+    transport = httpx.AsyncHTTPTransport(limits=http_limits(max_connections, min(MAX_KEEPALIVE, max_connections)))
+    http_client = httpx.AsyncClient(transport=cassette.wrap_transport(transport), timeout=http_timeout())
+    return AsyncAzureOpenAI(azure_endpoint=endpoint, api_key=key, api_version=api_version, max_retries=max_retries,
+                            http_client=http_client)
+
+
+def get_client():
+    """The shared AzureOpenAI client for ENDPOINT / OPENAI_KEY, created on first call."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = new_client()
+    return _client
+
+
+def get_async_client():
+    """The shared AsyncAzureOpenAI client. Use it from one event loop only, as httpx requires."""
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = new_async_client()
+    return _async_client
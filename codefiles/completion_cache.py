@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+import tracing
+from client_wrappers import Namespace
+
+
+def _canonical(value):
+    """Turn request arguments into plain JSON-able data so equal payloads hash equally."""
+    # Duck-typed pydantic checks, so importing this module does not import pydantic
+    if isinstance(value, type) and hasattr(value, 'model_json_schema'):
+        return {'pydantic': value.__name__, 'schema': value.model_json_schema()}
+    if hasattr(value, 'model_dump'):
+        return _canonical(value.model_dump(exclude_none=True))
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def request_key(kind, kwargs):
+    """SHA-256 of the canonical JSON form of a completion request."""
+    payload = json.dumps({'kind': kind, 'request': _canonical(kwargs)}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU bounded by the total pickled size of the stored responses."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return pickle.loads(entry[0]), entry[1]
+
+    def set(self, key, value, expires):
+        data = pickle.dumps(value)
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key)[0])
+            self._entries[key] = (data, expires)
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._size -= len(old)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class DiskBackend:
+    """One pickle file per response under `directory`; the least recently used files go once `max_bytes` is hit."""
+
+    def __init__(self, directory='.completion_cache', max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._files())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value, expires = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path)
+        return value, expires
+
+    def set(self, key, value, expires):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump((value, expires), f)
+        with self._lock:
+            # Overwriting a key replaces its file, so only the difference counts towards the total
+            try:
+                self._size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp, path)
+            self._size += os.path.getsize(path)
+        # Only walk the directory when the running total says we may be over budget
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def delete(self, key):
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._size -= size
+
+    def _files(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.pkl'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict(self):
+        with self._lock:
+            files = self._files()
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                total -= size
+            self._size = total
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._files():
+                os.remove(path)
+            self._size = 0
+
+
+def dump_completion(value):
+    """The JSON text a completion is stored as; parsed results do not pickle (ParsedChatCompletion[T] is generic)."""
+    return value.model_dump_json() if hasattr(value, 'model_dump_json') else value
+
+
+def load_completion(kind, data, kwargs):
+    """Rebuild a stored completion; `.parse` results are validated as ParsedChatCompletion[response_format]."""
+    from openai.types.chat import ChatCompletion, ParsedChatCompletion
+
+    if not kind.endswith('.parse'):
+        return ChatCompletion.model_validate_json(data)
+    response_format = kwargs.get('response_format')
+    content_type = response_format if isinstance(response_format, type) else object
+    return ParsedChatCompletion[content_type].model_validate_json(data)
+
+
+class CompletionCache:
+    """Exact-match cache for chat completions keyed on the full request payload."""
+
+    def __init__(self, backend=None, ttl=None):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'bypassed': 0}
+
+    def call(self, kind, func, kwargs, bypass_cache=False):
+        # Streamed responses are iterators, not ChatCompletion objects, so there is nothing to store
+        if bypass_cache or kwargs.get('stream'):
+            self.stats['bypassed'] += 1
+            return func(**kwargs)
+
+        key = request_key(kind, kwargs)
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, expires = entry
+            if expires is None or expires > time.time():
+                self.stats['hits'] += 1
+                tracing.annotate(cache_hit=True)
+                return load_completion(kind, value, kwargs)
+            self.backend.delete(key)
+
+        self.stats['misses'] += 1
+        value = func(**kwargs)
+        try:
+            self.backend.set(key, dump_completion(value), time.time() + self.ttl if self.ttl else None)
+        except Exception as e:
+            # The request is paid for already; a cache that cannot store it must not lose the answer
+            print('Could not cache completion:', e)
+        return value
+
+
+class _Completions:
+    def __init__(self, cache, completions, kind):
+        self._cache = cache
+        self._completions = completions
+        self._kind = kind
+
+    def create(self, bypass_cache=False, **kwargs):
+        return self._cache.call(self._kind, self._completions.create, kwargs, bypass_cache)
+
+    def parse(self, bypass_cache=False, **kwargs):
+        return self._cache.call(self._kind + '.parse', self._completions.parse, kwargs, bypass_cache)
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class CachedClient:
+    """Wrap an AzureOpenAI client so chat.completions.create and beta.chat.completions.parse are cached.
+
+    Pass bypass_cache=True to either call to force a fresh request. Every other attribute is forwarded to the
+    wrapped client unchanged.
+    """
+
+    def __init__(self, client, cache=None):
+        self.client = client
+        self.cache = cache or CompletionCache()
+        self.chat = Namespace(client.chat,
+                              completions=_Completions(self.cache, client.chat.completions, 'chat'))
+        self.beta = Namespace(client.beta,
+                              chat=Namespace(client.beta.chat,
+                                             completions=_Completions(self.cache, client.beta.chat.completions,
+                                                                      'beta.chat')))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,93 @@
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import cassette
+import tracing
+
+POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+
+
+def retry_policy(retries=RETRIES, backoff_factor=0.3):
+    """Retry idempotent GETs on connection errors, 429 and 5xx. `retries=0` disables retrying entirely."""
+    if not retries:
+        return Retry(total=0, connect=0, read=0, redirect=0, status=0, raise_on_status=False)
+    return Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+
+class TimeoutSession(requests.Session):
+    """A requests.Session that applies a default (connect, read) timeout to every request."""
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def new_session(pool_size=POOL_SIZE, retries=RETRIES, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+    """Build a keep-alive session whose connection pool holds up to `pool_size` sockets per host."""
+    session = TimeoutSession(timeout=(connect_timeout, read_timeout))
+    adapter = cassette.wrap_adapter(HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                                max_retries=retry_policy(retries)))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = new_session()
+    return _session
+
+
+def configure(**kwargs):
+    """Replace the shared session, e.g. configure(pool_size=50, retries=0)."""
+    global _session
+    with _session_lock:
+        old, _session = _session, new_session(**kwargs)
+    if old is not None:
+        old.close()
+    return _session
+
+
+def route_template(path):
+    """`path` with numeric segments (recipe ids) replaced by {id}, so span names and metric labels stay bounded."""
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+
+def get(url, **kwargs):
+    """Drop-in replacement for requests.get that reuses pooled keep-alive connections."""
+    parsed = urlsplit(url)
+    with tracing.span(f'GET {route_template(parsed.path)}', 'http', host=parsed.netloc, path=parsed.path) as span:
+        response = get_session().get(url, **kwargs)
+        if span is not None:
+            retries = getattr(response.raw, 'retries', None)
+            span.set(status=response.status_code, retries=len(retries.history) if retries else 0)
+        return response
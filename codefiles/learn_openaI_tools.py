@@ -1,8 +1,4 @@
-import json
-
-from openai import AzureOpenAI
-from dotenv import load_dotenv
-import os
+from typing import Annotated
 
 from pydantic import BaseModel
 
@@ -16,13 +12,14 @@ class Answers(BaseModel):
     answers: list[Answer]
 
 
-import requests
-
-# Load environment variables
-load_dotenv()
-endpoint = os.getenv("ENDPOINT")
-key = os.getenv("OPENAI_KEY")
-deployment = os.getenv("MODEL")
+import cassette
+import clients
+from completion_cache import CachedClient
+from resilience import ResilientClient
+from streaming import StreamMetrics
+from structured_stream import stream_items
+from tool_executor import ToolExecutor
+from tool_registry import ToolRegistry
 
 
 def system_message(message):
@@ -33,91 +30,64 @@ def user_message(message):
     return {'role': 'user', 'content': message}
 
 
-def tool_message(message, tool_call_id):
-    return {'role': 'tool', 'content': str(message), 'tool_call_id': tool_call_id}
+TOOLS = ToolRegistry()
 
 
-def get_weather(city):
+@TOOLS.tool('getWeather', 'Get the weather information for a specific city')
+def get_weather(city: Annotated[str, 'The name of the city to get the weather information for']):
     return 'The weather in ' + city + ' is 75 degrees Fahrenheit. It is sunny with a light breeze.'
 
 
-def get_favourite_food(city):
+@TOOLS.tool('getFavouriteFood', 'Get the favourite food information for a specific city')
+def get_favourite_food(city: Annotated[str, 'The name of the city to get the favourite food information for']):
     return 'The favourite food in ' + city + ' is pizza.'
 
 
-if __name__ == "__main__":
-    client = AzureOpenAI(
-        azure_endpoint=endpoint,
-        api_key=key,
-        api_version='2024-08-01-preview'
-    )
+SYSTEM_PROMPT = ('You are an AI assistant that provides detailed information about cities. Respond '
+                 'accurately based on the given context.')
+
 
-    message = [system_message('You are an AI assistant that provides detailed information about cities. Respond '
-                              'accurately based on the given context.'),
-               user_message('What is the temperature in New York and mumbai? What is the favourite food in Mumbai?')]
+def function_definitions():
+    return TOOLS.definitions()
+
+
+def ask(client, question, stream=False, model=None):
+    """Answer a question about cities with tool calls and return the list of Answer objects.
+
+    `model` defaults to the MODEL setting, read on first use rather than at import.
+    """
+    deployment = model or clients.setting("MODEL")
+    message = [system_message(SYSTEM_PROMPT),
+               user_message(question)]
 
     response = client.chat.completions.create(
         model=deployment,
         messages=message,
-        tools=[
-            {
-                'type': 'function',
-                'function': {
-                    'name': 'getWeather',
-                    'description': 'Get the weather information for a specific city',
-                    'parameters': {
-                        'type': 'object',
-                        'properties': {
-                            'city': {
-                                'type': 'string',
-                                'description': 'The name of the city to get the weather information for'
-                            }
-                        },
-                        'required': ['city']
-                    }
-
-                }
-
-            },
-            {
-                'type': 'function',
-                'function': {
-                    'name': 'getFavouriteFood',
-                    'description': 'Get the favourite food information for a specific city',
-                    'parameters': {
-                        'type': 'object',
-                        'properties': {
-                            'city': {
-                                'type': 'string',
-                                'description': 'The name of the city to get the favourite food information for'
-                            }
-                        },
-                        'required': ['city']
-                    }
-
-                }
-            }
-        ]
+        tools=function_definitions()
     )
 
     if response.choices[0].finish_reason == 'tool_calls':
         message.append(response.choices[0].message)
-        for i in range(len(response.choices[0].message.tool_calls)):
-            tool_call = response.choices[0].message.tool_calls[i]
-            tool_call_id = tool_call.id
-            tool_call_name = tool_call.function.name
-            tool_call_arguments = json.loads(tool_call.function.arguments)
-            city = tool_call_arguments['city']
-            print(tool_call_name, city)
-            if tool_call_name == 'getWeather':
-                message.append(tool_message(get_weather(city), tool_call_id))
-            elif tool_call_name == 'getFavouriteFood':
-                message.append(tool_message(get_favourite_food(city), tool_call_id))
-            else:
-                print('Unknown function')
+        # Run every tool call of this turn at the same time; messages come back in tool_call order
+        with ToolExecutor(TOOLS) as executor:
+            tool_messages, results = executor.run_messages(response.choices[0].message.tool_calls)
+        for result in results:
+            print(result.name, result.arguments, f'{result.wall_time:.3f}s', result.error or '')
+        message.extend(tool_messages)
 
     print(message)
 
+    if stream:
+        # Each Answer is validated and handed over as soon as its closing brace arrives
+        metrics = StreamMetrics()
+        answers = []
+        for answer in stream_items(client, Answers, 'answers', item_model=Answer, metrics=metrics,
+                                   model=deployment, messages=message):
+            print(answer)
+            answers.append(answer)
+        print(metrics)
+        return answers
+
     response = client.beta.chat.completions.parse(
         model=deployment,
         messages=message,
@@ -126,6 +96,13 @@ if __name__ == "__main__":
     )
 
     print (response.choices[0].message.content)
+    return response.choices[0].message.parsed.answers
 
 
+if __name__ == "__main__":
+    stream_responses = clients.setting("STREAM_RESPONSES", "true").lower() == "true"
+    client = CachedClient(ResilientClient(clients.get_client()))
 
+    question = 'What is the temperature in New York and mumbai? What is the favourite food in Mumbai?'
+    with cassette.session('learn-stream' if stream_responses else 'learn', question):
+        ask(client, question, stream=stream_responses)
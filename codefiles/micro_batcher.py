@@ -0,0 +1,172 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pydantic import BaseModel
+
+import tracing
+from rate_limiter import get_limiter
+from structured_stream import json_schema_format
+from structuring_openai_api_call import complete, get_response, system_message, user_message
+from token_budget import count_text
+
+BATCH_WINDOW = float(os.getenv('MICRO_BATCH_WINDOW_MS', 50)) / 1000
+BATCH_MAX_SIZE = int(os.getenv('MICRO_BATCH_MAX_SIZE', 16))
+BATCH_TOKEN_BUDGET = int(os.getenv('MICRO_BATCH_TOKEN_BUDGET', 2000))
+
+BATCH_INSTRUCTION = ('You will receive a JSON list of independent questions, each with an id. Answer every '
+                     'question on its own and return one entry per id in "answers".')
+
+
+class BatchedAnswer(BaseModel):
+    id: int
+    answer: str
+
+
+class BatchedAnswers(BaseModel):
+    answers: list[BatchedAnswer]
+
+
+class _Pending:
+    def __init__(self, question, tokens):
+        self.question = question
+        self.tokens = tokens
+        self.future = Future()
+
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Collect independent questions for up to `window` seconds and answer them with a single completion.
+
+    Every submit() returns a Future. A collector thread packs waiting questions into one request until the
+    window closes, `max_batch` questions are waiting or their prompt tokens would pass `token_budget`. The model
+    answers through a structured {id, answer} schema, and each answer resolves its own Future. When a batched
+    reply cannot be parsed, the affected questions are sent again as single get_response calls. Batches go
+    through the deployment's rate limiter, so one request spends a single RPM slot for many questions.
+
+    Batches are plain chat.completions.create calls validated here against BatchedAnswers, so they work on a
+    CachedClient the same way as on a raw client, and cache hits skip the limiter.
+    """
+
+    def __init__(self, client, model, system_prompt, window=BATCH_WINDOW, max_batch=BATCH_MAX_SIZE,
+                 token_budget=BATCH_TOKEN_BUDGET, limiter=None, max_workers=4):
+        self.client = client
+        self.model = model
+        self.system_prompt = system_prompt
+        self.window = window
+        self.max_batch = max_batch
+        self.token_budget = token_budget
+        self.limiter = limiter or get_limiter(model)
+        self.stats = {'questions': 0, 'batches': 0, 'fallbacks': 0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='micro-batch')
+        # Separate pool so batch workers can hand off fallbacks while close() is draining self._pool
+        self._fallback_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='micro-batch-single')
+        self._collector = threading.Thread(target=self._collect, name='micro-batch-collector', daemon=True)
+        self._collector.start()
+
+    def submit(self, question):
+        pending = _Pending(question, count_text(self.model, question))
+        self._queue.put(pending)
+        return pending.future
+
+    def ask(self, question, timeout=None):
+        """Blocking helper: submit one question and wait for its answer."""
+        return self.submit(question).result(timeout=timeout)
+
+    def _collect(self):
+        carry = None
+        while True:
+            first = carry or self._queue.get()
+            carry = None
+            if first is _STOP:
+                return
+            batch, tokens = [first], first.tokens
+            deadline = time.monotonic() + self.window
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                if tokens + item.tokens > self.token_budget:
+                    # Goes first into the next batch instead of overflowing this one
+                    carry = item
+                    break
+                batch.append(item)
+                tokens += item.tokens
+            self._pool.submit(self._run_batch, batch)
+            if stop:
+                return
+
+    def _run_single(self, pending):
+        try:
+            answer = get_response(self.client, self.model,
+                                  [system_message(self.system_prompt), user_message(pending.question)],
+                                  limiter=self.limiter)
+            pending.future.set_result(answer)
+        except Exception as e:
+            pending.future.set_exception(e)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _run_batch(self, batch):
+        self._count('questions', len(batch))
+        if len(batch) == 1:
+            self._run_single(batch[0])
+            return
+
+        self._count('batches')
+        messages = [
+            system_message(f'{self.system_prompt}\n{BATCH_INSTRUCTION}'),
+            user_message(json.dumps([{'id': i, 'question': p.question} for i, p in enumerate(batch, 1)]))
+        ]
+        answers = {}
+        with tracing.span('micro_batch', size=len(batch)):
+            try:
+                response = complete(self.client, self.model, messages, self.limiter,
+                                    response_format=json_schema_format(BatchedAnswers))
+                content = response.choices[0].message.content
+                if content:
+                    parsed = BatchedAnswers.model_validate_json(content)
+                    answers = {item.id: item.answer for item in parsed.answers}
+            except Exception as e:
+                print(f"Batched request failed, answering {len(batch)} questions one by one: {e}")
+
+        missing = []
+        for i, pending in enumerate(batch, 1):
+            if i in answers:
+                pending.future.set_result(answers[i])
+            else:
+                missing.append(pending)
+        if missing:
+            self._count('fallbacks', len(missing))
+            for pending in missing:
+                self._fallback_pool.submit(self._run_single, pending)
+
+    def close(self):
+        """Flush the questions already submitted and stop the collector."""
+        self._queue.put(_STOP)
+        self._collector.join()
+        self._pool.shutdown(wait=True)
+        self._fallback_pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
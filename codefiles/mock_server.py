@@ -0,0 +1,563 @@
+"""Local stand-in for the Azure OpenAI and Spoonacular endpoints used by the scripts in this folder.
+
+Usage: python mock_server.py [--port 8089] [--llm-latency lognormal:300:0.4] [--error-rate 0.01]
+
+Point the scripts at it with ENDPOINT=http://127.0.0.1:8089 and SPOONACULAR_BASE_URL=http://127.0.0.1:8089.
+It also stands in for the Batch API: /openai/files uploads and /openai/batches jobs that answer every line of
+the input file with the same fake completions, after --batch-latency.
+"""
+import argparse
+import email
+import email.policy
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STOP_WORDS = {'a', 'an', 'the', 'of', 'is', 'in', 'for', 'to', 'and', 'what', 'with', 'me', 'give', 'how',
+              'on', 'as', 'are', 'do', 'i', 'please', 'step'}
+# Intent words that pick the tool but are dropped from the rewritten search query
+INTENT_WORDS = {'find', 'recipe', 'nutrition', 'nutritional', 'calories', 'cook', 'weather', 'temperature'}
+
+
+class Latency:
+    """Latency distribution parsed from 'fixed:MS', 'uniform:LO:HI', 'normal:MEAN:SD' or 'lognormal:MEDIAN:SIGMA'."""
+
+    def __init__(self, spec='fixed:0', rng=None):
+        self.spec = spec
+        parts = spec.split(':')
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        """Return one delay in seconds."""
+        if self.kind == 'fixed':
+            ms = self.params[0] if self.params else 0.0
+        elif self.kind == 'uniform':
+            ms = self.rng.uniform(self.params[0], self.params[1])
+        elif self.kind == 'normal':
+            ms = self.rng.gauss(self.params[0], self.params[1])
+        elif self.kind == 'lognormal':
+            # Parameterized by the median so 'lognormal:300:0.5' centres on 300ms with a long right tail
+            ms = self.params[0] * self.rng.lognormvariate(0, self.params[1])
+        else:
+            raise ValueError(f'Unknown latency distribution: {self.spec}')
+        return max(0.0, ms) / 1000
+
+
+class MockConfig:
+    def __init__(self, llm_latency='fixed:0', token_latency='fixed:0', spoonacular_latency='fixed:0',
+                 error_rate=0.0, error_status=429, retry_after_ms=100, seed=None, batch_latency='fixed:0'):
+        rng = random.Random(seed)
+        self.llm_latency = Latency(llm_latency, rng)
+        self.token_latency = Latency(token_latency, rng)
+        self.spoonacular_latency = Latency(spoonacular_latency, rng)
+        self.batch_latency = Latency(batch_latency, rng)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after_ms = retry_after_ms
+        self.rng = rng
+
+
+def words(text):
+    return re.findall(r"[A-Za-z0-9']+", text or '')
+
+
+def short_query(text, limit=3):
+    """Mimic the model's query rewrite: the first few meaningful words of the user text."""
+    kept = [w for w in words(text) if w.lower() not in STOP_WORDS | INTENT_WORDS]
+    return ' '.join(kept[:limit]).lower() or 'pasta'
+
+
+def message_text(message):
+    content = message.get('content')
+    if isinstance(content, list):
+        return ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content or ''
+
+
+def count_tokens(text):
+    return len(re.findall(r"\w+|[^\w\s]", text or ''))
+
+
+def choose_tools(tools, text):
+    """Pick the tools whose name/description overlaps most with the user text (at least one)."""
+    lowered = set(w.lower() for w in words(text))
+    scored = []
+    for tool in tools:
+        function = tool.get('function', {})
+        name_words = re.findall(r'[A-Z]?[a-z]+', function.get('name', ''))
+        vocabulary = set(w.lower() for w in name_words) | set(w.lower() for w in words(function.get('description')))
+        vocabulary -= STOP_WORDS
+        scored.append((len(vocabulary & lowered), tool))
+    best = max(score for score, _ in scored)
+    chosen = [tool for score, tool in scored if score == best and score > 0]
+    return chosen or [tools[0]]
+
+
+def arguments_for(tool, text):
+    parameters = tool.get('function', {}).get('parameters', {})
+    arguments = {}
+    for name, schema in parameters.get('properties', {}).items():
+        if schema.get('type') in ('integer', 'number'):
+            arguments[name] = 1
+        elif schema.get('type') == 'boolean':
+            arguments[name] = True
+        elif name == 'xpath':
+            arguments[name] = f'//*[@id="{short_query(text, 2).replace(" ", "-")}"]'
+        else:
+            arguments[name] = short_query(text)
+    return arguments
+
+
+def instance_from_schema(schema, root=None, hint='mock', array_length=3):
+    """Build a small JSON value that validates against `schema` (objects, arrays, $ref, enums, primitives)."""
+    root = root or schema
+    if '$ref' in schema:
+        name = schema['$ref'].split('/')[-1]
+        return instance_from_schema(root.get('$defs', root.get('definitions', {}))[name], root, hint, array_length)
+    if 'anyOf' in schema:
+        return instance_from_schema(schema['anyOf'][0], root, hint, array_length)
+    if 'enum' in schema:
+        return schema['enum'][0]
+    kind = schema.get('type')
+    if kind == 'object' or 'properties' in schema:
+        return {name: instance_from_schema(sub, root, f'{hint} {name}', array_length)
+                for name, sub in schema.get('properties', {}).items()}
+    if kind == 'array':
+        return [instance_from_schema(schema.get('items', {}), root, f'{hint} {i + 1}')
+                for i in range(array_length)]
+    if kind in ('integer', 'number'):
+        # Array items get their position as hint, so ids inside a list come out as 1, 2, 3
+        positions = re.findall(r'\d+', hint)
+        return int(positions[-1]) if positions else 1
+    if kind == 'boolean':
+        return True
+    return f'{hint} value'
+
+
+def list_length(text, default=3):
+    """Number of items when the prompt is a JSON list (e.g. micro-batched questions), so answers line up."""
+    try:
+        items = json.loads(text)
+    except ValueError:
+        return default
+    return len(items) if isinstance(items, list) and items else default
+
+
+def fake_completion(body):
+    """Return (message dict, finish_reason) for a chat completion request body."""
+    messages = body.get('messages', [])
+    last = messages[-1] if messages else {}
+    tools = body.get('tools')
+    text = message_text(last)
+
+    if tools and last.get('role') == 'user' and body.get('tool_choice') != 'none':
+        tool_calls = [{
+            'id': f'call_{uuid.uuid4().hex[:24]}',
+            'type': 'function',
+            'function': {'name': tool['function']['name'], 'arguments': json.dumps(arguments_for(tool, text))}
+        } for tool in choose_tools(tools, text)]
+        return {'role': 'assistant', 'content': None, 'tool_calls': tool_calls}, 'tool_calls'
+
+    response_format = body.get('response_format') or {}
+    if response_format.get('type') == 'json_schema':
+        schema = response_format.get('json_schema', {}).get('schema', {})
+        content = json.dumps(instance_from_schema(schema, array_length=list_length(text)))
+    elif response_format.get('type') == 'json_object':
+        content = json.dumps({'answer': f'Mock answer to: {text[:200]}'})
+    else:
+        context = ' '.join(message_text(m) for m in messages if m.get('role') == 'tool')[:200]
+        content = f'Mock answer to: {text[:200]}' + (f' (based on {context})' if context else '')
+    return {'role': 'assistant', 'content': content}, 'stop'
+
+
+def completion_for(body, deployment):
+    """A full chat.completion object for a request body."""
+    message, finish_reason = fake_completion(body)
+    return {
+        'id': f'chatcmpl-{uuid.uuid4().hex[:24]}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': deployment,
+        'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason, 'logprobs': None}],
+        'usage': usage_for(body, message)
+    }
+
+
+def parse_multipart(content_type, data):
+    """Map form field name -> (filename, bytes) for a multipart/form-data body."""
+    message = email.message_from_bytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + data,
+                                       policy=email.policy.HTTP)
+    return {part.get_param('name', header='content-disposition'): (part.get_filename(),
+                                                                    part.get_payload(decode=True))
+            for part in message.iter_parts()}
+
+
+def file_object(entry):
+    return {key: entry[key] for key in ('id', 'object', 'bytes', 'created_at', 'filename', 'purpose', 'status')}
+
+
+def store_file(server, filename, purpose, content):
+    entry = {'id': f'file-{uuid.uuid4().hex[:24]}', 'object': 'file', 'bytes': len(content),
+             'created_at': int(time.time()), 'filename': filename, 'purpose': purpose, 'status': 'processed',
+             'content': content}
+    with server.stats_lock:
+        server.files[entry['id']] = entry
+    return entry
+
+
+def update_batch(server, batch, **fields):
+    with server.stats_lock:
+        batch.update(fields)
+
+
+def batch_snapshot(server, batch):
+    with server.stats_lock:
+        return json.loads(json.dumps(batch))
+
+
+def run_batch_job(server, batch):
+    """Answer every line of a batch input file like the synchronous endpoint would, honouring cancellation."""
+    config = server.config
+    time.sleep(config.batch_latency.sample())
+    if batch['status'] == 'cancelling':
+        update_batch(server, batch, status='cancelled', cancelled_at=int(time.time()))
+        return
+    lines = [line for line in server.files[batch['input_file_id']]['content'].decode().splitlines() if line.strip()]
+    errors = []
+    seen = set()
+    for number, line in enumerate(lines, 1):
+        try:
+            request = json.loads(line)
+            if request['custom_id'] in seen:
+                raise ValueError(f"duplicate custom_id {request['custom_id']}")
+            seen.add(request['custom_id'])
+            request['body']['messages']
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append({'code': 'invalid_request', 'message': f'Invalid line: {e}', 'line': number})
+    if errors:
+        update_batch(server, batch, status='failed', failed_at=int(time.time()),
+                     errors={'object': 'list', 'data': errors})
+        return
+
+    update_batch(server, batch, status='in_progress', in_progress_at=int(time.time()),
+                 request_counts={'total': len(lines), 'completed': 0, 'failed': 0})
+    output, failed = [], []
+    for line in lines:
+        if batch['status'] == 'cancelling':
+            break
+        request = json.loads(line)
+        result = {'id': f'batch_req_{uuid.uuid4().hex[:24]}', 'custom_id': request['custom_id'], 'error': None}
+        if config.error_rate and config.rng.random() < config.error_rate:
+            status = config.error_status
+            result['response'] = {'status_code': status, 'request_id': uuid.uuid4().hex,
+                                  'body': {'error': {'code': str(status), 'message': 'Injected mock failure'}}}
+            failed.append(result)
+            counter = 'failed'
+        else:
+            deployment = request['body'].get('model', 'mock')
+            result['response'] = {'status_code': 200, 'request_id': uuid.uuid4().hex,
+                                  'body': completion_for(request['body'], deployment)}
+            output.append(result)
+            counter = 'completed'
+        with server.stats_lock:
+            batch['request_counts'][counter] += 1
+            server.stats['openai.batch.requests'] = server.stats.get('openai.batch.requests', 0) + 1
+
+    cancelled = batch['status'] == 'cancelling'
+    update_batch(server, batch, status='finalizing', finalizing_at=int(time.time()))
+    if output:
+        update_batch(server, batch, output_file_id=store_file(
+            server, f"{batch['id']}_output.jsonl", 'batch_output',
+            ''.join(json.dumps(r) + '\n' for r in output).encode())['id'])
+    if failed:
+        update_batch(server, batch, error_file_id=store_file(
+            server, f"{batch['id']}_error.jsonl", 'batch_output',
+            ''.join(json.dumps(r) + '\n' for r in failed).encode())['id'])
+    if cancelled:
+        update_batch(server, batch, status='cancelled', cancelled_at=int(time.time()))
+    else:
+        update_batch(server, batch, status='completed', completed_at=int(time.time()))
+
+
+def usage_for(body, message):
+    prompt = sum(count_tokens(message_text(m)) + 4 for m in body.get('messages', []))
+    prompt += count_tokens(json.dumps(body.get('tools'))) if body.get('tools') else 0
+    completion = count_tokens(message.get('content') or '') + sum(
+        count_tokens(call['function']['arguments']) + 5 for call in message.get('tool_calls') or [])
+    return {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion}
+
+
+def embedding_for(text, dim=64):
+    vector = [0.0] * dim
+    for word in words(text.lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1.0
+    return vector
+
+
+def nutrients_for(recipe_id):
+    rng = random.Random(recipe_id)
+    names = [('Calories', 'kcal'), ('Fat', 'g'), ('Saturated Fat', 'g'), ('Carbohydrates', 'g'),
+             ('Net Carbohydrates', 'g'), ('Sugar', 'g'), ('Cholesterol', 'mg'), ('Sodium', 'mg')]
+    return [{'name': name, 'amount': round(rng.uniform(1, 600), 2), 'unit': unit,
+             'percentOfDailyNeeds': round(rng.uniform(1, 80), 2)} for name, unit in names]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    server_version = 'MockAzureSpoonacular/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _count(self, route):
+        with self.server.stats_lock:
+            self.server.stats[route] = self.server.stats.get(route, 0) + 1
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self):
+        if self.config.error_rate and self.config.rng.random() < self.config.error_rate:
+            self._count('errors')
+            status = self.config.error_status
+            headers = {'retry-after-ms': str(self.config.retry_after_ms),
+                       'retry-after': str(max(1, self.config.retry_after_ms // 1000))} if status == 429 else {}
+            self._send_json(status, {'error': {'code': str(status), 'message': 'Injected mock failure'}}, headers)
+            return True
+        return False
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_bytes(self, status, body, content_type='application/octet-stream'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _batch_get(self, path):
+        match = re.fullmatch(r'/openai/files/([^/]+)(/content)?', path)
+        if match:
+            entry = self.server.files.get(match.group(1))
+            if entry is None:
+                self._send_json(404, {'error': {'message': f'No file {match.group(1)}'}})
+                return True
+            self._count('openai.files.content' if match.group(2) else 'openai.files.retrieve')
+            if match.group(2):
+                self._send_bytes(200, entry['content'])
+                return True
+            self._send_json(200, file_object(entry))
+            return True
+
+        match = re.fullmatch(r'/openai/batches/([^/]+)', path)
+        if match:
+            batch = self.server.batches.get(match.group(1))
+            if batch is None:
+                self._send_json(404, {'error': {'message': f'No batch {match.group(1)}'}})
+                return True
+            self._count('openai.batches.retrieve')
+            self._send_json(200, batch_snapshot(self.server, batch))
+            return True
+        return False
+
+    def _batch_post(self, path, content):
+        if path == '/openai/files':
+            fields = parse_multipart(self.headers.get('Content-Type'), content)
+            filename, data = fields['file']
+            purpose = fields.get('purpose', (None, b'batch'))[1].decode()
+            self._count('openai.files.create')
+            self._send_json(200, file_object(store_file(self.server, filename, purpose, data)))
+            return True
+
+        if path == '/openai/batches':
+            body = json.loads(content or b'{}')
+            if body.get('input_file_id') not in self.server.files:
+                self._send_json(400, {'error': {'message': f"No file {body.get('input_file_id')}"}})
+                return True
+            batch = {'id': f'batch_{uuid.uuid4().hex[:24]}', 'object': 'batch', 'endpoint': body.get('endpoint'),
+                     'input_file_id': body['input_file_id'], 'completion_window': body.get('completion_window'),
+                     'status': 'validating', 'created_at': int(time.time()), 'output_file_id': None,
+                     'error_file_id': None, 'errors': None, 'metadata': body.get('metadata'),
+                     'request_counts': {'total': 0, 'completed': 0, 'failed': 0}}
+            with self.server.stats_lock:
+                self.server.batches[batch['id']] = batch
+            self._count('openai.batches.create')
+            snapshot = batch_snapshot(self.server, batch)
+            threading.Thread(target=run_batch_job, args=(self.server, batch), daemon=True).start()
+            self._send_json(200, snapshot)
+            return True
+
+        match = re.fullmatch(r'/openai/batches/([^/]+)/cancel', path)
+        if match and match.group(1) in self.server.batches:
+            batch = self.server.batches[match.group(1)]
+            if batch['status'] in ('validating', 'in_progress'):
+                update_batch(self.server, batch, status='cancelling', cancelling_at=int(time.time()))
+            self._count('openai.batches.cancel')
+            self._send_json(200, batch_snapshot(self.server, batch))
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/openai/') and self._batch_get(url.path):
+            return
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        time.sleep(self.config.spoonacular_latency.sample())
+        if self._maybe_fail():
+            return
+
+        if url.path == '/recipes/complexSearch':
+            self._count('spoonacular.complexSearch')
+            text = query.get('query', '')
+            if not text or 'xyz' in text.lower():
+                return self._send_json(200, {'results': [], 'totalResults': 0})
+            recipe_id = zlib.crc32(text.lower().encode()) % 1000000
+            result = {'id': recipe_id, 'title': text.title(), 'image': f'https://img.mock/{recipe_id}.jpg'}
+            if query.get('addRecipeNutrition') == 'true':
+                result['nutrition'] = {'nutrients': nutrients_for(recipe_id)}
+            return self._send_json(200, {'results': [result], 'totalResults': 1})
+
+        match = re.fullmatch(r'/recipes/(\d+)/nutritionWidget\.json', url.path)
+        if match:
+            self._count('spoonacular.nutritionWidget')
+            return self._send_json(200, {'nutrients': nutrients_for(int(match.group(1)))})
+
+        self._send_json(404, {'error': {'message': f'No mock route for GET {url.path}'}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.startswith(('/openai/files', '/openai/batches')):
+            length = int(self.headers.get('Content-Length') or 0)
+            if not self._batch_post(url.path, self.rfile.read(length)):
+                self._send_json(404, {'error': {'message': f'No mock route for POST {url.path}'}})
+            return
+        body = self._read_json()
+
+        match = re.fullmatch(r'/openai/deployments/([^/]+)/(chat/completions|embeddings)', url.path)
+        if not match:
+            return self._send_json(404, {'error': {'message': f'No mock route for POST {url.path}'}})
+        deployment, route = match.groups()
+
+        time.sleep(self.config.llm_latency.sample())
+        if self._maybe_fail():
+            return
+
+        if route == 'embeddings':
+            self._count('openai.embeddings')
+            inputs = body.get('input')
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            data = [{'object': 'embedding', 'index': i, 'embedding': embedding_for(text)}
+                    for i, text in enumerate(inputs)]
+            tokens = sum(count_tokens(text) for text in inputs)
+            return self._send_json(200, {'object': 'list', 'data': data, 'model': deployment,
+                                         'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}})
+
+        self._count('openai.chat.completions')
+        completion = completion_for(body, deployment)
+        if body.get('stream'):
+            include_usage = (body.get('stream_options') or {}).get('include_usage')
+            choice = completion['choices'][0]
+            return self._stream(completion['id'], deployment, choice['message'], choice['finish_reason'],
+                                completion['usage'] if include_usage else None)
+
+        self._send_json(200, completion)
+
+    def _stream(self, completion_id, deployment, message, finish_reason, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish=None, chunk_usage=None, choices=True):
+            payload = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                       'model': deployment,
+                       'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish, 'logprobs': None}]
+                       if choices else []}
+            if chunk_usage is not None:
+                payload['usage'] = chunk_usage
+            self.wfile.write(f'data: {json.dumps(payload)}\n\n'.encode())
+            self.wfile.flush()
+
+        chunk({'role': 'assistant', 'content': ''})
+        for index, call in enumerate(message.get('tool_calls') or []):
+            arguments = call['function']['arguments']
+            half = len(arguments) // 2
+            chunk({'tool_calls': [{'index': index, 'id': call['id'], 'type': 'function',
+                                   'function': {'name': call['function']['name'], 'arguments': ''}}]})
+            for piece in (arguments[:half], arguments[half:]):
+                time.sleep(self.config.token_latency.sample())
+                chunk({'tool_calls': [{'index': index, 'function': {'arguments': piece}}]})
+        for piece in re.findall(r'\S+\s*', message.get('content') or ''):
+            time.sleep(self.config.token_latency.sample())
+            chunk({'content': piece})
+        chunk({}, finish=finish_reason)
+        if usage is not None:
+            chunk(None, chunk_usage=usage, choices=False)
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+
+def start_mock_server(config=None, host='127.0.0.1', port=0):
+    """Start the mock server on a background thread and return (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.config = config or MockConfig()
+    server.stats = {}
+    server.stats_lock = threading.Lock()
+    server.files = {}
+    server.batches = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Azure OpenAI + Spoonacular server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--llm-latency', default='lognormal:300:0.4')
+    parser.add_argument('--token-latency', default='fixed:10')
+    parser.add_argument('--spoonacular-latency', default='lognormal:120:0.3')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=429)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--batch-latency', default='fixed:2000', help='Delay before a batch job starts')
+    args = parser.parse_args()
+
+    config = MockConfig(args.llm_latency, args.token_latency, args.spoonacular_latency, args.error_rate,
+                        args.error_status, seed=args.seed, batch_latency=args.batch_latency)
+    server, url = start_mock_server(config, args.host, args.port)
+    print(f'Mock server listening on {url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
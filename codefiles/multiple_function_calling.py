@@ -1,10 +1,19 @@
-import json
+from typing import Annotated
 
-from openai import AzureOpenAI
-from dotenv import load_dotenv
 import os
 import requests
 
+import cassette
+import clients
+import http_session
+import spoonacular_cache
+from single_flight import coalesce
+from tool_registry import ToolRegistry, UnknownToolError
+
+SPOONACULAR_BASE_URL = os.getenv('SPOONACULAR_BASE_URL', 'https://api.spoonacular.com')
+
+TOOLS = ToolRegistry()
+
 
 def system_message(message):
     return {
@@ -27,84 +36,135 @@ def assistant_message(message):
     }
 
 
-def get_recipe(query, api_key):
-    url = f'https://api.spoonacular.com/recipes/complexSearch?query={query}&number=1&apiKey={api_key}'
-    resp = requests.get(url)
-    if resp.status_code == 200:
-        data = resp.json()
-        if data['results']:
-            return (data['results'][0]['id'], data['results'][0]['title'])
-        else:
-            return None
+@coalesce('recipe')
+@spoonacular_cache.cached('recipe')
+def search_recipe(query, api_key):
+    url = f'{SPOONACULAR_BASE_URL}/recipes/complexSearch?query={query}&number=1&apiKey={api_key}'
+    resp = http_session.get(url)
+    resp.raise_for_status()
+    data = resp.json()
+    if data['results']:
+        return (data['results'][0]['id'], data['results'][0]['title'])
+    else:
+        return None
+
+
+@coalesce('nutrition')
+@spoonacular_cache.cached('nutrition')
+def fetch_nutrition_widget(id, api_key):
+    url = f'{SPOONACULAR_BASE_URL}/recipes/{id}/nutritionWidget.json?apiKey={api_key}'
+    resp = http_session.get(url)
+    resp.raise_for_status()
+    data = resp.json()
+    return [data['nutrients'][i] for i in range(0, 5)]
+
+
+@coalesce('recipe_nutrition')
+@spoonacular_cache.cached('recipe_nutrition')
+def search_recipe_with_nutrition(query, api_key):
+    url = (f'{SPOONACULAR_BASE_URL}/recipes/complexSearch?query={query}&number=1&addRecipeNutrition=true'
+           f'&apiKey={api_key}')
+    resp = http_session.get(url)
+    resp.raise_for_status()
+    data = resp.json()
+    if data['results']:
+        nutrients = data['results'][0].get('nutrition', {}).get('nutrients')
+        return (data['results'][0]['id'], data['results'][0]['title'], nutrients[:5] if nutrients else None)
     else:
-        print(f"Error in fetching recipe: {resp.text}")
+        return None
+
+
+def get_recipe(query, api_key):
+    try:
+        return search_recipe(query, api_key)
+    except requests.exceptions.RequestException as e:
+        print(f"Error in fetching recipe: {e}")
         return None
 
 
 def get_nutritional_details(query, api_key):
-    id = get_recipe(query, api_key)[0]
-    if not id:
+    # One complexSearch with addRecipeNutrition; only fall back to the widget endpoint if that has no nutrients
+    try:
+        recipe = search_recipe_with_nutrition(query, api_key)
+    except requests.exceptions.RequestException as e:
+        print(f"Error in fetching recipe with nutrition: {e}")
+        recipe = get_recipe(query, api_key)
+    if not recipe:
         return None
+    elif len(recipe) == 3 and recipe[2]:
+        return recipe[2]
     else:
-        url = f'https://api.spoonacular.com/recipes/{id}/nutritionWidget.json?apiKey={api_key}'
-        resp = requests.get(url)
-        if resp.status_code == 200:
-            data = resp.json()
-            data = [data['nutrients'][i] for i in range(0, 5)]
-            return data
-        else:
-            print(f"Error in fetching nutritional details: {resp.text}")
+        try:
+            return fetch_nutrition_widget(recipe[0], api_key)
+        except requests.exceptions.RequestException as e:
+            print(f"Error in fetching nutritional details: {e}")
             return None
 
 
+SearchQuery = Annotated[str, 'optimised Search query for recipe']
+
+
+@TOOLS.tool('getSearchQuery', 'Retrieves the title of the recipe using the search query',
+            args={'searchQuery': 'query'}, context=('api_key',))
+def recipe_title(query: SearchQuery, api_key):
+    print('optimized query:', query)
+    recipe = get_recipe(query, api_key)
+    return recipe[1] if recipe else None
+
+
+@TOOLS.tool('getNutritionalDetails', 'Fetches nutritional details using the search query',
+            args={'searchQuery': 'query'}, context=('api_key',))
+def recipe_nutrition(query: SearchQuery, api_key):
+    print('optimized query:', query)
+    return get_nutritional_details(query, api_key)
+
+
 def function_definitions():
-    return [
-        {
-            'type': 'function',
-            'function': {
-                'name': 'getSearchQuery',
-                'description': 'Retrieves the title of the recipe using the search query',
-                'parameters': {
-                    'type': 'object',
-                    'properties': {
-                        'searchQuery': {
-                            'type': 'string',
-                            'description': 'optimised Search query for recipe'
-                        }
-                    },
-                    'required': ['searchQuery']
-                }
-
-            }
-        },
-        {
-            'type': 'function',
-            'function': {
-                'name': 'getNutritionalDetails',
-                'description': 'Fetches nutritional details using the search query',
-                'parameters': {
-                    'type': 'object',
-                    'properties': {
-                        'searchQuery': {
-                            'type': 'string',
-                            'description': 'optimised Search query for recipe'
-                        }
-                    },
-                    'required': ['searchQuery']
-                }
-            }
-        }
+    return TOOLS.definitions()
+
+
+SYSTEM_PROMPT = ('You are an assistant that helps in finding recipes. You convert a big user query (that might '
+                 'have spelling mistakes) for recipes into optimized and correct recipe query in less than 3 '
+                 'words')
 
+
+def run_query(client, deployment, user_query, api_key, semantic_cache=None):
+    msgs = [
+        system_message(SYSTEM_PROMPT),
     ]
 
+    cached, vector = semantic_cache.lookup(user_query) if semantic_cache else (None, None)
+    if cached:
+        finish_reason = 'tool_calls'
+        function_name, arguments = cached['name'], cached['arguments']
+        print('Semantic cache hit:', cached['query'])
+    else:
+        resp = client.chat.completions.create(
+            model=deployment,
+            messages=msgs + [user_message(user_query)],
+            tools=function_definitions()
+        )
+        finish_reason = resp.choices[0].finish_reason
+        if finish_reason == 'tool_calls':
+            function_name = resp.choices[0].message.tool_calls[0].function.name
+            arguments = resp.choices[0].message.tool_calls[0].function.arguments
+            if semantic_cache:
+                semantic_cache.add(user_query, function_name, arguments, vector)
+
+    if finish_reason == 'tool_calls':
+        print('Function name:', function_name)
+        try:
+            return TOOLS.dispatch(function_name, arguments, api_key=api_key)
+        except UnknownToolError:
+            print('Unknown function called:', function_name)
+    else:
+        print("No tool calls found")
+        print(finish_reason)
+    return None
+
 
 if __name__ == "__main__":
-    load_dotenv()
-
-    endpoint = os.getenv("ENDPOINT")
-    key = os.getenv("OPENAI_KEY")
-    deployment = os.getenv("MODEL")
-    SPOONACULAR_API_KEY = os.getenv("SPOONACULAR_API_KEY")
+    deployment, SPOONACULAR_API_KEY = clients.require('MODEL', 'SPOONACULAR_API_KEY')
     # answer = get_recipe('pasta',SPOONACULAR_API_KEY)
     # if not answer:
     #     print("Error in fetching recipe")
@@ -112,41 +172,14 @@ if __name__ == "__main__":
     #     print(answer)
     # exit(0)
 
-    client = AzureOpenAI(
-        azure_endpoint=endpoint,
-        api_key=key,
-        api_version='2024-08-01-preview'
-    )
-
-    msgs = [
-        system_message('You are an assistant that helps in finding recipes. You convert a big user query (that might '
-                       'have spelling mistakes) for recipes into optimized and correct recipe query in less than 3 '
-                       'words'),
-    ]
+    client = clients.get_client()
 
     user_query = [' nutrition of White Sauce Pasta with garlic naan is ?']
 
-    resp = client.chat.completions.create(
-        model=deployment,
-        messages=msgs + [user_message(user_query[0])],
-        tools=function_definitions()
-    )
-
-    if resp.choices[0].finish_reason == 'tool_calls':
-        function_name = resp.choices[0].message.tool_calls[0].function.name
-        print('Function name:', function_name)
-        if function_name == 'getSearchQuery':
-            query = resp.choices[0].message.tool_calls[0].function.arguments
-            query = json.loads(query)
-            query = query['searchQuery']
-            print('optimized query:', query)
-            print(get_recipe(query, SPOONACULAR_API_KEY)[1])
-        elif function_name == 'getNutritionalDetails':
-            query = resp.choices[0].message.tool_calls[0].function.arguments
-            query = json.loads(query)
-            query = query['searchQuery']
-            print('optimized query:', query)
-            print(get_nutritional_details(query, SPOONACULAR_API_KEY))
-    else:
-        print("No tool calls found")
-        print(resp.choices[0].finish_reason)
+    # Near-duplicate phrasings reuse the stored tool call and skip the rewrite completion
+    semantic_cache = None
+    if clients.setting('EMBEDDING_MODEL'):
+        from semantic_cache import SemanticCache
+        semantic_cache = SemanticCache(client, path='.semantic_cache_recipes')
+    with cassette.session('recipes', user_query[0]):
+        print(run_query(client, deployment, user_query[0], SPOONACULAR_API_KEY, semantic_cache))
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+import token_budget
+import tracing
+
+DEFAULT_RPM = int(os.getenv('AZURE_RPM', 60))
+DEFAULT_TPM = int(os.getenv('AZURE_TPM', 60000))
+DEFAULT_COMPLETION_TOKENS = int(os.getenv('AZURE_COMPLETION_TOKEN_ESTIMATE', 500))
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `per_minute / 60` units per second."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 when they already are)."""
+        self._refill(now)
+        # A request bigger than the whole bucket can never fit; let it through once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount):
+        self.level -= amount
+
+    def refund(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Client-side RPM + TPM limiter for one deployment with first-come, first-served queuing.
+
+    Callers block in acquire() until both buckets can cover their request, in arrival order, so a large
+    request is not starved by a stream of small ones. A 429 with Retry-After pauses the whole queue.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._paused_until = 0.0
+        self.stats = {'requests': 0, 'throttled': 0, 'waited_seconds': 0.0, 'estimated_tokens': 0,
+                      'actual_tokens': 0}
+
+    def acquire(self, tokens):
+        """Block until one request and `tokens` tokens can be spent, then spend them."""
+        ticket = object()
+        start = time.monotonic()
+        with self._condition:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] is ticket:
+                        wait = max(self._paused_until - now,
+                                   self.requests.wait_time(1, now),
+                                   self.tokens.wait_time(tokens, now))
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            break
+                    else:
+                        wait = None
+                    self._condition.wait(wait)
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+            self.stats['requests'] += 1
+            self.stats['estimated_tokens'] += tokens
+            self.stats['waited_seconds'] += time.monotonic() - start
+
+    def estimated_wait(self, tokens):
+        """Rough seconds a new request of `tokens` would queue, counting the callers already waiting."""
+        with self._condition:
+            now = time.monotonic()
+            return max(self._paused_until - now,
+                       self.requests.wait_time(1 + len(self._queue), now),
+                       self.tokens.wait_time(tokens, now))
+
+    def reconcile(self, estimated, actual):
+        """Correct the TPM bucket once response.usage tells us what the request really cost."""
+        with self._condition:
+            self.stats['actual_tokens'] += actual
+            if actual < estimated:
+                self.tokens.refund(estimated - actual)
+            else:
+                self.tokens.consume(actual - estimated)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        """Hold every queued caller for `seconds`, e.g. from a Retry-After header."""
+        with self._condition:
+            self.stats['throttled'] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def call(self, func, estimated_tokens, max_attempts=5, **kwargs):
+        """Run `func(**kwargs)` under the limiter, re-queuing on 429 after the server's Retry-After delay."""
+        import openai
+        for attempt in range(max_attempts):
+            queued = time.monotonic()
+            self.acquire(estimated_tokens)
+            tracing.annotate(queue_seconds=time.monotonic() - queued)
+            try:
+                response = func(**kwargs)
+            except openai.RateLimitError as e:
+                self.reconcile(estimated_tokens, 0)
+                if attempt == max_attempts - 1:
+                    raise
+                self.pause(retry_after_seconds(e.response))
+                tracing.incr('retries')
+                continue
+            except Exception:
+                # A failed request (timeout, 5xx, bad request) returns no usage, so refund the whole estimate
+                self.reconcile(estimated_tokens, 0)
+                raise
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                self.reconcile(estimated_tokens, usage.total_tokens)
+            return response
+
+
+def retry_after_seconds(response, default=1.0):
+    """Read Azure's retry-after-ms / retry-after headers from a 429 response."""
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return default
+
+
+def estimate_tokens(model, messages, max_tokens=None, tools=None):
+    """Up-front cost of a request as Azure counts it against TPM: prompt tokens plus max_tokens."""
+    return token_budget.count_request(model, messages, tools) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(deployment, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+    """Return the shared limiter for a deployment, creating it with the given quota on first use."""
+    with _limiters_lock:
+        if deployment not in _limiters:
+            _limiters[deployment] = RateLimiter(rpm, tpm)
+        return _limiters[deployment]
@@ -0,0 +1,184 @@
+"""Replay recorded sessions against the current code, offline, at the recorded pace or faster.
+
+Record with CASSETTE=sessions.jsonl python v2.py (or benchmark.py --record sessions.jsonl), then:
+
+Usage:
+    python replay.py sessions.jsonl                                  # recorded arrival times and server latency
+    python replay.py sessions.jsonl --speed 10 --concurrency 32 --repeat 5
+    python replay.py sessions.jsonl --speed max --json-out replay.json
+    python replay.py sessions.jsonl --speed max --baseline replay.json --max-regression 0.2
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cassette
+from benchmark import compare, peak_rss_mb, percentile
+
+REPLAY_ENDPOINT = 'http://cassette.invalid'
+
+
+def build_flows(client):
+    """Map a recorded session's flow name -> callable(query) that runs it against `client`."""
+    import learn_openaI_tools
+    import multiple_function_calling
+    import v2
+
+    model = os.environ['MODEL']
+    return {
+        'v2': lambda query: v2.answer_query(client, query),
+        'v2-stream': lambda query: v2.answer_query(client, query, stream=True),
+        'learn': lambda query: learn_openaI_tools.ask(client, query),
+        'learn-stream': lambda query: learn_openaI_tools.ask(client, query, stream=True),
+        'recipes': lambda query: multiple_function_calling.run_query(client, model, query, 'replay'),
+    }
+
+
+def schedule(sessions, speed, repeat=1, max_gap=5.0):
+    """(start offset in seconds, session) pairs keeping the recorded gaps between sessions, divided by `speed`.
+
+    Gaps longer than `max_gap` (e.g. between two recording runs) are shortened to it. With speed=None every
+    session starts at once and only the concurrency limit paces them.
+    """
+    plan = []
+    offset, previous = 0.0, None
+    for session in sorted(sessions, key=lambda s: s['ts']):
+        if previous is not None:
+            offset += min(max(0.0, session['ts'] - previous), max_gap)
+        previous = session['ts']
+        at = offset / speed if speed else 0.0
+        plan.extend((at, session) for _ in range(repeat))
+    return plan
+
+
+def replay(sessions, speed=1.0, concurrency=8, repeat=1, max_gap=5.0, warmup=True):
+    player = cassette.start_replay(sessions, speed)
+    import clients
+    import http_session
+    import spoonacular_cache
+
+    # Fresh clients built after start_replay() so their transports answer from the cassette; no retries,
+    # so a request missing from the cassette fails at once instead of backing off
+    client = clients.new_client(REPLAY_ENDPOINT, 'replay', max_retries=0)
+    http_session.configure(retries=0)
+    # Memory-only lookup cache, so results do not depend on this machine's .spoonacular_cache.sqlite3
+    spoonacular_cache._default_cache = spoonacular_cache.TwoTierCache(path=None)
+    flows = build_flows(client)
+
+    def run(at, session, started):
+        begin = time.perf_counter()
+        with player.session(session) as state:
+            try:
+                flows[session['flow']](session['input'])
+                error = None
+            except Exception as e:
+                error = repr(e)
+        return {'lag': begin - started - at, 'elapsed': time.perf_counter() - begin, 'error': error,
+                'stats': state.stats, 'recorded_elapsed': session.get('elapsed')}
+
+    if warmup:
+        # One untimed session per flow pays for the lazy imports and schema compilation the first call triggers
+        for flow in {session['flow'] for session in sessions if session['flow'] in flows}:
+            first = next(session for session in sessions if session['flow'] == flow)
+            with player.session(first), contextlib.suppress(Exception):
+                flows[flow](first['input'])
+
+    plan = [(at, session) for at, session in schedule(sessions, speed, repeat, max_gap) if session['flow'] in flows]
+    skipped = len(sessions) * repeat - len(plan)
+    futures = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay') as pool:
+        for at, session in plan:
+            delay = at - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(run, at, session, started))
+    wall = time.perf_counter() - started
+    cassette.stop()
+    return summarize([future.result() for future in futures], wall, concurrency, skipped)
+
+
+def summarize(runs, wall, concurrency, skipped=0):
+    ok = [run for run in runs if run['error'] is None and not run['stats']['missed']]
+    latencies = [run['elapsed'] for run in ok]
+    lags = [max(0.0, run['lag']) for run in runs]
+    matches = {}
+    for run in runs:
+        for key, value in run['stats'].items():
+            matches[key] = matches.get(key, 0) + value
+    recorded = [run['recorded_elapsed'] for run in runs if run['recorded_elapsed'] is not None]
+    return {
+        'requests': len(runs),
+        'concurrency': concurrency,
+        'errors': len(runs) - len(ok),
+        'skipped': skipped,
+        'p50_ms': 1000 * percentile(latencies, 50) if latencies else None,
+        'p95_ms': 1000 * percentile(latencies, 95) if latencies else None,
+        'p99_ms': 1000 * percentile(latencies, 99) if latencies else None,
+        'recorded_p50_ms': 1000 * percentile(recorded, 50) if recorded else None,
+        'lag_p95_ms': 1000 * percentile(lags, 95) if lags else None,
+        'throughput_rps': len(ok) / wall if wall else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'exchanges': matches,
+    }
+
+
+def parse_speed(value):
+    return None if value == 'max' else float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay recorded cassettes against the current code, offline.')
+    parser.add_argument('cassettes', nargs='+', help='Cassette files (.jsonl or .jsonl.gz)')
+    parser.add_argument('--speed', type=parse_speed, default=1.0,
+                        help='Time compression: 1 replays at the recorded pace, 10 ten times faster, max unpaced')
+    parser.add_argument('--concurrency', type=int, default=8, help='Sessions replayed at the same time')
+    parser.add_argument('--repeat', type=int, default=1, help='Replay every session this many times')
+    parser.add_argument('--max-gap', type=float, default=5.0, help='Longest pause kept between two sessions (s)')
+    parser.add_argument('--no-warmup', action='store_true', help='Include cold-start costs in the first sessions')
+    parser.add_argument('--json-out')
+    parser.add_argument('--baseline')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    sessions = [session for path in args.cassettes for session in cassette.load(path)]
+    if not sessions:
+        print('No sessions found in', ', '.join(args.cassettes))
+        return 1
+    # The flows read their configuration on first use; point it at the cassette instead of real services
+    os.environ.update({'ENDPOINT': REPLAY_ENDPOINT, 'OPENAI_KEY': 'replay', 'SPOONACULAR_API_KEY': 'replay',
+                       'SPOONACULAR_BASE_URL': REPLAY_ENDPOINT, 'STREAM_RESPONSES': 'false',
+                       'MODEL': sessions[0].get('model') or 'replay'})
+    os.environ.pop('EMBEDDING_MODEL', None)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = replay(sessions, args.speed, args.concurrency, args.repeat, args.max_gap, not args.no_warmup)
+
+    fmt = lambda value: f'{value:10.1f}' if value is not None else f'{"-":>10}'
+    print(f"{'sessions':>9}{'conc':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rec p50':>10}{'lag p95':>10}"
+          f"{'req/s':>10}{'errors':>8}")
+    print(f"{result['requests']:>9}{result['concurrency']:>6}{fmt(result['p50_ms'])}{fmt(result['p95_ms'])}"
+          f"{fmt(result['p99_ms'])}{fmt(result['recorded_p50_ms'])}{fmt(result['lag_p95_ms'])}"
+          f"{fmt(result['throughput_rps'])}{result['errors']:>8}")
+    print('exchanges:', json.dumps(result['exchanges'], sort_keys=True),
+          f"skipped sessions: {result['skipped']}" if result['skipped'] else '')
+
+    results = {f"replay@{args.concurrency}": result}
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print('REGRESSION', line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+from client_wrappers import Namespace
+
+HEDGE_QUANTILE = float(os.getenv('HEDGE_QUANTILE', 0.95))
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', 2.0))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 0.05))
+# At most this fraction of requests may send a duplicate, which caps the extra token spend
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', 0.1))
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', 30))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a deployment whose circuit breaker is open."""
+
+
+def is_outage(error):
+    """Errors that say the deployment is unhealthy. 4xx (including 429) are the caller's problem, not an outage."""
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies."""
+
+    def __init__(self, size=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive outage errors; after `reset_timeout` one trial call
+    is let through (half-open) and its outcome closes or re-opens the circuit."""
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go through right now."""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'closed':
+                return
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        tracing.incr('circuit_rejections')
+        raise CircuitOpenError(f'Circuit for {self.name} is open; retry in {retry_in:.1f}s')
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self, error):
+        if not is_outage(error):
+            # The deployment answered, so as far as availability goes this counts as a success
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"Circuit for {self.name} opened after {self.failures} failures: {error}")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(deployment):
+    """Return the shared circuit breaker for a deployment, creating it on first use."""
+    with _breakers_lock:
+        if deployment not in _breakers:
+            _breakers[deployment] = CircuitBreaker(deployment)
+        return _breakers[deployment]
+
+
+class Hedger:
+    """Send a duplicate request when the first one is slower than the recent p95, and keep the first answer.
+
+    The delay adapts per deployment from a LatencyTracker; until enough samples exist `default_delay` is used.
+    Only `budget` of all calls may hedge, so the extra cost is bounded. The losing request is left to finish
+    in the background and its result is dropped.
+    """
+
+    def __init__(self, quantile=HEDGE_QUANTILE, default_delay=HEDGE_DEFAULT_DELAY, min_delay=HEDGE_MIN_DELAY,
+                 budget=HEDGE_BUDGET, max_workers=64):
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.budget = budget
+        self.stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0}
+        self._latency = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+
+    def tracker(self, key):
+        with self._lock:
+            if key not in self._latency:
+                self._latency[key] = LatencyTracker()
+            return self._latency[key]
+
+    def delay(self, key):
+        observed = self.tracker(key).quantile(self.quantile)
+        return max(self.min_delay, observed if observed is not None else self.default_delay)
+
+    def _may_hedge(self):
+        with self._lock:
+            if self.stats['hedged'] + 1 > self.budget * self.stats['calls']:
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    def _timed(self, tracker, func, kwargs):
+        # Losers are recorded too, otherwise slow samples would vanish and the p95 would drift down
+        start = time.perf_counter()
+        result = func(**kwargs)
+        tracker.record(time.perf_counter() - start)
+        return result
+
+    def call(self, key, func, **kwargs):
+        with self._lock:
+            self.stats['calls'] += 1
+        tracker = self.tracker(key)
+        primary = self._pool.submit(contextvars.copy_context().run, self._timed, tracker, func, kwargs)
+        done, _ = wait([primary], timeout=self.delay(key))
+        futures = [primary]
+        if not done and self._may_hedge():
+            tracing.annotate(hedged=True)
+            futures.append(self._pool.submit(contextvars.copy_context().run, self._timed, tracker, func, kwargs))
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is not primary:
+                    with self._lock:
+                        self.stats['hedge_wins'] += 1
+                    tracing.annotate(hedge_won=True)
+                return future.result()
+        raise error
+
+
+class _ResilientCompletions:
+    def __init__(self, resilient, completions, kind):
+        self._resilient = resilient
+        self._completions = completions
+        self._kind = kind
+
+    def create(self, **kwargs):
+        return self._resilient.call(self._kind, self._completions.create, kwargs)
+
+    def parse(self, **kwargs):
+        return self._resilient.call(self._kind + '.parse', self._completions.parse, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class ResilientClient:
+    """Wrap an AzureOpenAI client with a per-deployment circuit breaker and hedged chat completions.
+
+    Streamed calls are guarded by the breaker but not hedged, since a stream is consumed after the call returns.
+    Every other attribute is forwarded to the wrapped client unchanged.
+
+    The breaker is keyed on the caller's `model`. A client that routes to several deployments itself (ClientPool,
+    marked by `routes_deployments`) keeps one breaker per real deployment, so no outer breaker is added there:
+    it would trip for the whole pool when a single deployment fails. Pass `breaker` to override.
+    """
+
+    def __init__(self, client, hedger=None, hedge=True, breaker=None):
+        self.client = client
+        self.hedger = hedger or Hedger()
+        self.hedge = hedge
+        self.breaker = not getattr(client, 'routes_deployments', False) if breaker is None else breaker
+        self.chat = Namespace(client.chat,
+                              completions=_ResilientCompletions(self, client.chat.completions, 'chat'))
+        self.beta = Namespace(client.beta,
+                              chat=Namespace(client.beta.chat,
+                                             completions=_ResilientCompletions(self, client.beta.chat.completions,
+                                                                               'beta.chat')))
+
+    def _send(self, kind, func, kwargs):
+        if self.hedge and not kwargs.get('stream'):
+            return self.hedger.call(f"{kwargs.get('model', '')}:{kind}", func, **kwargs)
+        return func(**kwargs)
+
+    def call(self, kind, func, kwargs):
+        if not self.breaker:
+            return self._send(kind, func, kwargs)
+        breaker = get_breaker(kwargs.get('model', ''))
+        breaker.allow()
+        try:
+            result = self._send(kind, func, kwargs)
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+        breaker.record_success()
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL')
+DEFAULT_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92))
+
+
+class SemanticCache:
+    """Reuse the tool call chosen for a past query when a new query embeds close enough to it.
+
+    Vectors live in a float32 memory-mapped file (`<path>.npy`) and the matching tool name/arguments in an
+    append-only JSONL sidecar (`<path>.jsonl`), so the index survives restarts without loading it into RAM.
+    Vectors are L2-normalized on insert, which makes cosine similarity a single matrix-vector product.
+    """
+
+    def __init__(self, client, path='.semantic_cache', model=EMBEDDING_MODEL, threshold=DEFAULT_THRESHOLD,
+                 initial_capacity=1024):
+        self.client = client
+        self.model = model
+        self.threshold = threshold
+        self.vectors_path = path + '.npy'
+        self.meta_path = path + '.jsonl'
+        self._lock = threading.Lock()
+        self._entries = []
+        self._vectors = None
+        self.stats = {'hits': 0, 'misses': 0, 'lookup_seconds': 0.0, 'embed_seconds': 0.0}
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding='utf-8') as f:
+                self._entries = [json.loads(line) for line in f if line.strip()]
+        if os.path.exists(self.vectors_path):
+            # The file is preallocated, so rows past len(self._entries) are spare capacity
+            self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+        self._initial_capacity = initial_capacity
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _ensure_capacity(self, dim, needed):
+        if self._vectors is not None and self._vectors.shape[0] >= needed:
+            return
+        capacity = max(self._initial_capacity, needed, 2 * (0 if self._vectors is None else self._vectors.shape[0]))
+        grown = np.lib.format.open_memmap(self.vectors_path + '.tmp', mode='w+', dtype=np.float32,
+                                          shape=(capacity, dim))
+        if self._vectors is not None:
+            grown[:len(self._entries)] = self._vectors[:len(self._entries)]
+            del self._vectors
+        grown.flush()
+        del grown
+        os.replace(self.vectors_path + '.tmp', self.vectors_path)
+        self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+
+    def embed(self, texts):
+        """Embed a batch of texts and return an (n, dim) array of unit vectors."""
+        start = time.perf_counter()
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        self.stats['embed_seconds'] += time.perf_counter() - start
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def search(self, vectors):
+        """Return (best index, best similarity) for each row of `vectors`; index is -1 when the cache is empty."""
+        count = len(self._entries)
+        if count == 0:
+            return np.full(len(vectors), -1), np.zeros(len(vectors), dtype=np.float32)
+        similarities = vectors @ self._vectors[:count].T
+        best = similarities.argmax(axis=1)
+        return best, similarities[np.arange(len(vectors)), best]
+
+    def lookup_batch(self, queries):
+        """Return a list with the cached {'name', 'arguments', 'query', 'similarity'} or None for every query."""
+        vectors = self.embed(queries)
+        start = time.perf_counter()
+        with self._lock:
+            best, scores = self.search(vectors)
+            results = []
+            for index, score in zip(best, scores):
+                if index >= 0 and score >= self.threshold:
+                    self.stats['hits'] += 1
+                    results.append(dict(self._entries[index], similarity=float(score)))
+                else:
+                    self.stats['misses'] += 1
+                    results.append(None)
+        self.stats['lookup_seconds'] += time.perf_counter() - start
+        return results, vectors
+
+    def lookup(self, query):
+        results, vectors = self.lookup_batch([query])
+        return results[0], vectors[0]
+
+    def add(self, query, name, arguments, vector=None):
+        """Store the tool call the model chose for `query`; pass the vector from lookup() to avoid re-embedding."""
+        if vector is None:
+            vector = self.embed([query])[0]
+        with self._lock:
+            count = len(self._entries)
+            self._ensure_capacity(vector.shape[0], count + 1)
+            self._vectors[count] = vector
+            self._vectors.flush()
+            entry = {'query': query, 'name': name, 'arguments': arguments}
+            with open(self.meta_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+            self._entries.append(entry)
+
+    def hit_rate(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
+
+    def report(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return {
+            'entries': len(self._entries),
+            'hit_rate': self.hit_rate(),
+            'avg_embed_ms': 1000 * self.stats['embed_seconds'] / total if total else 0.0,
+            'avg_search_ms': 1000 * self.stats['lookup_seconds'] / total if total else 0.0,
+        }
@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import json
+import threading
+import weakref
+from concurrent.futures import Future
+
+import tracing
+from spoonacular_cache import normalize_key
+
+
+def call_key(name, arguments):
+    """Key for a tool call: its name plus arguments with strings normalized and dict keys sorted."""
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments or '{}')
+    normalized = {k: normalize_key(v) if isinstance(v, str) else v for k, v in (arguments or {}).items()}
+    return f'{name}:{json.dumps(normalized, sort_keys=True, default=str)}'
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution, for threads.
+
+    The first caller of do() for a key runs the function; callers that arrive while it is running wait for
+    and receive the same result, or the same exception. Nothing is remembered once the call returns, so this
+    complements a cache instead of replacing it: it only covers the window while a miss is being fetched.
+    """
+
+    def __init__(self):
+        self.stats = {'calls': 0, 'executions': 0, 'shared': 0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            self.stats['calls'] += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.stats['executions'] += 1
+            else:
+                self.stats['shared'] += 1
+        if not leader:
+            tracing.annotate(coalesced=True)
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def inflight(self):
+        with self._lock:
+            return len(self._inflight)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop.
+
+    The shared call runs as its own task, so cancelling one waiter (for example on a timeout) does not cancel
+    the request the other waiters depend on.
+    """
+
+    def __init__(self):
+        self.stats = {'calls': 0, 'executions': 0, 'shared': 0}
+        self._inflight = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        self.stats['calls'] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats['executions'] += 1
+            task = self._inflight[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats['shared'] += 1
+            tracing.annotate(coalesced=True)
+        return await asyncio.shield(task)
+
+    def inflight(self):
+        return len(self._inflight)
+
+
+_default_group = SingleFlight()
+_async_groups = weakref.WeakKeyDictionary()
+
+
+def default_group():
+    return _default_group
+
+
+def async_group():
+    """The AsyncSingleFlight of the running event loop, so separate asyncio.run() calls never share futures."""
+    loop = asyncio.get_running_loop()
+    if loop not in _async_groups:
+        _async_groups[loop] = AsyncSingleFlight()
+    return _async_groups[loop]
+
+
+def coalesce(namespace, key=None, group=None):
+    """Coalesce concurrent calls of a function (or coroutine function) that share the same key.
+
+    `key` picks the identifying part of the call, by default the first argument, and is normalized like
+    spoonacular_cache keys, so ' Pasta' and 'pasta' share one request.
+    """
+    def decorator(func):
+        def flight_key(args, kwargs):
+            raw_key = key(*args, **kwargs) if key else args[0]
+            return f'{namespace}:{normalize_key(raw_key)}'
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await (group or async_group()).do(flight_key(args, kwargs), func, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return (group or default_group()).do(flight_key(args, kwargs), func, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import tracing
+
+DEFAULT_PATH = os.getenv('SPOONACULAR_CACHE_PATH', '.spoonacular_cache.sqlite3')
+DEFAULT_TTL = float(os.getenv('SPOONACULAR_CACHE_TTL', 7 * 24 * 3600))
+DEFAULT_NEGATIVE_TTL = float(os.getenv('SPOONACULAR_CACHE_NEGATIVE_TTL', 3600))
+DEFAULT_MAX_ENTRIES = int(os.getenv('SPOONACULAR_CACHE_MAX_ENTRIES', 1024))
+
+_MISSING = object()
+
+
+def normalize_key(value):
+    """Normalize a query so that ' Mutton  Curry' and 'mutton curry' share a cache entry."""
+    if isinstance(value, str):
+        return re.sub(r'\s+', ' ', value).strip().lower()
+    return str(value)
+
+
+class TwoTierCache:
+    """An in-process LRU in front of a persistent SQLite store, with per-entry expiry.
+
+    Values are pickled on disk so tuples such as (recipe_id, title) round-trip unchanged. `None` is a valid
+    value and is stored with the negative TTL, so "no recipe found" answers are remembered too.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'negative_hits': 0, 'misses': 0, 'writes': 0}
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            self._db.commit()
+
+    def _remember(self, key, value, expires):
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key, default=_MISSING):
+        """Return the cached value for `key`, or `default` (the module-level _MISSING sentinel) on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    if value is None:
+                        self.stats['negative_hits'] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    value = pickle.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.stats['disk_hits'] += 1
+                    if value is None:
+                        self.stats['negative_hits'] += 1
+                    return value
+
+            self.stats['misses'] += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        expires = time.time() + ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            self.stats['writes'] += 1
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                 (key, pickle.dumps(value), expires))
+                self._db.commit()
+
+    def purge_expired(self):
+        """Delete expired rows from the SQLite store and return how many were removed."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cursor = self._db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+            self._db.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM cache')
+                self._db.commit()
+
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TwoTierCache()
+    return _default_cache
+
+
+def cached(namespace, key=None, cache=None, ttl=None):
+    """Cache a Spoonacular lookup (a plain or a coroutine function).
+
+    `key` picks the part of the call that identifies the request (by default the first argument), which keeps
+    values like the API key out of the cache key. Exceptions are never cached, so wrap the function that raises
+    on HTTP errors, not the one that swallows them.
+    """
+    def decorator(func):
+        def cache_key(args, kwargs):
+            raw_key = key(*args, **kwargs) if key else args[0]
+            return f'{namespace}:{normalize_key(raw_key)}'
+
+        def lookup(store, cache_key):
+            value = store.get(cache_key)
+            if value is not _MISSING:
+                tracing.annotate(cache_hit=True)
+            return value
+
+        def store_value(store, cache_key, value):
+            store.set(cache_key, value, ttl=ttl if value is not None else None)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                store = cache or default_cache()
+                full_key = cache_key(args, kwargs)
+                value = lookup(store, full_key)
+                if value is _MISSING:
+                    value = await func(*args, **kwargs)
+                    store_value(store, full_key, value)
+                return value
+
+            async_wrapper.cache = lambda: cache or default_cache()
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            store = cache or default_cache()
+            full_key = cache_key(args, kwargs)
+            value = lookup(store, full_key)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                store_value(store, full_key, value)
+            return value
+
+        wrapper.cache = lambda: cache or default_cache()
+        return wrapper
+
+    return decorator
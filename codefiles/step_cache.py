@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import threading
+from typing import Annotated
+
+import tracing
+from spoonacular_cache import TwoTierCache
+from tool_registry import ToolArgumentError, ToolRegistry, UnknownToolError
+
+STEP_CACHE_PATH = os.getenv('STEP_CACHE_PATH', '.step_cache.sqlite3')
+STEP_CACHE_TTL = float(os.getenv('STEP_CACHE_TTL', 30 * 24 * 3600))
+
+_STEP_LINE = re.compile(r'^\s*(?:step\s*)?(\d+)\s*[:.)-]\s*(.*?)\s*$', re.IGNORECASE)
+
+# Same actions as the xpath script, plus the number of the step each call implements so that the calls of a
+# request covering several steps can be filed under the right step.
+STEP_TOOLS = ToolRegistry()
+
+
+@STEP_TOOLS.tool('click', 'Clicks the button')
+def click(step: Annotated[int, 'The number of the step this action belongs to'],
+          xpath: Annotated[str, 'The xpath locator of the button to click']):
+    return 'click', {'xpath': xpath}
+
+
+@STEP_TOOLS.tool('enter', 'Enters the text, number or date in the input field')
+def enter(step: Annotated[int, 'The number of the step this action belongs to'],
+          xpath: Annotated[str, 'The xpath locator of the input field'],
+          value: Annotated[str, 'The value to enter in the input field']):
+    return 'enter', {'xpath': xpath, 'value': value}
+
+
+STEP_INSTRUCTION = ('Only the steps listed by the user need actions. Set "step" in every function call to the '
+                    'number of the step it comes from.')
+
+
+def split_steps(test_case):
+    """Split a test case into (number, text) pairs sorted by step number.
+
+    Recognises 'Step 1 : ...', '1: ...', '1. ...' and '1) ...'. Unnumbered lines continue the previous step,
+    and a case with no numbered lines at all is numbered line by line.
+    """
+    steps = []
+    for line in test_case.splitlines():
+        if not line.strip():
+            continue
+        match = _STEP_LINE.match(line)
+        if match:
+            steps.append([int(match.group(1)), match.group(2)])
+        elif steps:
+            steps[-1][1] += ' ' + line.strip()
+        else:
+            steps.append([None, line.strip()])
+    if any(number is None for number, _ in steps):
+        steps = [[index, text] for index, (_, text) in enumerate(steps, 1)]
+    return sorted((number, text) for number, text in steps)
+
+
+def normalize_step(text):
+    """Cache key for a step. Case is kept because values such as 'Admin123' are case sensitive."""
+    return re.sub(r'\s+', ' ', text).strip().rstrip('.;,')
+
+
+class StepMemo:
+    """Convert test cases to click/enter steps, asking the model only about steps it has not seen before.
+
+    Known steps come from a persistent step -> [(function, arguments)] index (SQLite with an in-memory LRU in
+    front); the unseen steps of a case go to the model in one request and their answers are added to the
+    index. Only steps that got at least one valid action are cached, and nothing from a reply that had a call
+    dropped, so a bad answer is asked again next time instead of being remembered as "no action".
+
+    `examples` are few-shot messages sent between the system prompt and the steps, the same ones the uncached
+    prompt uses.
+    """
+
+    def __init__(self, client, model, system_prompt, cache=None, examples=()):
+        self.client = client
+        self.model = model
+        self.system_prompt = f'{system_prompt}\n{STEP_INSTRUCTION}'
+        self.examples = list(examples)
+        self.cache = cache or TwoTierCache(path=STEP_CACHE_PATH, ttl=STEP_CACHE_TTL)
+        self.stats = {'steps': 0, 'cached_steps': 0, 'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self._lock = threading.Lock()
+
+    def plan(self, test_case):
+        """Return (steps, known {number: actions}, messages for the unseen steps or None)."""
+        steps = split_steps(test_case)
+        known = {}
+        for number, text in steps:
+            actions = self.cache.get(f'step:{normalize_step(text)}', None)
+            # Empty lists were written by earlier versions for steps whose calls were dropped; ask again
+            if actions:
+                known[number] = actions
+        with self._lock:
+            self.stats['steps'] += len(steps)
+            self.stats['cached_steps'] += len(known)
+        tracing.annotate(steps=len(steps), cached_steps=len(known))
+        unseen = [f'Step {number} : {text}' for number, text in steps if number not in known]
+        if not unseen:
+            return steps, known, None
+        messages = [{'role': 'system', 'content': self.system_prompt}, *self.examples,
+                    {'role': 'user', 'content': '\n'.join(unseen)}]
+        return steps, known, messages
+
+    def merge(self, steps, known, response):
+        """File the tool calls of `response` under their steps, cache them and return all steps in order."""
+        if response is not None:
+            choice = response.choices[0]
+            with self._lock:
+                self.stats['requests'] += 1
+                if response.usage is not None:
+                    self.stats['prompt_tokens'] += response.usage.prompt_tokens
+                    self.stats['completion_tokens'] += response.usage.completion_tokens
+            answered = {number: [] for number, _ in steps if number not in known}
+            dropped = 0
+            for tool_call in choice.message.tool_calls or []:
+                try:
+                    arguments = STEP_TOOLS.validate(tool_call.function.name, tool_call.function.arguments)
+                except (UnknownToolError, ToolArgumentError) as e:
+                    print('Skipping invalid step:', e)
+                    dropped += 1
+                    continue
+                number = arguments.pop('step')
+                if number not in answered:
+                    print(f'Skipping step with unknown step number {number}: {tool_call.function.name}')
+                    dropped += 1
+                    continue
+                answered[number].append((tool_call.function.name, json.dumps(arguments)))
+            # A reply without tool calls (refusal, length cut-off) or with dropped calls cannot be trusted to say
+            # which steps need no action, so only complete replies are cached, and only steps with actions
+            if choice.finish_reason == 'tool_calls' and not dropped:
+                texts = dict(steps)
+                for number, actions in answered.items():
+                    if actions:
+                        self.cache.set(f'step:{normalize_step(texts[number])}', actions)
+            known = {**known, **answered}
+        return [action for number, _ in steps for action in known.get(number, [])]
+
+    def convert(self, test_case):
+        """Blocking version: same (name, arguments) list as get_response in the xpath script."""
+        steps, known, messages = self.plan(test_case)
+        response = None
+        if messages is not None:
+            response = self.client.chat.completions.create(model=self.model, messages=messages,
+                                                           tools=STEP_TOOLS.definitions())
+        return self.merge(steps, known, response)
+
+    async def aconvert(self, test_case):
+        """Same as convert() for an AsyncAzureOpenAI client."""
+        steps, known, messages = self.plan(test_case)
+        response = None
+        if messages is not None:
+            response = await self.client.chat.completions.create(model=self.model, messages=messages,
+                                                                 tools=STEP_TOOLS.definitions())
+        return self.merge(steps, known, response)
+
+    def hit_rate(self):
+        return self.stats['cached_steps'] / self.stats['steps'] if self.stats['steps'] else 0.0
+
+    def report(self):
+        return (f"Steps: {self.stats['steps']} ({self.hit_rate():.0%} from cache), "
+                f"{self.stats['requests']} model requests, {self.stats['prompt_tokens']} prompt tokens")
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+
+import clients
+from step_cache import StepMemo
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_spec = importlib.util.spec_from_file_location('structured_output_xpath',
+                                               os.path.join(HERE, 'structured_otput_using function_caling.py'))
+xpath = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(xpath)
+
+
+def _case_files(path):
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if os.path.isfile(os.path.join(path, name)) and not name.startswith('.'):
+                yield os.path.join(path, name)
+    else:
+        yield path
+
+
+def _blocks(stream):
+    """Yield blank-line separated blocks of text one at a time."""
+    block = []
+    for line in stream:
+        if line.strip():
+            block.append(line.rstrip('\n'))
+        elif block:
+            yield '\n'.join(block)
+            block = []
+    if block:
+        yield '\n'.join(block)
+
+
+def read_cases(paths):
+    """Lazily yield (case_id, test case text, error) from files, directories or '-' for stdin.
+
+    .jsonl files hold one object per line with a "case" field and an optional "id"; any other file holds test
+    cases separated by blank lines. Ids default to '<file>:<n>', so they stay stable between runs. A JSONL line
+    that cannot be parsed or has no "case" is yielded with the raw line and an error message instead.
+    """
+    for path in paths:
+        for filename in _case_files(path):
+            stream = sys.stdin if filename == '-' else open(filename, encoding='utf-8')
+            try:
+                name = 'stdin' if filename == '-' else os.path.relpath(filename)
+                if filename.endswith('.jsonl'):
+                    for number, line in enumerate(stream, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            record = json.loads(line)
+                            yield str(record.get('id', f'{name}:{number}')), record['case'], None
+                        except (ValueError, KeyError, TypeError, AttributeError) as e:
+                            yield f'{name}:{number}', line.strip(), f'Malformed input line: {e!r}'
+                else:
+                    for number, block in enumerate(_blocks(stream), 1):
+                        yield f'{name}:{number}', block, None
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+
+
+def completed_ids(path):
+    """Ids already converted successfully in an earlier run of `path`.
+
+    A line cut off by an interrupted write is removed so the file can be appended to again.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+            data = data[:data.rfind(b'\n') + 1]
+    done = set()
+    for line in data.decode('utf-8').splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if 'error' not in record:
+            done.add(record['id'])
+    return done
+
+
+async def convert_case(client, model, case_id, test_case, memo=None):
+    """Turn one test case into a list of click/enter steps and return the JSONL record.
+
+    With a StepMemo only the steps not seen before are sent to the model.
+    """
+    start = time.perf_counter()
+    if memo is not None:
+        record = steps_record(case_id, await memo.aconvert(test_case))
+    else:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=xpath.build_messages(test_case),
+            tools=xpath.function_definitions()
+        )
+        record = steps_record(case_id, xpath.parse_steps(response.choices[0]), response.choices[0].finish_reason)
+    record['elapsed'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def steps_record(case_id, steps, finish_reason=None):
+    """The JSONL record for a converted test case, given its parsed (name, arguments) steps or None."""
+    record = {'id': case_id}
+    if steps is None:
+        record['error'] = f'No tool calls found ({finish_reason}).'
+    else:
+        record['steps'] = [{'action': name, **json.loads(arguments)} for name, arguments in steps]
+    return record
+
+
+async def run_batch(client, model, cases, sink, concurrency=16, skip=frozenset(), window=None, memo=None):
+    """Convert `cases` with at most `concurrency` requests in flight, writing records to `sink` in input order.
+
+    A finished case waits in memory until every case before it is written, so `window` (default
+    4 * concurrency) caps how far ahead of the oldest unfinished case the reader may get.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    ahead = asyncio.Semaphore(window or 4 * concurrency)
+    finished = {}
+    counts = {'ok': 0, 'error': 0, 'skipped': 0}
+    state = {'next': 0}
+    tasks = set()
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+
+    def flush():
+        while state['next'] in finished:
+            record = finished.pop(state['next'])
+            sink.write(json.dumps(record) + '\n')
+            state['next'] += 1
+            ahead.release()
+        sink.flush()
+
+    async def worker(sequence, case_id, test_case):
+        try:
+            record = await convert_case(client, model, case_id, test_case, memo)
+        except Exception as e:
+            record = {'id': case_id, 'error': f'An error occurred: {e}'}
+        finally:
+            semaphore.release()
+        counts['error' if 'error' in record else 'ok'] += 1
+        finished[sequence] = record
+        flush()
+
+    iterator = iter(cases)
+    sequence = 0
+    while True:
+        # File reads happen off the event loop so slow disks do not stall in-flight requests
+        item = await loop.run_in_executor(None, next, iterator, None)
+        if item is None:
+            break
+        case_id, test_case, error = item
+        if case_id in skip:
+            counts['skipped'] += 1
+            continue
+        await ahead.acquire()
+        if error:
+            counts['error'] += 1
+            finished[sequence] = {'id': case_id, 'error': error}
+            sequence += 1
+            flush()
+            continue
+        await semaphore.acquire()
+        task = asyncio.create_task(worker(sequence, case_id, test_case))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        sequence += 1
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - start
+    total = counts['ok'] + counts['error']
+    print(f"Converted {total} test cases ({counts['error']} errors, {counts['skipped']} already done) in "
+          f"{elapsed:.2f}s ({total / elapsed if elapsed else 0:.2f} cases/s)", file=sys.stderr)
+    if memo is not None:
+        print(memo.report(), file=sys.stderr)
+    return counts
+
+
+def run_batch_api(runner, cases, sink, skip=frozenset()):
+    """Convert `cases` as Batch API jobs, writing records to `sink` in completion order as the jobs finish."""
+    counts = {'ok': 0, 'error': 0, 'skipped': 0}
+    start = time.perf_counter()
+    for case_id, test_case, error in cases:
+        if case_id in skip:
+            counts['skipped'] += 1
+            continue
+        if error:
+            counts['error'] += 1
+            sink.write(json.dumps({'id': case_id, 'error': error}) + '\n')
+            continue
+        runner.submit(xpath.build_messages(test_case), custom_id=case_id, tools=xpath.function_definitions())
+
+    for case_id, result in runner.results():
+        if isinstance(result, Exception):
+            record = {'id': case_id, 'error': f'An error occurred: {result}'}
+        else:
+            choice = result.choices[0]
+            record = steps_record(case_id, xpath.parse_steps(choice), choice.finish_reason)
+        counts['error' if 'error' in record else 'ok'] += 1
+        sink.write(json.dumps(record) + '\n')
+        sink.flush()
+
+    elapsed = time.perf_counter() - start
+    print(f"Converted {counts['ok'] + counts['error']} test cases ({counts['error']} errors, "
+          f"{counts['skipped']} already done) in {elapsed:.2f}s", file=sys.stderr)
+    print(runner.report(), file=sys.stderr)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert test cases into click/enter automation steps in bulk.')
+    parser.add_argument('inputs', nargs='*', default=['-'],
+                        help='Test case files or directories (.jsonl or blank-line separated text; default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='JSONL output file (default: stdout)')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='Maximum requests in flight')
+    parser.add_argument('--resume', action='store_true',
+                        help='Append to --output and skip test cases it already holds steps for')
+    parser.add_argument('--memo', action='store_true',
+                        help='Resolve previously seen steps from the step cache and send only new steps')
+    parser.add_argument('--batch-api', action='store_true',
+                        help='Submit the cases as Batch API jobs (cheaper, outside the quota, answers within 24h)')
+    parser.add_argument('--batch-state',
+                        help='Batch job state file for resuming (default: <output>.batch.json)')
+    args = parser.parse_args(argv)
+
+    model, = clients.require('MODEL')
+    if args.batch_api:
+        return main_batch_api(args, model)
+    client = clients.new_async_client(max_connections=args.concurrency)
+    # Same few-shot example as xpath.build_messages, so memoized and plain runs send the same prompt
+    examples = [xpath.user_message(xpath.EXAMPLE_CASE), xpath.assistant_message(xpath.EXAMPLE_STEPS)]
+    memo = StepMemo(client, model, xpath.SYSTEM_PROMPT, examples=examples) if args.memo else None
+    skip = set()
+    if args.output == '-':
+        sink = sys.stdout
+    elif args.resume:
+        skip = completed_ids(args.output)
+        sink = open(args.output, 'a', encoding='utf-8')
+    else:
+        sink = open(args.output, 'w', encoding='utf-8')
+
+    async def run():
+        try:
+            return await run_batch(client, model, read_cases(args.inputs), sink, args.concurrency,
+                                   skip, memo=memo)
+        finally:
+            await client.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+
+
+def main_batch_api(args, model):
+    from batch_jobs import BatchRunner
+
+    if args.output == '-':
+        print('--batch-api needs an --output file to keep the job state next to.')
+        return 1
+    state_path = args.batch_state or args.output + '.batch.json'
+    if not args.resume and os.path.exists(state_path):
+        print(f'{state_path} holds jobs from an earlier run; pass --resume to continue them or delete it.')
+        return 1
+    skip = completed_ids(args.output) if args.resume else set()
+    runner = BatchRunner(clients.new_client(), model, state_path=state_path)
+    with open(args.output, 'a' if args.resume else 'w', encoding='utf-8') as sink:
+        run_batch_api(runner, read_cases(args.inputs), sink, skip)
+    os.remove(state_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import time
+
+
+class StreamMetrics:
+    """Time-to-first-token and generation speed of one streamed completion."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.completion_tokens = 0
+        self.prompt_tokens = None
+
+    def token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def ttft(self):
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def total(self):
+        return None if self.finished is None else self.finished - self.started
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token is None or self.finished is None or self.finished <= self.first_token:
+            return None
+        return self.completion_tokens / (self.finished - self.first_token)
+
+    def as_dict(self):
+        return {'ttft': self.ttft, 'total': self.total, 'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens, 'tokens_per_second': self.tokens_per_second}
+
+    def __repr__(self):
+        ttft = f'{self.ttft * 1000:.0f}ms' if self.ttft is not None else '-'
+        tps = f'{self.tokens_per_second:.1f}' if self.tokens_per_second is not None else '-'
+        return f'StreamMetrics(ttft={ttft}, completion_tokens={self.completion_tokens}, tokens/s={tps})'
+
+
+class ChatStream:
+    """Iterate over content deltas of a streamed chat completion while reassembling the full message.
+
+    Tool calls arrive as fragments keyed by `index`: the first fragment carries the id and function name, later
+    ones append pieces of the JSON arguments. After iteration, `content`, `tool_calls` and `finish_reason`
+    hold the reassembled result and `metrics` the timing.
+    """
+
+    def __init__(self, client, **kwargs):
+        self.metrics = StreamMetrics()
+        kwargs['stream'] = True
+        kwargs.setdefault('stream_options', {'include_usage': True})
+        self._chunks = client.chat.completions.create(**kwargs)
+        self._content = []
+        self._tool_calls = {}
+        self.finish_reason = None
+        self._usage_seen = False
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if chunk.usage is not None:
+                self._usage_seen = True
+                self.metrics.prompt_tokens = chunk.usage.prompt_tokens
+                self.metrics.completion_tokens = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                self.finish_reason = choice.finish_reason
+            delta = choice.delta
+            if delta is None:
+                continue
+            if delta.tool_calls:
+                self.metrics.token()
+                for fragment in delta.tool_calls:
+                    call = self._tool_calls.setdefault(fragment.index, {'id': None, 'type': 'function',
+                                                                        'function': {'name': '', 'arguments': ''}})
+                    if fragment.id:
+                        call['id'] = fragment.id
+                    if fragment.function is not None:
+                        if fragment.function.name:
+                            call['function']['name'] += fragment.function.name
+                        if fragment.function.arguments:
+                            call['function']['arguments'] += fragment.function.arguments
+            if delta.content:
+                self.metrics.token()
+                if not self._usage_seen:
+                    # Each content chunk is one token in practice; replaced by usage when the server sends it
+                    self.metrics.completion_tokens += 1
+                self._content.append(delta.content)
+                yield delta.content
+        self.metrics.finish()
+
+    @property
+    def content(self):
+        return ''.join(self._content) or None
+
+    @property
+    def tool_calls(self):
+        return [self._tool_calls[index] for index in sorted(self._tool_calls)]
+
+    def message(self):
+        """The reassembled assistant message, ready to append to `messages`."""
+        message = {'role': 'assistant', 'content': self.content}
+        if self._tool_calls:
+            message['tool_calls'] = self.tool_calls
+        return message
+
+
+def stream_to_stdout(client, **kwargs):
+    """Print a completion as it streams and return the ChatStream for its message and metrics."""
+    stream = ChatStream(client, **kwargs)
+    for text in stream:
+        print(text, end='', flush=True)
+    print()
+    return stream
+
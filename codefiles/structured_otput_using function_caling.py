@@ -1,6 +1,9 @@
-from openai import AzureOpenAI
-from dotenv import load_dotenv
-import os
+from typing import Annotated
+
+import clients
+from tool_registry import ToolArgumentError, ToolRegistry, UnknownToolError
+
+TOOLS = ToolRegistry()
 
 
 def system_message(message):
@@ -24,51 +27,66 @@ def assistant_message(message):
     }
 
 
+@TOOLS.tool('click', 'Clicks the button')
+def click(xpath: Annotated[str, 'The xpath locator of the button to click']):
+    return 'click', {'xpath': xpath}
+
+
+@TOOLS.tool('enter', 'Enters the text, number or date in the input field')
+def enter(xpath: Annotated[str, 'The xpath locator of the input field'],
+          value: Annotated[str, 'The value to enter in the input field']):
+    return 'enter', {'xpath': xpath, 'value': value}
+
+
 def function_definitions():
+    return TOOLS.definitions()
+
+
+SYSTEM_PROMPT = '''You are tasked with interpreting user test cases to generate automation steps. - Each step 
+        in the user's description should be converted into one or more function calls if it describes an action that 
+        can be automated. - Ignore steps that do not involve interaction with UI elements or are ambiguous. - Use the 
+        'click' function for clicking buttons or links. - Use the 'enter' function for typing into input fields, 
+        specifying both the locator and the value to input. - Do not generate any output for steps that do not 
+        clearly align with these actions. - Ensure the sequence of actions corresponds to the step numbers provided, 
+        even if they are out of numerical order in the text. - If a step includes multiple actions, like entering 
+        text and then clicking, break it down into separate function calls.'''
+
+# One worked example that shows the model the expected granularity and ordering of steps
+EXAMPLE_CASE = '''
+        Step 1 : Enter Username as Admin123
+        Step 3 : Click on  My Profile image after login
+        Step 2 : Enter Password as M@hiGill92 and Click on Sign in Button
+        
+        '''
+EXAMPLE_STEPS = '''[('enter', '{"xpath": "[XPath for Username field]", "value": "Admin123"}'), ('enter', 
+        '{"xpath": "[XPath for Password field]", "value": "M@hiGill92"}'), ('click', '{"xpath": "[XPath for Sign in 
+        Button]"}'), ('click', '{"xpath": "[XPath for My Profile Image]"')]'''
+
+
+def build_messages(test_case):
     return [
-        {
-            'type': 'function',
-            'function': {
-                'name': 'click',
-                'description': 'Clicks the button',
-                'parameters': {
-                    'type': 'object',
-                    'properties': {
-                        'xpath': {
-                            'type': 'string',
-                            'description': 'The xpath locator of the button to click'
-                        }
-
-                    }
-
-                },
-                'required': ['xpath']
-            }
-        },
-        {
-            'type': 'function',
-            'function': {
-                'name': 'enter',
-                'description': 'Enters the text, number or date in the input field',
-                'parameters': {
-                    'type': 'object',
-                    'properties': {
-                        'xpath': {
-                            'type': 'string',
-                            'description': 'The xpath locator of the input field'
-                        },
-                        'value': {
-                            'type': 'string',
-                            'description': 'The value to enter in the input field'
-                        }
-                    }
-                },
-                'required': ['xpath', 'value']
-            }
-        }
+        system_message(SYSTEM_PROMPT),
+        user_message(EXAMPLE_CASE),
+        assistant_message(EXAMPLE_STEPS),
+        user_message(test_case)
     ]
 
 
+def parse_steps(choice):
+    """Return the valid (name, arguments) steps of a completion choice, or None if it made no tool calls."""
+    if choice.finish_reason != 'tool_calls':
+        return None
+    all_steps = []
+    for tool_call in choice.message.tool_calls:
+        try:
+            TOOLS.validate(tool_call.function.name, tool_call.function.arguments)
+        except (UnknownToolError, ToolArgumentError) as e:
+            print('Skipping invalid step:', e)
+            continue
+        all_steps.append((tool_call.function.name, tool_call.function.arguments))
+    return all_steps
+
+
 def get_response(connection, model, msgs):
     resp = connection.chat.completions.create(
         model=model,
@@ -77,10 +95,7 @@ def get_response(connection, model, msgs):
     )
     if resp.choices[0].finish_reason == 'tool_calls':
         print('Inside')
-        all_steps = [(resp.choices[0].message.tool_calls[i].function.name,
-                      resp.choices[0].message.tool_calls[i].function.arguments) for i in
-                     range(len(resp.choices[0].message.tool_calls))]
-        return all_steps
+        return parse_steps(resp.choices[0])
 
     else:
         print('Outside')
@@ -88,43 +103,12 @@ def get_response(connection, model, msgs):
 
 
 if __name__ == "__main__":
-    load_dotenv()
-
-    endpoint = os.getenv("ENDPOINT")
-    key = os.getenv("OPENAI_KEY")
-    deployment = os.getenv("MODEL")
-
-    client = AzureOpenAI(
-        azure_endpoint=endpoint,
-        api_key=key,
-        api_version='2024-08-01-preview'
-    )
-    messages = [
-        system_message('''You are tasked with interpreting user test cases to generate automation steps. - Each step 
-        in the user's description should be converted into one or more function calls if it describes an action that 
-        can be automated. - Ignore steps that do not involve interaction with UI elements or are ambiguous. - Use the 
-        'click' function for clicking buttons or links. - Use the 'enter' function for typing into input fields, 
-        specifying both the locator and the value to input. - Do not generate any output for steps that do not 
-        clearly align with these actions. - Ensure the sequence of actions corresponds to the step numbers provided, 
-        even if they are out of numerical order in the text. - If a step includes multiple actions, like entering 
-        text and then clicking, break it down into separate function calls.''' ),
-
-        user_message('''
-        Step 1 : Enter Username as Admin123
-        Step 3 : Click on  My Profile image after login
-        Step 2 : Enter Password as M@hiGill92 and Click on Sign in Button
-        
-        '''),
-        assistant_message('''[('enter', '{"xpath": "[XPath for Username field]", "value": "Admin123"}'), ('enter', 
-        '{"xpath": "[XPath for Password field]", "value": "M@hiGill92"}'), ('click', '{"xpath": "[XPath for Sign in 
-        Button]"}'), ('click', '{"xpath": "[XPath for My Profile Image]"')]'''),
-
-        user_message('''
+    deployment, = clients.require('MODEL')
+    client = clients.get_client()
+    messages = build_messages('''
         1: Click Sales in Site Navigation App
         2: Click on the Add New button
         4: Click om Logout button
         3: Enter the name as 'John Doe' and click on the Save button        
         ''')
-
-    ]
     print(get_response(client, deployment, messages))
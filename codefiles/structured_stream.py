@@ -0,0 +1,126 @@
+import json
+
+from streaming import StreamMetrics
+
+
+class IncrementalArrayParser:
+    """Pull complete objects out of one array field of a JSON document while it is still arriving.
+
+    For {"answers": [{...}, {...}]} and key='answers', feed() returns each {...} as soon as its closing brace
+    has been seen. Only the object currently being read is buffered, so memory does not grow with the number
+    of items. Each object is validated with `model.model_validate` when a pydantic model is given; an object
+    that is not valid JSON or fails validation is logged, counted in `skipped` and left out.
+    """
+
+    def __init__(self, key, model=None):
+        self.key = key
+        self.model = model
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._collect_key = False
+        self._key_chars = []
+        self._last_key = None
+        self._array_level = None
+        self._capture = None
+        self.skipped = 0
+
+    def feed(self, text):
+        items = []
+        for ch in text:
+            if self._capture is not None:
+                self._capture.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._collect_key:
+                        self._last_key = ''.join(self._key_chars)
+                elif self._collect_key:
+                    self._key_chars.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                # Only strings directly inside the root object can be the key we are looking for
+                self._collect_key = len(self._stack) == 1
+                self._key_chars = []
+            elif ch in '{[':
+                if ch == '{' and self._array_level is not None and len(self._stack) == self._array_level:
+                    self._capture = ['{']
+                self._stack.append(ch)
+                if ch == '[' and len(self._stack) == 2 and self._last_key == self.key:
+                    self._array_level = len(self._stack)
+            elif ch in '}]':
+                self._stack.pop()
+                if ch == '}' and self._capture is not None and len(self._stack) == self._array_level:
+                    try:
+                        items.append(self._build(''.join(self._capture)))
+                    except ValueError as e:
+                        # pydantic's ValidationError and json's JSONDecodeError are both ValueErrors
+                        self.skipped += 1
+                        print('Skipping invalid item:', e)
+                    self._capture = None
+                elif ch == ']' and self._array_level is not None and len(self._stack) < self._array_level:
+                    self._array_level = None
+        return items
+
+    def _build(self, raw):
+        data = json.loads(raw)
+        return self.model.model_validate(data) if self.model is not None else data
+
+
+def strict_schema(schema):
+    """`schema` made acceptable for strict structured outputs: every object closed and all properties required."""
+    if isinstance(schema, list):
+        return [strict_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    result = {key: strict_schema(value) for key, value in schema.items()
+              if key not in ('default', 'properties', '$defs')}
+    # Keys of `properties` and `$defs` are names, not schema keywords, so only their values are rewritten
+    for key in ('properties', '$defs'):
+        if key in schema:
+            result[key] = {name: strict_schema(value) for name, value in schema[key].items()}
+    if 'properties' in result:
+        result['additionalProperties'] = False
+        result['required'] = list(result['properties'])
+    return result
+
+
+def json_schema_format(model):
+    """Strict response_format payload asking for JSON that matches a pydantic model.
+
+    Strict mode makes the service enforce the schema while generating, so the output can be validated against
+    `model` afterwards. Used for both streamed and non-streamed structured requests.
+    """
+    return {
+        'type': 'json_schema',
+        'json_schema': {'name': model.__name__, 'schema': strict_schema(model.model_json_schema()), 'strict': True}
+    }
+
+
+def stream_items(client, response_model, key, item_model=None, metrics=None, **kwargs):
+    """Stream a structured completion and yield each validated element of `response_model.<key>` as it lands.
+
+    `metrics` (a StreamMetrics) can be passed in to collect time-to-first-token and item timings. Elements that
+    fail validation are skipped and logged rather than raised halfway through the stream.
+    """
+    metrics = metrics or StreamMetrics()
+    parser = IncrementalArrayParser(key, item_model)
+    kwargs.setdefault('response_format', json_schema_format(response_model))
+    chunks = client.chat.completions.create(stream=True, stream_options={'include_usage': True}, **kwargs)
+    for chunk in chunks:
+        if chunk.usage is not None:
+            metrics.prompt_tokens = chunk.usage.prompt_tokens
+            metrics.completion_tokens = chunk.usage.completion_tokens
+        if not chunk.choices or not chunk.choices[0].delta or not chunk.choices[0].delta.content:
+            continue
+        metrics.token()
+        for item in parser.feed(chunk.choices[0].delta.content):
+            yield item
+    metrics.finish()
@@ -1,9 +1,7 @@
-import openai
-from openai import AzureOpenAI
-from dotenv import load_dotenv
-import os
-from tenacity import retry, stop_after_attempt, wait_random_exponential
-import tiktoken
+import clients
+from completion_cache import CachedClient
+from rate_limiter import estimate_tokens, get_limiter
+from token_budget import count_messages, trim_to_budget
 
 
 def system_message(message):
@@ -20,12 +18,29 @@ def user_message(message):
     }
 
 
-# Demonstrates retry logic using the tenacity library
-@retry(stop=stop_after_attempt(3), wait=wait_random_exponential(min=1, max=10))
-def get_response(connection: AzureOpenAI, model, messages):
-    resp = connection.chat.completions.create(
-        model=model,
-        messages=messages,
+def complete(connection, model, messages, limiter=None, **params):
+    """chat.completions.create queued on the deployment's RPM/TPM limiter.
+
+    On a CachedClient the cache is checked first, so a hit spends neither an RPM slot nor the TPM estimate.
+    """
+    limiter = limiter or get_limiter(model)
+    estimated = estimate_tokens(model, messages, params.get('max_tokens'), params.get('tools'))
+    kwargs = dict(params, model=model, messages=messages)
+    if isinstance(connection, CachedClient):
+        return connection.cache.call(
+            'chat', lambda **kw: limiter.call(connection.client.chat.completions.create, estimated, **kw), kwargs)
+    return limiter.call(connection.chat.completions.create, estimated, **kwargs)
+
+
+# Requests queue on a per-deployment RPM/TPM limiter instead of retrying blindly into 429s
+def get_response(connection, model, messages, limiter=None):
+    # Drop the oldest turns (or fail fast) instead of paying for a request the server will reject
+    messages = trim_to_budget(model, messages)
+    resp = complete(
+        connection,
+        model,
+        messages,
+        limiter,
         # response_format={
         #     'type': 'json_object'
         # }
@@ -34,18 +49,10 @@ def get_response(connection: AzureOpenAI, model, messages):
 
 
 if __name__ == "__main__":
-    load_dotenv()
-
-    endpoint = os.getenv("ENDPOINT")
-    key = os.getenv("OPENAI_KEY")
-    deployment = os.getenv("MODEL")
+    deployment, = clients.require('MODEL')
 
-    client = AzureOpenAI(
-        azure_endpoint=endpoint,
-        api_key=key,
-        api_version='2024-08-01-preview'
-
-    )
+    # The rate limiter handles 429s itself, so the SDK's own retries are switched off
+    client = CachedClient(clients.new_client(max_retries=0))
     msgs = [
         system_message("You are java expert. You are given a series of questions to answer. Provide answer to each "),
         #"question in json format."),
@@ -53,12 +60,18 @@ if __name__ == "__main__":
         user_message("What is the difference between an interface and an abstract class?"),
         user_message("What is the difference between a checked and an unchecked exception?"),
     ]
-    encoding = tiktoken.encoding_for_model(deployment)
-    num_token = [len(encoding.encode(msg['content'])) for msg in msgs]
-    print(sum(num_token))
+    print(count_messages(deployment, msgs))
 
     response = get_response(client, deployment, msgs)
     if response:
         print(response)
     else:
         print("Failed to get a response from the API.")
+
+    # The same questions submitted independently; the micro-batcher packs them into one request
+    from micro_batcher import MicroBatcher
+    with MicroBatcher(client, deployment, msgs[0]['content']) as batcher:
+        futures = [batcher.submit(message['content']) for message in msgs[1:]]
+        for message, future in zip(msgs[1:], futures):
+            print(message['content'], '->', future.result())
+        print(batcher.stats)
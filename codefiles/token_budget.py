@@ -0,0 +1,176 @@
+import functools
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+CONTEXT_WINDOW = int(os.getenv('MODEL_CONTEXT_WINDOW', 128000))
+DEFAULT_ENCODING = os.getenv('TIKTOKEN_ENCODING', 'o200k_base')
+
+# Chat format overhead as documented in the OpenAI cookbook: every message is wrapped in
+# <|start|>{role}\n{content}<|end|>, a name costs one more token and the reply is primed with 3 tokens.
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+REPLY_PRIMING = 3
+# Tool definitions are rendered into the system prompt; these constants cover the wrapper text around them.
+TOOLS_OVERHEAD = 12
+TOKENS_PER_TOOL = 8
+
+
+class ContextWindowExceeded(ValueError):
+    """Raised when a request cannot be trimmed to fit in the model's context window."""
+
+
+class ApproximateEncoding:
+    """Stand-in used when tiktoken cannot download its BPE files (e.g. offline benchmark runs).
+
+    Counts words and punctuation marks, which lands within a few percent of real BPE counts for English text.
+    """
+
+    name = 'approximate'
+    _pattern = re.compile(r"\w+|[^\w\s]")
+
+    def encode(self, text, disallowed_special=()):
+        return self._pattern.findall(text)
+
+
+@functools.lru_cache(maxsize=None)
+def encoding_for(model):
+    """Return the tiktoken encoding for a model or Azure deployment name, memoized per name."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Azure deployment names are arbitrary; fall back to the encoding used by current GPT-4o models
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        print(f"Could not load tiktoken encoding ({e}); using approximate token counts.")
+        return ApproximateEncoding()
+
+
+_counts = OrderedDict()
+_counts_lock = threading.Lock()
+COUNT_CACHE_SIZE = 4096
+
+
+def _remember(key, count):
+    with _counts_lock:
+        _counts[key] = count
+        _counts.move_to_end(key)
+        if len(_counts) > COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+
+
+def count_text(model, text):
+    """Token count of a string. Counts are cached, so repeated system prompts are only encoded once."""
+    encoding = encoding_for(model)
+    key = (encoding.name, text)
+    count = _counts.get(key)
+    if count is None:
+        count = len(encoding.encode(text, disallowed_special=()))
+        _remember(key, count)
+    return count
+
+
+def _field(message, name):
+    return message.get(name) if isinstance(message, dict) else getattr(message, name, None)
+
+
+def _content_text(content):
+    if content is None:
+        return ''
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # Content parts: only text parts carry tokens we can count locally
+        return ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def message_texts(message):
+    """Every string in a message that the model sees: role, content, name and tool-call payloads."""
+    texts = [_field(message, 'role') or '', _content_text(_field(message, 'content'))]
+    for tool_call in _field(message, 'tool_calls') or []:
+        function = _field(tool_call, 'function')
+        texts.append(_field(function, 'name') or '')
+        texts.append(_field(function, 'arguments') or '')
+    if _field(message, 'tool_call_id'):
+        texts.append(_field(message, 'tool_call_id'))
+    return texts
+
+
+def count_message(model, message):
+    tokens = TOKENS_PER_MESSAGE + sum(count_text(model, text) for text in message_texts(message) if text)
+    if _field(message, 'name'):
+        tokens += TOKENS_PER_NAME + count_text(model, _field(message, 'name'))
+    return tokens
+
+
+def count_messages(model, messages):
+    return REPLY_PRIMING + sum(count_message(model, message) for message in messages)
+
+
+@functools.lru_cache(maxsize=256)
+def _count_tools_json(model, tools_json):
+    tools = json.loads(tools_json)
+    return TOOLS_OVERHEAD + sum(TOKENS_PER_TOOL + count_text(model, json.dumps(tool.get('function', tool)))
+                                for tool in tools)
+
+
+def count_tools(model, tools):
+    """Approximate tokens added by a tools list. Cached, since function_definitions() rarely changes."""
+    if not tools:
+        return 0
+    return _count_tools_json(model, json.dumps(tools, sort_keys=True))
+
+
+def count_request(model, messages, tools=None, response_format=None):
+    """Prompt tokens for a complete chat.completions request."""
+    tokens = count_messages(model, messages) + count_tools(model, tools)
+    if isinstance(response_format, dict):
+        tokens += count_text(model, json.dumps(response_format, sort_keys=True))
+    return tokens
+
+
+def turns(messages):
+    """Group message indexes into the units that can be dropped: an assistant message with tool_calls together
+    with the tool replies that answer it, any other message on its own."""
+    units = []
+    call_ids = set()
+    for i, message in enumerate(messages):
+        if _field(message, 'role') == 'tool' and units and _field(message, 'tool_call_id') in call_ids:
+            units[-1].append(i)
+            continue
+        units.append([i])
+        call_ids = {_field(call, 'id') for call in _field(message, 'tool_calls') or []}
+    return units
+
+
+def trim_to_budget(model, messages, tools=None, max_completion_tokens=1000, context_window=CONTEXT_WINDOW, keep=()):
+    """Return a copy of `messages` that leaves room for `max_completion_tokens` in the context window.
+
+    System messages, the last message and the messages at the indexes in `keep` are kept; the oldest other
+    messages are dropped first. An assistant tool call is only ever dropped together with all of its tool
+    replies, and a final tool reply keeps the call it answers, so the conversation stays valid. Raises
+    ContextWindowExceeded when even the minimal conversation does not fit.
+    """
+    budget = context_window - max_completion_tokens - count_tools(model, tools) - REPLY_PRIMING
+    costs = [count_message(model, message) for message in messages]
+    total = sum(costs)
+
+    dropped = set()
+    units = turns(messages)
+    for unit in units[:-1]:
+        if total <= budget:
+            break
+        if _field(messages[unit[0]], 'role') == 'system' or any(i in keep for i in unit):
+            continue
+        dropped.update(unit)
+        total -= sum(costs[i] for i in unit)
+    if total > budget:
+        raise ContextWindowExceeded(
+            f'Request needs {total + context_window - budget} tokens but the context window is {context_window}')
+    return [message for i, message in enumerate(messages) if i not in dropped]
@@ -0,0 +1,139 @@
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import tracing
+from single_flight import call_key, default_group
+from tool_registry import ToolArgumentError, ToolRegistry, UnknownToolError
+from tool_results import tool_message
+
+
+class ToolCallResult:
+    """Outcome of a single tool call: its output (or error) and how long it took."""
+
+    def __init__(self, tool_call_id, name, arguments, output=None, error=None, wall_time=0.0):
+        self.tool_call_id = tool_call_id
+        self.name = name
+        self.arguments = arguments
+        self.output = output
+        self.error = error
+        self.wall_time = wall_time
+
+    def content(self):
+        if self.error:
+            return f'Error: {self.error}'
+        return self.output
+
+    def __repr__(self):
+        return (f'ToolCallResult(tool_call_id={self.tool_call_id!r}, name={self.name!r}, '
+                f'wall_time={self.wall_time:.3f}s, error={self.error!r})')
+
+
+class ToolExecutor:
+    """Run every tool call from one assistant turn concurrently on a thread pool.
+
+    `tools` maps the function name the model uses (e.g. 'getWeather') to a Python callable that accepts the
+    decoded JSON arguments as keyword arguments, or is a ToolRegistry, in which case arguments are validated
+    against the tool's schema before the call. Results always come back in the order of the tool calls.
+
+    Calls with the same name and (normalized) arguments that run at the same time, in this turn or in another
+    executor, share one execution. Pass coalesce=False for tools with side effects that must run every time.
+    """
+
+    def __init__(self, tools, max_workers=8, timeout=30.0, message_builder=tool_message, coalesce=True):
+        self.registry = tools if isinstance(tools, ToolRegistry) else None
+        self.tools = {} if self.registry else dict(tools)
+        self.timeout = timeout
+        self.message_builder = message_builder
+        self.single_flight = default_group() if coalesce else None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tool')
+
+    def _run_one(self, tool_call):
+        with tracing.span(tool_call.function.name, 'tool', tool_call_id=tool_call.id) as span:
+            result = self._execute(tool_call)
+            if span is not None and result.error:
+                span.set(tool_error=result.error)
+            return result
+
+    def _invoke(self, name, arguments, func, *args, **kwargs):
+        if self.single_flight is None:
+            return func(*args, **kwargs)
+        return self.single_flight.do(call_key(name, arguments), func, *args, **kwargs)
+
+    def _execute(self, tool_call):
+        name = tool_call.function.name
+        start = time.perf_counter()
+        if self.registry is not None:
+            return self._execute_registered(tool_call, start)
+        try:
+            arguments = json.loads(tool_call.function.arguments or '{}')
+        except json.JSONDecodeError as e:
+            return ToolCallResult(tool_call.id, name, None, error=f'Invalid arguments: {e}',
+                                  wall_time=time.perf_counter() - start)
+
+        func = self.tools.get(name)
+        if func is None:
+            return ToolCallResult(tool_call.id, name, arguments, error=f'Unknown function {name}',
+                                  wall_time=time.perf_counter() - start)
+        try:
+            output = self._invoke(name, arguments, func, **arguments)
+            return ToolCallResult(tool_call.id, name, arguments, output=output,
+                                  wall_time=time.perf_counter() - start)
+        except Exception as e:
+            return ToolCallResult(tool_call.id, name, arguments, error=str(e),
+                                  wall_time=time.perf_counter() - start)
+
+    def _execute_registered(self, tool_call, start):
+        name = tool_call.function.name
+        try:
+            arguments = self.registry.validate(name, tool_call.function.arguments)
+        except UnknownToolError:
+            return ToolCallResult(tool_call.id, name, None, error=f'Unknown function {name}',
+                                  wall_time=time.perf_counter() - start)
+        except ToolArgumentError as e:
+            return ToolCallResult(tool_call.id, name, None, error=str(e), wall_time=time.perf_counter() - start)
+        try:
+            output = self._invoke(name, arguments, self.registry.call, name, arguments)
+            return ToolCallResult(tool_call.id, name, arguments, output=output,
+                                  wall_time=time.perf_counter() - start)
+        except Exception as e:
+            return ToolCallResult(tool_call.id, name, arguments, error=str(e),
+                                  wall_time=time.perf_counter() - start)
+
+    def run(self, tool_calls, timeout=None):
+        """Execute all tool calls at once and return a list of ToolCallResult in tool_call order."""
+        timeout = self.timeout if timeout is None else timeout
+        # Copy the caller's context into each worker so tool spans nest under the current span
+        submitted = [(tool_call, time.perf_counter(),
+                      self._pool.submit(contextvars.copy_context().run, self._run_one, tool_call))
+                     for tool_call in tool_calls]
+
+        results = []
+        for tool_call, started, future in submitted:
+            # Each call gets its own budget measured from when it was submitted, so a slow call
+            # does not eat into the timeout of the calls after it.
+            remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - started))
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                future.cancel()
+                results.append(ToolCallResult(tool_call.id, tool_call.function.name, None,
+                                              error=f'Timed out after {timeout}s',
+                                              wall_time=time.perf_counter() - started))
+        return results
+
+    def run_messages(self, tool_calls, timeout=None):
+        """Execute the tool calls and return (tool messages, results) ready to append to the conversation."""
+        results = self.run(tool_calls, timeout=timeout)
+        messages = [self.message_builder(result.content(), result.tool_call_id) for result in results]
+        return messages, results
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown(wait=False)
@@ -0,0 +1,165 @@
+import inspect
+import time
+import typing
+from typing import Annotated, Literal
+
+import cassette
+
+_JSON_TYPES = {str: 'string', int: 'integer', float: 'number', bool: 'boolean', list: 'array', dict: 'object'}
+
+
+class UnknownToolError(KeyError):
+    """The model asked for a function that is not registered."""
+
+
+class ToolArgumentError(ValueError):
+    """The model's tool_call.function.arguments did not match the tool's schema."""
+
+
+def _json_schema(annotation):
+    """JSON schema for a Python type hint; `Annotated[str, 'description']` adds a description."""
+    description = None
+    if typing.get_origin(annotation) is Annotated:
+        annotation, *extras = typing.get_args(annotation)
+        description = next((extra for extra in extras if isinstance(extra, str)), None)
+
+    origin = typing.get_origin(annotation)
+    if origin is Literal:
+        values = typing.get_args(annotation)
+        schema = {'type': _JSON_TYPES.get(type(values[0]), 'string'), 'enum': list(values)}
+    elif origin in (list, tuple):
+        args = typing.get_args(annotation)
+        schema = {'type': 'array'}
+        if args:
+            schema['items'] = _json_schema(args[0])
+    elif origin is dict:
+        schema = {'type': 'object'}
+    else:
+        schema = {'type': _JSON_TYPES.get(annotation, 'string')}
+    if description:
+        schema['description'] = description
+    return schema
+
+
+class Tool:
+    """One registered function: its prebuilt schema, a compiled argument validator and the callable."""
+
+    def __init__(self, name, func, description, args=None, context=(), params_model=None):
+        self.name = name
+        self.func = func
+        self.description = description
+        self.context = tuple(context)
+        # args maps schema property names to Python parameter names, e.g. {'searchQuery': 'query'}
+        self.to_python = dict(args or {})
+
+        self._model = params_model
+        self._fields = None
+        if params_model is not None:
+            parameters = params_model.model_json_schema()
+            parameters.pop('title', None)
+            for prop in parameters.get('properties', {}).values():
+                prop.pop('title', None)
+        else:
+            parameters, self._fields = self._from_signature(func)
+        self.parameters = parameters
+        self.definition = {
+            'type': 'function',
+            'function': {'name': name, 'description': description, 'parameters': parameters}
+        }
+
+    def _from_signature(self, func):
+        from_python = {python: schema for schema, python in self.to_python.items()}
+        hints = typing.get_type_hints(func, include_extras=True)
+        properties, required, fields = {}, [], {}
+        for param in inspect.signature(func).parameters.values():
+            if param.name in self.context or param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                continue
+            schema_name = from_python.get(param.name, param.name)
+            annotation = hints.get(param.name, str)
+            properties[schema_name] = _json_schema(annotation)
+            bare = typing.get_args(annotation)[0] if typing.get_origin(annotation) is Annotated else annotation
+            if param.default is inspect.Parameter.empty:
+                required.append(schema_name)
+                fields[schema_name] = (bare, ...)
+            else:
+                fields[schema_name] = (bare, param.default)
+            self.to_python.setdefault(schema_name, param.name)
+        return {'type': 'object', 'properties': properties, 'required': required}, fields
+
+    @property
+    def model(self):
+        """The pydantic validator, compiled on first use so registering tools does not import pydantic."""
+        if self._model is None:
+            from pydantic import ConfigDict, create_model
+            self._model = create_model(f'{self.name}Arguments', __config__=ConfigDict(extra='forbid'),
+                                       **self._fields)
+        return self._model
+
+    def validate(self, arguments):
+        """Parse and check a JSON argument string (or dict); returns keyword arguments for the Python function."""
+        from pydantic import ValidationError
+        try:
+            if isinstance(arguments, (str, bytes)):
+                parsed = self.model.model_validate_json(arguments or '{}')
+            else:
+                parsed = self.model.model_validate(arguments or {})
+        except ValidationError as e:
+            raise ToolArgumentError(f'Invalid arguments for {self.name}: {e}') from e
+        return {self.to_python.get(key, key): value for key, value in parsed.model_dump().items()}
+
+
+class ToolRegistry:
+    """Tools declared once with a decorator; schemas and validators are built at registration time.
+
+    definitions() returns the same prebuilt list on every call (treat it as read-only), so no per-request
+    schema construction happens. Dispatch is a dict lookup.
+    """
+
+    def __init__(self):
+        self._tools = {}
+        self._definitions = []
+
+    def tool(self, name=None, description=None, args=None, context=(), params_model=None):
+        """Register the decorated function. `context` names parameters supplied by the caller, not the model."""
+        def decorator(func):
+            self.register(Tool(name or func.__name__, func, description or (inspect.getdoc(func) or '').strip(),
+                               args, context, params_model))
+            return func
+        return decorator
+
+    def register(self, tool):
+        self._tools[tool.name] = tool
+        self._definitions = [t.definition for t in self._tools.values()]
+        return tool
+
+    def definitions(self):
+        return self._definitions
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def __getitem__(self, name):
+        try:
+            return self._tools[name]
+        except KeyError:
+            raise UnknownToolError(name) from None
+
+    def names(self):
+        return list(self._tools)
+
+    def validate(self, name, arguments):
+        return self[name].validate(arguments)
+
+    def call(self, name, kwargs, **context):
+        start = time.perf_counter()
+        try:
+            output = self[name].func(**kwargs, **context)
+        except Exception as e:
+            cassette.record_tool(name, kwargs, error=str(e), elapsed=time.perf_counter() - start)
+            raise
+        cassette.record_tool(name, kwargs, output, elapsed=time.perf_counter() - start)
+        return output
+
+    def dispatch(self, name, arguments, **context):
+        """Validate `arguments` for tool `name` and call it; raises UnknownToolError or ToolArgumentError."""
+        return self.call(name, self[name].validate(arguments), **context)
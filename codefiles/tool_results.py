@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+
+import tracing
+from token_budget import count_text
+
+RESULT_FORMAT = os.getenv('TOOL_RESULT_FORMAT', 'auto')
+RESULT_DIGITS = int(os.getenv('TOOL_RESULT_DIGITS', 1))
+# Tokens are counted with this model's encoding; any name works, unknown ones use the default encoding
+COUNT_MODEL = os.getenv('MODEL', 'gpt-4o')
+
+# Spoonacular nutrient entries also carry percentOfDailyNeeds, which the answers never use
+NUTRIENT_FIELDS = ('name', 'amount', 'unit')
+
+
+def project(value, fields):
+    """Keep only `fields` of every dict in `value` (nested lists and tuples included), in the order given."""
+    if isinstance(value, dict):
+        return {field: value[field] for field in fields if field in value}
+    if isinstance(value, (list, tuple)):
+        return [project(item, fields) for item in value]
+    return value
+
+
+def round_numbers(value, digits=RESULT_DIGITS):
+    """Round floats to `digits` places; whole numbers lose their trailing .0."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        value = round(value, digits)
+        return int(value) if value.is_integer() else value
+    if isinstance(value, dict):
+        return {key: round_numbers(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [round_numbers(item, digits) for item in value]
+    return value
+
+
+def to_json(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def is_table(value):
+    return (isinstance(value, list) and len(value) > 1 and all(isinstance(row, dict) for row in value)
+            and all(row.keys() == value[0].keys() for row in value)
+            and all(not isinstance(cell, (dict, list)) for row in value for cell in row.values()))
+
+
+def to_table(rows):
+    """Pipe-separated table: a header line with the keys, then one line per row. Keys are written only once."""
+    lines = ['|'.join(rows[0])]
+    lines.extend('|'.join('' if cell is None else str(cell) for cell in row.values()) for row in rows)
+    return '\n'.join(lines)
+
+
+class ResultEncoder:
+    """Turn a tool's return value into the compact text sent back to the model.
+
+    Strings pass through unchanged. Other values are projected to `fields` (if given), rounded to `digits`
+    and written as a table (`format='table'`), minimal JSON (`'json'`) or whichever fits the value (`'auto'`:
+    tables for lists of uniform flat dicts, JSON otherwise); `'repr'` keeps the old str() output. Every call
+    records how many tokens it saved compared to str(value), the previous encoding.
+    """
+
+    def __init__(self, fields=None, digits=RESULT_DIGITS, format=RESULT_FORMAT, model=COUNT_MODEL):
+        self.fields = fields
+        self.digits = digits
+        self.format = format
+        self.model = model
+        self.calls = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self._lock = threading.Lock()
+
+    def encode(self, value):
+        if isinstance(value, str) or self.format == 'repr':
+            return str(value)
+        compact = value
+        if self.fields:
+            compact = project(compact, self.fields)
+        if self.digits is not None:
+            compact = round_numbers(compact, self.digits)
+        if self.format == 'table' or (self.format == 'auto' and is_table(compact)):
+            text = to_table(compact) if is_table(compact) else to_json(compact)
+        else:
+            text = to_json(compact)
+        self._record(str(value), text)
+        return text
+
+    def _record(self, before, after):
+        before_tokens, after_tokens = count_text(self.model, before), count_text(self.model, after)
+        with self._lock:
+            self.calls += 1
+            self.tokens_before += before_tokens
+            self.tokens_after += after_tokens
+        tracing.annotate(result_tokens=after_tokens, result_tokens_saved=before_tokens - after_tokens)
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - self.tokens_after
+
+    def report(self):
+        ratio = self.tokens_after / self.tokens_before if self.tokens_before else 1.0
+        return (f'Tool results: {self.calls} encoded, {self.tokens_before} -> {self.tokens_after} tokens '
+                f'({self.tokens_saved} saved, {ratio:.0%} of original)')
+
+
+default_encoder = ResultEncoder()
+
+
+def encode(value):
+    return default_encoder.encode(value)
+
+
+def tool_message(value, tool_call_id, encoder=None):
+    """The role='tool' reply to `tool_call_id`, with `value` encoded by `encoder` (default: the shared encoder)."""
+    return {'role': 'tool', 'content': (encoder or default_encoder).encode(value), 'tool_call_id': tool_call_id}
@@ -0,0 +1,311 @@
+"""Lightweight per-stage tracing for the tool-calling pipeline.
+
+Every LLM call, tool execution and HTTP request can be wrapped in a span that records its duration, token
+usage, cache hits and retries. Finished spans are aggregated in memory for Prometheus text exposition and,
+when TRACE_FILE is set, appended to a JSON-lines file. Set TRACING=false to turn spans into no-ops.
+"""
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.getenv('TRACING', 'true').lower() == 'true'
+TRACE_FILE = os.getenv('TRACE_FILE')
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current = contextvars.ContextVar('current_span', default=None)
+_ids = itertools.count(1)
+
+
+class Span:
+    __slots__ = ('name', 'kind', 'span_id', 'parent_id', 'trace_id', 'start', 'duration', 'attributes', 'error')
+
+    def __init__(self, name, kind, parent, attributes):
+        self.name = name
+        self.kind = kind
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.start = time.time()
+        self.duration = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def incr(self, name, amount=1):
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def as_dict(self):
+        return {'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id, 'name': self.name,
+                'kind': self.kind, 'start': self.start, 'duration': self.duration, 'error': self.error,
+                **self.attributes}
+
+
+class Metrics:
+    """Running aggregates per (kind, name), cheap enough to update on every span."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, span):
+        key = (span.kind, span.name)
+        attributes = span.attributes
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'count': 0, 'sum': 0.0, 'errors': 0, 'prompt_tokens': 0,
+                                              'completion_tokens': 0, 'cache_hits': 0, 'retries': 0,
+                                              'buckets': [0] * len(BUCKETS)}
+            series['count'] += 1
+            series['sum'] += span.duration
+            for index, bound in enumerate(BUCKETS):
+                if span.duration <= bound:
+                    series['buckets'][index] += 1
+                    break
+            if span.error:
+                series['errors'] += 1
+            series['prompt_tokens'] += attributes.get('prompt_tokens', 0)
+            series['completion_tokens'] += attributes.get('completion_tokens', 0)
+            series['cache_hits'] += 1 if attributes.get('cache_hit') else 0
+            series['retries'] += attributes.get('retries', 0)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(value, buckets=list(value['buckets'])) for key, value in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def prometheus_text(self):
+        lines = [
+            '# HELP pipeline_span_duration_seconds Duration of pipeline stages.',
+            '# TYPE pipeline_span_duration_seconds histogram',
+        ]
+        counters = []
+        for (kind, name), series in sorted(self.snapshot().items()):
+            labels = f'kind="{kind}",name="{_escape(name)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, series['buckets']):
+                cumulative += count
+                lines.append(f'pipeline_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'pipeline_span_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f'pipeline_span_duration_seconds_sum{{{labels}}} {series["sum"]:.6f}')
+            lines.append(f'pipeline_span_duration_seconds_count{{{labels}}} {series["count"]}')
+            counters.append((labels, series))
+
+        for metric, field, help_text in (
+                ('pipeline_prompt_tokens_total', 'prompt_tokens', 'Prompt tokens reported by response.usage.'),
+                ('pipeline_completion_tokens_total', 'completion_tokens', 'Completion tokens reported by usage.'),
+                ('pipeline_cache_hits_total', 'cache_hits', 'Spans served from a cache.'),
+                ('pipeline_retries_total', 'retries', 'Retries performed inside spans.'),
+                ('pipeline_span_errors_total', 'errors', 'Spans that raised an exception.')):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for labels, series in counters:
+                lines.append(f'{metric}{{{labels}}} {series[field]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class JsonLinesExporter:
+    """Append finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.as_dict(), default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+metrics = Metrics()
+exporters = [JsonLinesExporter(TRACE_FILE)] if TRACE_FILE else []
+
+
+def current_span():
+    return _current.get()
+
+
+def annotate(**attributes):
+    """Attach attributes to the innermost open span, if there is one."""
+    span = _current.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def incr(name, amount=1):
+    span = _current.get()
+    if span is not None:
+        span.incr(name, amount)
+
+
+@contextlib.contextmanager
+def span(name, kind='internal', **attributes):
+    """Time a block of code as a child of the current span."""
+    if not ENABLED:
+        yield None
+        return
+    parent = _current.get()
+    current = Span(name, kind, parent, attributes)
+    token = _current.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        _current.reset(token)
+        _finish(current, started)
+
+
+def _finish(current, started):
+    current.duration = time.perf_counter() - started
+    metrics.record(current)
+    for exporter in exporters:
+        exporter.export(current)
+
+
+def traced(name=None, kind='internal'):
+    """Decorator form of span()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(current, response):
+    usage = getattr(response, 'usage', None)
+    if current is not None and usage is not None:
+        current.set(prompt_tokens=usage.prompt_tokens or 0, completion_tokens=usage.completion_tokens or 0)
+
+
+class _TracedStream:
+    """Iterate a streamed completion and end its span when the stream is exhausted, fails or is closed.
+
+    Usage comes from the final chunk, which the server only sends with stream_options={'include_usage': True}.
+    """
+
+    def __init__(self, stream, current, started):
+        self._stream = stream
+        self._span = current
+        self._started = started
+        self._done = False
+
+    def _end(self, error=None):
+        if not self._done:
+            self._done = True
+            if error is not None:
+                self._span.error = f'{type(error).__name__}: {error}'
+            _finish(self._span, self._started)
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                record_usage(self._span, chunk)
+                yield chunk
+        except GeneratorExit:
+            # The consumer stopped early; the span still ends, without an error
+            self._end()
+            raise
+        except BaseException as e:
+            self._end(e)
+            raise
+        self._end()
+
+    def close(self):
+        self._end()
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _traced_stream(name, original, args, kwargs):
+    """Call `original` with stream=True under an 'llm' span that stays open until the stream ends."""
+    kwargs.setdefault('stream_options', {'include_usage': True})
+    parent = _current.get()
+    current = Span(name, 'llm', parent, {'model': kwargs.get('model'), 'stream': True})
+    started = time.perf_counter()
+    token = _current.set(current)
+    try:
+        stream = original(*args, **kwargs)
+    except BaseException as e:
+        current.error = f'{type(e).__name__}: {e}'
+        _finish(current, started)
+        raise
+    finally:
+        # The caller consumes the stream outside this call, so later spans must not nest under it
+        _current.reset(token)
+    return _TracedStream(stream, current, started)
+
+
+def instrument_client(client):
+    """Wrap chat.completions.create / beta.chat.completions.parse on a client instance with 'llm' spans.
+
+    Works on AzureOpenAI and on CachedClient; instrument the outermost wrapper so cache hits are attributed.
+    Streamed calls are timed until the stream is exhausted, with usage requested for the final chunk.
+    """
+    def wrap(completions, operation):
+        original = getattr(completions, operation)
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            if kwargs.get('stream') and ENABLED:
+                return _traced_stream(f'chat.{operation}', original, args, kwargs)
+            with span(f'chat.{operation}', 'llm', model=kwargs.get('model'), stream=bool(kwargs.get('stream'))) as s:
+                response = original(*args, **kwargs)
+                record_usage(s, response)
+                return response
+
+        setattr(completions, operation, wrapper)
+
+    wrap(client.chat.completions, 'create')
+    wrap(client.beta.chat.completions, 'parse')
+    return client
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=9464, host='0.0.0.0'):
+    """Expose prometheus_text() on http://host:port/metrics from a background thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
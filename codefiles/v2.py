@@ -1,21 +1,40 @@
-import json
-from openai import AzureOpenAI
-from dotenv import load_dotenv
-import os
+import uuid
+from types import SimpleNamespace
+from typing import Annotated
 import requests
 
-# Load environment variables
-load_dotenv()
-
-# Validate environment variables
-ENDPOINT = os.getenv("ENDPOINT")
-OPENAI_KEY = os.getenv("OPENAI_KEY")
-MODEL = os.getenv("MODEL")
-SPOONACULAR_API_KEY = os.getenv("SPOONACULAR_API_KEY")
-
-if not all([ENDPOINT, OPENAI_KEY, MODEL, SPOONACULAR_API_KEY]):
-    raise EnvironmentError(
-        "Missing one or more required environment variables (ENDPOINT, OPENAI_KEY, MODEL, SPOONACULAR_API_KEY).")
+import cassette
+import clients
+import http_session
+import spoonacular_cache
+import tool_results
+import tracing
+from single_flight import coalesce
+from agent import Agent, compact_history
+from client_pool import ClientPool
+from completion_cache import CachedClient
+from resilience import ResilientClient
+from tool_registry import ToolRegistry
+from tool_results import NUTRIENT_FIELDS, ResultEncoder
+
+REQUIRED_ENV = ('ENDPOINT', 'OPENAI_KEY', 'MODEL', 'SPOONACULAR_API_KEY')
+_config = None
+
+
+def config():
+    """Settings from the environment (and .env), loaded and validated on first use instead of at import."""
+    global _config
+    if _config is None:
+        endpoint, key, model, spoonacular_key = clients.require(*REQUIRED_ENV)
+        _config = SimpleNamespace(
+            ENDPOINT=endpoint,
+            OPENAI_KEY=key,
+            MODEL=model,
+            SPOONACULAR_API_KEY=spoonacular_key,
+            SPOONACULAR_BASE_URL=clients.setting("SPOONACULAR_BASE_URL", "https://api.spoonacular.com"),
+            STREAM_RESPONSES=clients.setting("STREAM_RESPONSES", "true").lower() == "true"
+        )
+    return _config
 
 
 def system_message(message):
@@ -26,20 +45,78 @@ def user_message(message):
     return {'role': 'user', 'content': message}
 
 
+RESULT_ENCODER = ResultEncoder(fields=NUTRIENT_FIELDS)
+
+
 def tool_message(message, tool_call_id):
-    return {'role': 'tool', 'content': str(message), 'tool_call_id': tool_call_id}
+    return tool_results.tool_message(message, tool_call_id, RESULT_ENCODER)
+
+
+def parse_recipe(data):
+    """(id, title) of the first complexSearch result, or None."""
+    if 'results' in data and data['results']:
+        return data['results'][0]['id'], data['results'][0]['title']
+    return None
+
+
+def parse_nutrients(data):
+    """The first five nutrients of a nutritionWidget response, or None."""
+    if 'nutrients' in data:
+        return data['nutrients'][:5]
+    return None
+
+
+def parse_recipe_with_nutrition(data):
+    """(id, title, first five nutrients or None) of the first addRecipeNutrition complexSearch result, or None."""
+    if 'results' in data and data['results']:
+        result = data['results'][0]
+        nutrients = result.get('nutrition', {}).get('nutrients')
+        return result['id'], result['title'], nutrients[:5] if nutrients else None
+    return None
+
+
+@coalesce('recipe')
+@spoonacular_cache.cached('recipe')
+def search_recipe(query):
+    """Query Spoonacular complexSearch; raises on HTTP errors so failures are never cached."""
+    settings = config()
+    url = (f'{settings.SPOONACULAR_BASE_URL}/recipes/complexSearch?query={query}&number=1'
+           f'&apiKey={settings.SPOONACULAR_API_KEY}')
+    response = http_session.get(url)
+    response.raise_for_status()
+    return parse_recipe(response.json())
+
+
+@coalesce('nutrition')
+@spoonacular_cache.cached('nutrition')
+def fetch_nutrition_widget(recipe_id):
+    """Query Spoonacular nutritionWidget; raises on HTTP errors so failures are never cached."""
+    settings = config()
+    url = (f'{settings.SPOONACULAR_BASE_URL}/recipes/{recipe_id}/nutritionWidget.json'
+           f'?apiKey={settings.SPOONACULAR_API_KEY}')
+    response = http_session.get(url)
+    response.raise_for_status()
+    return parse_nutrients(response.json())
+
+
+@coalesce('recipe_nutrition')
+@spoonacular_cache.cached('recipe_nutrition')
+def search_recipe_with_nutrition(query):
+    """Query complexSearch with addRecipeNutrition so the id, title and nutrients come back in one request."""
+    settings = config()
+    url = (f'{settings.SPOONACULAR_BASE_URL}/recipes/complexSearch?query={query}&number=1&addRecipeNutrition=true'
+           f'&apiKey={settings.SPOONACULAR_API_KEY}')
+    response = http_session.get(url)
+    response.raise_for_status()
+    return parse_recipe_with_nutrition(response.json())
 
 
 def get_recipe(query):
     """Fetch a single recipe using Spoonacular API based on the given query."""
     try:
-        url = f'https://api.spoonacular.com/recipes/complexSearch?query={query}&number=1&apiKey={SPOONACULAR_API_KEY}'
-        response = requests.get(url)
-        response.raise_for_status()
-
-        data = response.json()
-        if 'results' in data and data['results']:
-            return data['results'][0]['id'], data['results'][0]['title']
+        recipe = search_recipe(query)
+        if recipe:
+            return recipe
         print("No recipes found for the given query.")
     except requests.exceptions.RequestException as e:
         print(f"Error fetching recipe: {e}")
@@ -49,139 +126,149 @@ def get_recipe(query):
 def get_nutritional_details(recipe_id):
     """Fetch nutritional details for a given recipe ID from Spoonacular API."""
     try:
-        url = f'https://api.spoonacular.com/recipes/{recipe_id}/nutritionWidget.json?apiKey={SPOONACULAR_API_KEY}'
-        response = requests.get(url)
-        response.raise_for_status()
-
-        data = response.json()
-        if 'nutrients' in data:
-            return data['nutrients'][:5]
+        nutrients = fetch_nutrition_widget(recipe_id)
+        if nutrients is not None:
+            return nutrients
         print("Nutritional details not found.")
     except requests.exceptions.RequestException as e:
         print(f"Error fetching nutritional details: {e}")
     return None
 
 
+TOOLS = ToolRegistry()
+
+
 def function_definitions():
     """Define function schemas for OpenAI tool calls with clear intent differentiation."""
-    return [
-        {
-            'type': 'function',
-            'function': {
-                'name': 'findRecipe',
-                'description': 'Search for a recipe based on the user query. Use this if the user is interested in '
-                               'finding a recipe to cook.',
-                'parameters': {
-                    'type': 'object',
-                    'properties': {
-                        'searchQuery': {'type': 'string', 'description': 'Optimized search query for finding a recipe'}
-                    },
-                    'required': ['searchQuery']
-                }
-            }
-        },
-        {
-            'type': 'function',
-            'function': {
-                'name': 'getNutritionInfo',
-                'description': 'Fetch nutritional information for a specific dish. Use this if the user is asking '
-                               'about the'
-                               'nutritional content of a dish; only the dish name should be used in the query.',
-                'parameters': {
-                    'type': 'object',
-                    'properties': {
-                        'searchQuery': {'type': 'string',
-                                        'description': 'Optimized search query for finding the nutritional '
-                                                       'information of a recipe'}
-                    },
-                    'required': ['searchQuery']
-                }
-            }
-        }
-    ]
-
-
-def main():
+    return TOOLS.definitions()
+
+
+SYSTEM_PROMPT = (
+    'You are an assistant that helps with recipes and nutrition. Analyze user queries to determine if '
+    'they want:\n'
+    '1. To find a recipe (use "findRecipe")\n'
+    '2. Nutritional information (use "getNutritionInfo").\n'
+    'Convert the query into an optimized search term (less than 3 words) based on this intent. You can '
+    'only choose one intent'
+)
+
+
+def resolve_intent(client, messages, user_query, semantic_cache=None):
+    """Run the query-rewrite completion, or reuse a semantically cached tool call for a near-duplicate query.
+
+    Returns (finish_reason, assistant message) so callers can treat both paths the same way.
+    """
+    if semantic_cache is not None:
+        cached, vector = semantic_cache.lookup(user_query)
+        if cached:
+            from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+            from openai.types.chat.chat_completion_message_tool_call import Function
+
+            print(f"Semantic cache hit ({cached['similarity']:.3f}) for: {cached['query']}")
+            tool_call = ChatCompletionMessageToolCall(
+                id=f'call_cached_{uuid.uuid4().hex[:24]}',
+                type='function',
+                function=Function(name=cached['name'], arguments=cached['arguments'])
+            )
+            return 'tool_calls', ChatCompletionMessage(role='assistant', content=None, tool_calls=[tool_call])
+
+    response = client.chat.completions.create(
+        model=config().MODEL,
+        messages=messages,
+        tools=function_definitions()
+    )
+    choice = response.choices[0]
+    if semantic_cache is not None and choice.finish_reason == 'tool_calls':
+        tool_call = choice.message.tool_calls[0]
+        semantic_cache.add(user_query, tool_call.function.name, tool_call.function.arguments, vector)
+    return choice.finish_reason, choice.message
+
+
+def answer_query(client, user_query, stream=False, semantic_cache=None, agent=None):
+    """Run one query through intent -> Spoonacular -> final answer and return the answer text.
+
+    Pass the same `agent` to several calls to hold a multi-turn session; its history is compacted every round.
+    """
+    model = config().MODEL
+    agent = agent or Agent(client, model, TOOLS, SYSTEM_PROMPT, stream=stream, message_builder=tool_message)
+    messages = compact_history(model, agent.messages + [user_message(user_query)], function_definitions(),
+                               agent.budget)
+
+    finish_reason, assistant = resolve_intent(client, messages, user_query, semantic_cache)
+    if finish_reason != 'tool_calls':
+        print("No tool calls found.")
+        print(finish_reason)
+        return None
+
+    for tool_call in assistant.tool_calls:
+        print('Function to call:', tool_call.function.name, tool_call.function.arguments)
+    answer = agent.ask(user_query, first_message=assistant)
+    if not stream:
+        print(answer)
+    print('Prompt tokens per round:', agent.prompt_tokens)
+    return answer
+
+
+def main(stream=None):
     try:
-        client = AzureOpenAI(
-            azure_endpoint=ENDPOINT,
-            api_key=OPENAI_KEY,
-            api_version='2024-08-01-preview'
-        )
-
-        messages = [
-            system_message(
-                'You are an assistant that helps with recipes and nutrition. Analyze user queries to determine if '
-                'they want:\n'
-                '1. To find a recipe (use "findRecipe")\n'
-                '2. Nutritional information (use "getNutritionInfo").\n'
-                'Convert the query into an optimized search term (less than 3 words) based on this intent. You can '
-                'only choose one intent'
-            ),
-        ]
+        if stream is None:
+            stream = config().STREAM_RESPONSES
+        # AZURE_DEPLOYMENTS spreads requests over several deployments; otherwise the pool holds just ENDPOINT/MODEL
+        client = tracing.instrument_client(CachedClient(ResilientClient(ClientPool.from_env())))
+        semantic_cache = None
+        if clients.setting('EMBEDDING_MODEL'):
+            # numpy is only needed for the semantic cache, so it is imported only when one is configured
+            from semantic_cache import SemanticCache
+            semantic_cache = SemanticCache(client, path='.semantic_cache_v2')
 
         user_query = 'Nutrition of Mutton curry'
-        messages.append(user_message(user_query))
-
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            tools=function_definitions()
-        )
-
-        messages.append(response.choices[0].message)
-
-        if response.choices[0].finish_reason == 'tool_calls':
-            tool_call = response.choices[0].message.tool_calls[0]
-            function_name = tool_call.function.name
-            print('Function to call:', function_name)
-
-            query = json.loads(tool_call.function.arguments).get('searchQuery')
-            if not query:
-                print("No query generated.")
-                return
-
-            print('Optimized query:', query)
-
-            # Dictionary to map function names to method names
-            action_map = {
-                'findRecipe': handle_recipe,
-                'getNutritionInfo': handle_nutrition
-            }
-
-            # Use the dictionary to call the correct method
-            if function_name in action_map:
-                tool_call_id = tool_call.id
-                tools_result = action_map[function_name](query)
-                messages.append(tool_message(tools_result, tool_call_id))
-
-                print(messages)
-                final_response = client.chat.completions.create(
-                    model=MODEL,
-                    messages=messages,
-                    tools=function_definitions()
-                )
-                print(final_response.choices[0].message.content)
-            else:
-                print("Unknown function called.")
-
-        else:
-            print("No tool calls found.")
-            print(response.choices[0].finish_reason)
+        with cassette.session('v2-stream' if stream else 'v2', user_query), \
+                tracing.span('answer_query', query=user_query):
+            answer_query(client, user_query, stream, semantic_cache)
+        print(RESULT_ENCODER.report())
+        print(tracing.metrics.prometheus_text())
     except Exception as e:
         print(f"An error occurred: {e}")
 
 
-def handle_recipe(query):
+@TOOLS.tool('findRecipe', 'Search for a recipe based on the user query. Use this if the user is interested in '
+                         'finding a recipe to cook.', args={'searchQuery': 'query'})
+def handle_recipe(query: Annotated[str, 'Optimized search query for finding a recipe']):
     recipe = get_recipe(query)
     return recipe[1] if recipe else "No recipe found."
 
 
-def handle_nutrition(query):
-    recipe = get_recipe(query)
+def get_recipe_with_nutrition(query):
+    """Fetch (recipe_id, title, nutrients) in a single Spoonacular round trip when possible.
+
+    Falls back to the two-step get_recipe + get_nutritional_details path if the combined search fails or the
+    result carries no nutrition block.
+    """
+    try:
+        recipe = search_recipe_with_nutrition(query)
+        if recipe is None:
+            print("No recipes found for the given query.")
+            return None
+        if recipe[2]:
+            return recipe
+        recipe_id, title = recipe[0], recipe[1]
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching recipe with nutrition, falling back: {e}")
+        recipe = get_recipe(query)
+        if not recipe:
+            return None
+        recipe_id, title = recipe
+    return recipe_id, title, get_nutritional_details(recipe_id)
+
+
+@TOOLS.tool('getNutritionInfo', 'Fetch nutritional information for a specific dish. Use this if the user is '
+                               'asking about the nutritional content of a dish; only the dish name should be used '
+                               'in the query.', args={'searchQuery': 'query'})
+def handle_nutrition(query: Annotated[str, 'Optimized search query for finding the nutritional information of a '
+                                           'recipe']):
+    recipe = get_recipe_with_nutrition(query)
     if recipe:
-        recipe_id = recipe[0]
-        nutritional_details = get_nutritional_details(recipe_id)
+        nutritional_details = recipe[2]
         return nutritional_details if nutritional_details else "No nutritional details found."
     else:
         print("No recipe found for nutritional details.")
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+import cassette
+import clients
+import spoonacular_cache
+from single_flight import coalesce
+from v2 import (SYSTEM_PROMPT, TOOLS, config, function_definitions, parse_nutrients, parse_recipe,
+                parse_recipe_with_nutrition, system_message, tool_message, user_message)
+from tool_registry import ToolArgumentError, UnknownToolError
+
+
+@coalesce('recipe', key=lambda http, query: query)
+@spoonacular_cache.cached('recipe', key=lambda http, query: query)
+async def search_recipe(http, query):
+    """Async version of v2.search_recipe; shares its cache entries and raises on HTTP errors."""
+    settings = config()
+    response = await http.get(f'{settings.SPOONACULAR_BASE_URL}/recipes/complexSearch',
+                              params={'query': query, 'number': 1, 'apiKey': settings.SPOONACULAR_API_KEY})
+    response.raise_for_status()
+    return parse_recipe(response.json())
+
+
+@coalesce('nutrition', key=lambda http, recipe_id: recipe_id)
+@spoonacular_cache.cached('nutrition', key=lambda http, recipe_id: recipe_id)
+async def fetch_nutrition_widget(http, recipe_id):
+    """Async version of v2.fetch_nutrition_widget; shares its cache entries and raises on HTTP errors."""
+    settings = config()
+    response = await http.get(f'{settings.SPOONACULAR_BASE_URL}/recipes/{recipe_id}/nutritionWidget.json',
+                              params={'apiKey': settings.SPOONACULAR_API_KEY})
+    response.raise_for_status()
+    return parse_nutrients(response.json())
+
+
+@coalesce('recipe_nutrition', key=lambda http, query: query)
+@spoonacular_cache.cached('recipe_nutrition', key=lambda http, query: query)
+async def search_recipe_with_nutrition(http, query):
+    """Async version of v2.search_recipe_with_nutrition; shares its cache entries and raises on HTTP errors."""
+    settings = config()
+    response = await http.get(f'{settings.SPOONACULAR_BASE_URL}/recipes/complexSearch',
+                              params={'query': query, 'number': 1, 'addRecipeNutrition': 'true',
+                                      'apiKey': settings.SPOONACULAR_API_KEY})
+    response.raise_for_status()
+    return parse_recipe_with_nutrition(response.json())
+
+
+async def get_recipe(http, query):
+    """Async version of v2.get_recipe."""
+    try:
+        return await search_recipe(http, query)
+    except httpx.HTTPError as e:
+        print(f"Error fetching recipe: {e}", file=sys.stderr)
+    return None
+
+
+async def get_nutritional_details(http, recipe_id):
+    """Async version of v2.get_nutritional_details."""
+    try:
+        return await fetch_nutrition_widget(http, recipe_id)
+    except httpx.HTTPError as e:
+        print(f"Error fetching nutritional details: {e}", file=sys.stderr)
+    return None
+
+
+async def handle_recipe(http, query):
+    recipe = await get_recipe(http, query)
+    return recipe[1] if recipe else "No recipe found."
+
+
+async def get_recipe_with_nutrition(http, query):
+    """Async version of v2.get_recipe_with_nutrition: one complexSearch round trip with addRecipeNutrition."""
+    try:
+        recipe = await search_recipe_with_nutrition(http, query)
+        if recipe is None:
+            return None
+        if recipe[2]:
+            return recipe
+        recipe_id, title = recipe[0], recipe[1]
+    except httpx.HTTPError as e:
+        print(f"Error fetching recipe with nutrition, falling back: {e}", file=sys.stderr)
+        recipe = await get_recipe(http, query)
+        if not recipe:
+            return None
+        recipe_id, title = recipe
+    return recipe_id, title, await get_nutritional_details(http, recipe_id)
+
+
+async def handle_nutrition(http, query):
+    recipe = await get_recipe_with_nutrition(http, query)
+    if recipe:
+        return recipe[2] if recipe[2] else "No nutritional details found."
+    return "No recipe found."
+
+
+ACTION_MAP = {
+    'findRecipe': handle_recipe,
+    'getNutritionInfo': handle_nutrition
+}
+
+
+async def process_query(client, http, user_query):
+    """Run the intent -> Spoonacular -> final answer pipeline of v2.main for one query and return a result dict."""
+    start = time.perf_counter()
+    model = config().MODEL
+    result = {'query': user_query}
+    messages = [system_message(SYSTEM_PROMPT), user_message(user_query)]
+
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        tools=function_definitions()
+    )
+    choice = response.choices[0]
+    if choice.finish_reason != 'tool_calls':
+        result.update(error='No tool calls found.', finish_reason=choice.finish_reason)
+        return result
+
+    tool_call = choice.message.tool_calls[0]
+    function_name = tool_call.function.name
+    result['function'] = function_name
+    # Validate against the same registry v2 builds its schemas from; the async handlers live in ACTION_MAP
+    try:
+        query = TOOLS.validate(function_name, tool_call.function.arguments)['query']
+    except UnknownToolError:
+        result['error'] = 'Unknown function called.'
+        return result
+    except ToolArgumentError as e:
+        result['error'] = f'No query generated. {e}'
+        return result
+    result['search_query'] = query
+    if not query:
+        result['error'] = 'No query generated.'
+        return result
+
+    started = time.perf_counter()
+    try:
+        tools_result = await ACTION_MAP[function_name](http, query)
+    except Exception as e:
+        cassette.record_tool(function_name, {'query': query}, error=str(e), elapsed=time.perf_counter() - started)
+        raise
+    cassette.record_tool(function_name, {'query': query}, tools_result, elapsed=time.perf_counter() - started)
+    messages.append(choice.message)
+    messages.append(tool_message(tools_result, tool_call.id))
+
+    final_response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        tools=function_definitions()
+    )
+    result['answer'] = final_response.choices[0].message.content
+    result['elapsed'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def read_queries(stream):
+    """Yield (index, query, error) for non-empty lines of a file object without blocking the event loop.
+
+    A JSONL line that cannot be parsed or whose "query" is not a non-empty string is yielded with the raw line and
+    an error message instead of the query, so one bad line does not abort the batch.
+    """
+    loop = asyncio.get_running_loop()
+    index = 0
+    while True:
+        line = await loop.run_in_executor(None, stream.readline)
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        error = None
+        # Accept either plain text lines or JSONL objects with a "query" field
+        if line.startswith('{'):
+            try:
+                query = json.loads(line)['query']
+            except (ValueError, KeyError, TypeError) as e:
+                error = f'Malformed input line: {e!r}'
+            else:
+                if isinstance(query, str) and query.strip():
+                    line = query.strip()
+                else:
+                    error = 'Malformed input line: "query" must be a non-empty string'
+        yield index, line, error
+        index += 1
+
+
+async def run_batch(source, sink, concurrency=16):
+    """Stream queries from `source`, process at most `concurrency` at a time and write JSONL to `sink` as each finishes."""
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+    counts = {'ok': 0, 'error': 0}
+    start = time.perf_counter()
+
+    settings = config()
+    client = clients.new_async_client(settings.ENDPOINT, settings.OPENAI_KEY, max_connections=concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # Wrapped like the OpenAI client's transport, so Spoonacular exchanges are recorded and replayed too
+    transport = cassette.wrap_transport(httpx.AsyncHTTPTransport(limits=limits))
+    async with httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(10.0, connect=3.0)) as http:
+
+        async def worker(index, user_query):
+            try:
+                with cassette.session('v2-batch', user_query):
+                    result = await process_query(client, http, user_query)
+            except Exception as e:
+                result = {'query': user_query, 'error': f'An error occurred: {e}'}
+            finally:
+                semaphore.release()
+            write(index, result)
+
+        def write(index, result):
+            result['index'] = index
+            counts['error' if 'error' in result else 'ok'] += 1
+            sink.write(json.dumps(result) + '\n')
+            sink.flush()
+
+        async for index, user_query, error in read_queries(source):
+            if error:
+                write(index, {'query': user_query, 'error': error})
+                continue
+            # Acquire before scheduling so we never hold more than `concurrency` queries in memory
+            await semaphore.acquire()
+            task = asyncio.create_task(worker(index, user_query))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    await client.close()
+    elapsed = time.perf_counter() - start
+    total = counts['ok'] + counts['error']
+    print(f"Processed {total} queries ({counts['error']} errors) in {elapsed:.2f}s "
+          f"({total / elapsed if elapsed else 0:.2f} queries/s)", file=sys.stderr)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run many recipe/nutrition queries through the v2 pipeline.')
+    parser.add_argument('input', nargs='?', default='-', help='File with one query per line (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='JSONL output file (default: stdout)')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='Maximum queries in flight')
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    sink = sys.stdout if args.output == '-' else open(args.output, 'a', encoding='utf-8')
+    try:
+        asyncio.run(run_batch(source, sink, args.concurrency))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+
+if __name__ == "__main__":
+    main()